@@ -0,0 +1,116 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import config
+from google_calendar_mgr import GCal
+
+"""
+asyncio front end for GCal.
+
+The Google client library is synchronous, so every call is run on a worker thread (each thread has its own Sheets
+service, see SheetsSession).  Reads of several days can then be in flight at the same time instead of one after the other.
+
+* At most max_concurrency requests are in flight (semaphore).  An asyncio.Semaphore belongs to the event loop it is
+  used in, so a new one is made when the AsyncGCal is used from another loop (eg: a second asyncio.run)
+* The quota is looked after by the process-wide RateLimiter that every GCal request goes through (see rate_limiter.py),
+  so worker threads simply wait there when the quota is used up
+
+Usage:
+    async with AsyncGCal(gcal) as async_gcal:
+        days = await async_gcal.get_days_from_calendar(dates)
+"""
+class AsyncGCal:
+
+    def __init__(self, gcal: GCal, max_concurrency=config.SHEETS_MAX_CONCURRENCY):
+        self.gcal = gcal
+        self.max_concurrency = max_concurrency
+        self.executor = None    # Created on first use, shut down by close()
+        self.loop = None
+        self.semaphore = None   # Created in the running event loop
+        self.requests_sent = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exception_type, exception_value, exception_traceback):
+        self.close()
+        return False
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+
+    async def run(self, method, *args):
+        """
+        Run a (blocking) GCal method on a worker thread, once there is a free slot
+        """
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            self.loop = loop
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='gcal')
+
+        async with self.semaphore:
+            self.requests_sent += 1
+            return await loop.run_in_executor(self.executor, partial(method, *args))
+
+
+    async def get_data_from_calendar(self, location):
+        return await self.run(self.gcal.get_data_from_calendar, location)
+
+    async def get_day_from_calendar(self, target_date):
+        return await self.run(self.gcal.get_day_from_calendar, target_date)
+
+    async def get_day_from_master(self, target_date):
+        return await self.run(self.gcal.get_day_from_master, target_date)
+
+    async def update_values(self, range_name, value_input_option, _values):
+        return await self.run(self.gcal.update_values, range_name, value_input_option, _values)
+
+    async def get_contacts(self):
+        return await self.run(self.gcal.get_contacts)
+
+    async def read_territory_map(self):
+        return await self.run(self.gcal.read_territory_map)
+
+
+    async def get_days_from_calendar(self, dates):
+        """
+        Read several days at once.
+        ## Returns
+        list of day rows, in the same order as dates
+        """
+        return await asyncio.gather(*[self.get_day_from_calendar(target_date) for target_date in dates])
+
+
+if __name__ == '__main__':
+    # Runs against fake_sheets_server (no Google account needed):  python async_google_calendar_mgr.py
+    from datetime import datetime
+    import time
+    from google.auth.credentials import AnonymousCredentials
+    from google_calendar_mgr import set_sheets_endpoint
+    from fake_sheets_server import start_fake_sheets_server
+    from spreadsheet_info import BETA_COLLAB_CALENDAR_SPREADSHEET_ID
+
+    server = start_fake_sheets_server(latency=0.2)
+    set_sheets_endpoint(BETA_COLLAB_CALENDAR_SPREADSHEET_ID, f'http://127.0.0.1:{server.server_port}', AnonymousCredentials())
+
+    gcal = GCal(BETA_COLLAB_CALENDAR_SPREADSHEET_ID)
+    gcal.set_calendar_tab('May 2024')
+    dates = [datetime(2024, 5, day) for day in range(1, 8)]
+
+    start = time.perf_counter()
+    serial = [gcal.get_day_from_calendar(target_date) for target_date in dates]
+    print(f'Serial: {len(dates)} days in {time.perf_counter() - start:.3f}s')
+
+    async def read_week():
+        async with AsyncGCal(gcal) as async_gcal:
+            return await async_gcal.get_days_from_calendar(dates)
+
+    start = time.perf_counter()
+    concurrent = asyncio.run(read_week())
+    print(f'Async: {len(dates)} days in {time.perf_counter() - start:.3f}s  Same result: {serial == concurrent}')
+    server.shutdown()
@@ -0,0 +1,117 @@
+import json
+import os
+from googleapiclient.errors import HttpError
+import config
+
+"""
+Buffered audit log.
+
+Audit rows are held until flush() (or until max_batch_size rows are waiting) and then appended to the Audit tab with a
+single values().append.  Rows that were sent are also written to a local JSONL file in the config dir, so the audit
+can be searched without going to Google (see query).
+
+Audit tab columns:
+Change Date,	Month,	Day,	Squad,	Action,	Slot,	Delta, Requested By, Reason
+"""
+
+AUDIT_COLUMNS = ['change_date', 'month', 'day', 'squad', 'action', 'slot', 'delta', 'requested_by', 'reason']
+
+
+class AuditLog:
+
+    def __init__(self, gcal, config_dir=None, max_batch_size=config.AUDIT_BATCH_SIZE, log_file=config.AUDIT_LOG_FILE):
+        self.gcal = gcal
+        self.max_batch_size = max_batch_size
+        self.log_path = f'{config_dir}/{log_file}' if config_dir is not None and log_file is not None else None
+        self.pending = []
+        self.rows_sent = 0
+        self.requests_sent = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, exception_traceback):
+        self.flush()
+        return False
+
+
+    def append(self, rows):
+        """
+        Hold audit rows (list of lists, in the Audit tab column order) until the next flush
+        """
+        self.pending.extend(rows)
+        if len(self.pending) >= self.max_batch_size:
+            self.flush()
+
+
+    def flush(self):
+        """
+        Append everything that is pending to the Audit tab.  If Google refuses, the rows stay pending for the next flush
+        """
+        if len(self.pending) == 0:
+            return None
+
+        rows = self.pending
+        self.requests_sent += 1
+        result = self.gcal.append_to_audit_rows(rows)
+        if isinstance(result, HttpError):
+            return result
+
+        self.pending = []
+        self.rows_sent += len(rows)
+        self.mirror(rows)
+        return result
+
+
+    def mirror(self, rows):
+        if self.log_path is None:
+            return
+
+        if not os.path.exists(os.path.dirname(self.log_path)):
+            os.makedirs(os.path.dirname(self.log_path))
+
+        with open(self.log_path, 'a') as writer:
+            for row in rows:
+                writer.write(json.dumps(dict(zip(AUDIT_COLUMNS, row))) + '\n')
+
+
+    def query(self, squad=None, month=None, day=None, action=None, since=None):
+        """Search the local copy of the audit log
+
+        ## Parameters
+        * squad, month, day, action: only records with that value
+        * since (str): only records changed on or after (eg: '2024-05-01')
+
+        ## Returns
+        list of records (dict keyed by AUDIT_COLUMNS), oldest first
+        """
+        if self.log_path is None or not os.path.exists(self.log_path):
+            return []
+
+        records = []
+        with open(self.log_path, 'r') as reader:
+            for line in reader:
+                if len(line.strip()) == 0:
+                    continue
+                record = json.loads(line)
+                if squad is not None and str(record['squad']) != str(squad):
+                    continue
+                if month is not None and record['month'] != month:
+                    continue
+                if day is not None and record['day'] != day:
+                    continue
+                if action is not None and record['action'] != action:
+                    continue
+                if since is not None and record['change_date'] < since:
+                    continue
+                records.append(record)
+        return records
+
+
+if __name__ == '__main__':
+    import sys
+    # Search the local audit log:  python audit_log.py <config_dir> [squad]
+    audit_log = AuditLog(None, sys.argv[1])
+    for record in audit_log.query(squad=sys.argv[2] if len(sys.argv) > 2 else None):
+        print(f"{record['change_date']} {record['month']}/{record['day']} {record['squad']} {record['action']} "
+              f"{record['slot']} ({record['delta']}) {record['requested_by']} {record['reason']}")
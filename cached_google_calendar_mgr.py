@@ -0,0 +1,267 @@
+import hashlib
+import json
+import threading
+import time
+from googleapiclient.errors import HttpError
+from calendar_cache import CalendarCache
+from calendar_utils import pad_month, parse_location
+import config
+from google_calendar_mgr import GCal
+from reference_data import ReferenceData, read_reference_values, to_reference_data
+from warm_cache import get_warm_cache
+
+"""
+Read-through cache in front of GCal.
+
+GCal reads one day at a time (one values().get per day).  CachedGCal reads the whole month block (B6:AC65) of a tab once,
+keeps it in a CalendarCache and serves get_day_from_calendar / get_day_from_master from memory.
+
+Writes still go straight to Google, and are applied to the cached month as well so that a read after a write
+does not cost another round trip.  If a write can't be applied to the cached month (eg: it falls outside of the month block)
+the tab is dropped from the cache and will be read again on the next request.  Cached months also expire after ttl seconds.
+
+With a config_dir, months and reference data are also kept on disk between runs (see warm_cache.py): a month that is
+not in memory is taken from there when the spreadsheet has not changed since it was saved.
+"""
+
+MONTH_BLOCK = parse_location(config.CALENDAR_MONTH_BOUNDARIES)   # (None, first row, first col, last row, last col)
+
+class CachedGCal(GCal):
+
+    MASTER_TAB = 'Master'
+
+    def __init__(self, spreadsheet_id, config_dir=None, ttl=config.CALENDAR_CACHE_TTL):
+        super().__init__(spreadsheet_id, config_dir)
+        self.ttl = ttl
+        self.month_caches = {}  # key = tab name, value = (CalendarCache, time read)
+        self.month_loads = {}   # key = tab name, value = times the month was loaded (see get_month_load)
+        self.api_reads = 0
+        self.cache_hits = 0
+        # AsyncGCal reads days from worker threads.  Only one of them should read a month that is not cached
+        self.lock = threading.RLock()
+        self.warm_cache = get_warm_cache(config_dir, spreadsheet_id)
+        self.refreshed_revision = None
+
+
+    def get_warm_cache(self):
+        """
+        The on-disk cache, once checked against the revision of the spreadsheet.  None if it can't be used
+        """
+        if self.warm_cache is None or not self.warm_cache.validate(self.get_revision):
+            return None
+        return self.warm_cache
+
+
+    def get_month_cache(self, tab) -> CalendarCache:
+        """
+        Return the CalendarCache for the tab, reading the whole month from Google if it is not cached (or has expired)
+        """
+        tab = str(tab)
+        with self.lock:
+            calendar_cache = self.find_month_cache(tab)
+            if calendar_cache is not None:
+                return calendar_cache
+
+            self.api_reads += 1
+            month_rows = super().get_data_from_calendar(f'{tab}!{config.CALENDAR_MONTH_BOUNDARIES}')
+            if month_rows is None:
+                # Read failed (it was already reported by get_data_from_calendar).  Don't cache the failure
+                return None
+            return self.cache_month(tab, month_rows)
+
+
+    def get_months(self, tabs):
+        """
+        Same as GCal.get_months.  Cached months are served from memory, the others are read together (one request)
+        """
+        tabs = [str(tab) for tab in tabs]
+        with self.lock:
+            calendar_caches = {tab: self.find_month_cache(tab) for tab in tabs}
+            missing = [tab for tab in tabs if calendar_caches[tab] is None]
+            if len(missing) > 0:
+                self.api_reads += 1
+                values = self.batch_get_values([f'{tab}!{config.CALENDAR_MONTH_BOUNDARIES}' for tab in missing])
+                if values is None:
+                    return None
+                for tab, month_rows in zip(missing, values):
+                    calendar_caches[tab] = self.cache_month(tab, month_rows)
+
+            return {tab: calendar_cache.get_month() for tab, calendar_cache in calendar_caches.items()}
+
+
+    def find_month_cache(self, tab) -> CalendarCache:
+        """
+        The CalendarCache for the tab if it is in memory (and has not expired) or in the warm cache.  Otherwise None
+        The warm cache is only used for the first read of the month: once it has expired, it is read from Google again
+        (the disk copy is only as fresh as the revision checked at the start of the run)
+        """
+        entry = self.month_caches.get(tab)
+        if entry is not None:
+            if self.ttl is None or time.monotonic() - entry[1] < self.ttl:
+                self.cache_hits += 1
+                return entry[0]
+            return None
+
+        warm_cache = self.get_warm_cache()
+        month_rows = warm_cache.get_month(tab) if warm_cache is not None else None
+        if month_rows is None:
+            return None
+        return self.cache_month(tab, month_rows, is_read=False)
+
+
+    def cache_month(self, tab, month_rows, is_read=True) -> CalendarCache:
+        """
+        Keep the month rows (as read from Google) in memory, and in the warm cache if they were just read
+        """
+        warm_cache = self.get_warm_cache()
+        if is_read and warm_cache is not None:
+            warm_cache.put_month(tab, month_rows)
+
+        calendar_cache = CalendarCache(tab, pad_month(month_rows))
+        self.month_caches[tab] = (calendar_cache, time.monotonic())
+        self.month_loads[tab] = self.month_loads.get(tab, 0) + 1
+        return calendar_cache
+
+
+    def get_month_load(self, tab):
+        """
+        How many times the month was loaded (from Google or the warm cache).  It changes each time the cached month is
+        replaced by what is in the sheet, eg: to tell that totals kept since the last load may be behind the sheet
+        """
+        return self.month_loads.get(str(tab), 0)
+
+
+    def get_month_key(self, tab, read=True):
+        """
+        Hash of the month block (cells as text), eg: to tell whether totals saved by an earlier run were tallied from
+        the month as it is now.  None if the month can't be read (or is not in memory and read is False)
+        """
+        tab = str(tab)
+        with self.lock:
+            if read:
+                calendar_cache = self.get_month_cache(tab)
+            else:
+                entry = self.month_caches.get(tab)
+                calendar_cache = entry[0] if entry is not None else None
+            if calendar_cache is None:
+                return None
+            month_text = [[str(cell) for cell in row] for row in calendar_cache.month_cache]
+            return hashlib.sha1(json.dumps(month_text).encode('utf-8')).hexdigest()
+
+
+    def get_reference_data(self, include_template=True) -> ReferenceData:
+        """
+        Same as reference_data.load_reference_data, served from the warm cache when the spreadsheet has not changed
+        """
+        warm_cache = self.get_warm_cache()
+        reference = warm_cache.get_reference() if warm_cache is not None else None
+        if reference is not None and (reference['include_template'] or not include_template):
+            return to_reference_data(reference['values'], reference['tabs'], include_template)
+
+        values, tabs = read_reference_values(self, include_template)
+        if values is None:
+            return None
+        if warm_cache is not None:
+            warm_cache.put_reference({'values': values, 'tabs': tabs, 'include_template': include_template})
+        return to_reference_data(values, tabs, include_template)
+
+
+    def invalidate(self, tab=None):
+        """
+        Drop the cached month for tab.  If tab is None, drop all cached months
+        """
+        if tab is None:
+            self.month_caches.clear()
+        else:
+            self.month_caches.pop(str(tab), None)
+        if self.warm_cache is not None:
+            self.warm_cache.drop_month(None if tab is None else str(tab))
+
+
+    def refresh(self, revision):
+        """
+        For a long running process (crew_notifier --daemon), before each pass: if the spreadsheet changed since the last
+        pass (or the revision can't be read), drop the cached months so they are read again
+        ## Returns
+        True if the cache was dropped
+        """
+        with self.lock:
+            if revision is not None and revision == self.refreshed_revision:
+                return False
+            self.refreshed_revision = revision
+            self.month_caches.clear()
+            if self.warm_cache is not None:
+                self.warm_cache.revalidate(revision)
+            return True
+
+
+    def get_day_from_calendar(self, target_date):
+        calendar_cache = self.get_month_cache(self.calendar_tab)
+        if calendar_cache is None:
+            return super().get_day_from_calendar(target_date)
+        return calendar_cache.get_date(target_date)
+
+
+    def get_day_from_master(self, target_date):
+        calendar_cache = self.get_month_cache(self.MASTER_TAB)
+        if calendar_cache is None:
+            return super().get_day_from_master(target_date)
+        return calendar_cache.get_date(self.get_master_date(target_date))
+
+
+    def update_values(self, range_name, value_input_option, _values):
+        result = super().update_values(range_name, value_input_option, _values)
+        if isinstance(result, HttpError):
+            # The write may or may not have landed.  Read the tab again next time
+            parsed = parse_location(range_name)
+            self.invalidate(parsed[0] if parsed is not None else None)
+        else:
+            self.write_through(range_name, _values)
+        return result
+
+
+    def batch_update_values(self, data, value_input_option):
+        result = super().batch_update_values(data, value_input_option)
+        for range_name, _values in data:
+            if isinstance(result, HttpError):
+                parsed = parse_location(range_name)
+                self.invalidate(parsed[0] if parsed is not None else None)
+            else:
+                self.write_through(range_name, _values)
+        return result
+
+
+    def write_through(self, location, values):
+        """
+        Apply values written to Google to the cached month.  Discard the cached month if that is not possible
+        """
+        parsed = parse_location(location)
+        if parsed is None or parsed[0] is None:
+            # Can't tell which tab was written, so nothing cached can be trusted
+            self.invalidate()
+            return
+
+        # Rows above or below the month block (eg: the tally rows) are not cached
+        _tab, start_row, _start_col, end_row, _end_col = parsed
+        if end_row < MONTH_BLOCK[1] or start_row > MONTH_BLOCK[3]:
+            return
+
+        # The copy on disk is now behind: it is read again (and saved) the next time the month is not in memory
+        if self.warm_cache is not None:
+            self.warm_cache.drop_month(parsed[0])
+
+        entry = self.month_caches.get(parsed[0])
+        if entry is not None and not entry[0].update_range(location, values):
+            self.invalidate(parsed[0])
+
+
+if __name__ == '__main__':
+    from datetime import datetime
+    from spreadsheet_info import BETA_COLLAB_CALENDAR_SPREADSHEET_ID
+
+    gcal = CachedGCal(BETA_COLLAB_CALENDAR_SPREADSHEET_ID)
+    gcal.set_calendar_tab('May 2024')
+    start = time.perf_counter()
+    for day in range(1, 32):
+        gcal.get_day_from_calendar(datetime(2024, 5, day))
+    print(f'Read 31 days with {gcal.api_reads} API call(s) in {time.perf_counter() - start:.3f}s')
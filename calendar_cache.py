@@ -1,7 +1,7 @@
 from ast import literal_eval
-import re
-from calendar_utils import get_calendar_coordinates
+from calendar_utils import index_to_column, parse_location
 import config
+from month_layout import get_layout, location_to_offsets
 from utils.general_utils import get_matrix_from_calendar, mat2dslice, print_matrix, slice2dmat
 
 """
@@ -21,24 +21,9 @@ class CalendarCache:
     def __init__(self, tab_name, month_cache):
         self.month_cache = month_cache
         self.tab_name = tab_name
-
-
-    def __spreadsheet_to_cache(self, spreadsheet):
-        """
-        Spreadsheet coordinates to matrix coordinates.
-        Example: 
-        Spreadsheet coordinates: 'June 2024!J16:M25' or 'June 2024!Z26:AC35'
-        Returns: (start_row, start_col, end_row, end_col)
-
-        Example:
-        'June 2024!Z26:AC35' -> (26, 26, 35, 29)
-        """
-        # print('>> ' + spreadsheet)
-        start_row = int(spreadsheet.split('!')[1].split(':')[0][1:]) - config.CALENDAR_OFFSET
-        start_col = ord(spreadsheet.split('!')[1].split(':')[0][0]) - ord('A') - 1
-        end_row = int(spreadsheet.split('!')[1].split(':')[1][1:])
-        end_col = ord(spreadsheet.split('!')[1].split(':')[1][0]) - ord('A')
-        return start_row, start_col, end_row, end_col
+        # Copy of the month as it was read, and the rectangles changed since (key = (row, col), value = [rows, cols])
+        self.original = [list(row) for row in month_cache]
+        self.dirty = {}
 
 
     def get_month(self):
@@ -60,10 +45,19 @@ class CalendarCache:
             
 
     def get_day(self, calendar_coordinates):
-        # print(f'Getting day for coordinates: {calendar_coordinates}')
-        start_row, start_col, end_row, end_col = self.__spreadsheet_to_cache(calendar_coordinates)
-        # print(f'For coordinates: {calendar_coordinates}, start_row: {start_row}, start_col: {start_col}, end_row: {end_row}, end_col: {end_col}')
-        return get_matrix_from_calendar(self.month_cache, start_row, start_col)
+        """
+        The day at calendar_coordinates (eg: 'June 2024!J16:M25')
+        """
+        start_row, start_col = location_to_offsets(calendar_coordinates)
+        return get_matrix_from_calendar(self.month_cache, start_row, start_col + 1)
+
+
+    def get_date(self, target_date):
+        """
+        The day of target_date (for the Master tab, pass the master date, see GCal.get_master_date)
+        """
+        start_row, start_col = get_layout(target_date).get_offsets(target_date.day)
+        return get_matrix_from_calendar(self.month_cache, start_row, start_col + 1)
 
 
     def replace_day(self, target_date, replacement_matrix):
@@ -72,12 +66,13 @@ class CalendarCache:
         Note that it might be necessary to pad up to the current coordinates.  We only pad the left side
         """
         self.__validate_matrix(replacement_matrix)
-        start_row, start_col, end_row, end_col = self.__spreadsheet_to_cache(get_calendar_coordinates(target_date))
+        start_row, start_col = get_layout(target_date).get_offsets(target_date.day)
+        self.mark_dirty(start_row, start_col, len(replacement_matrix), max([len(row) for row in replacement_matrix], default=0))
         for row in range(0, len(replacement_matrix)):
             calendar_row_idx = (start_row) + row
             for col in range(0, len(replacement_matrix[row])):
                 try:
-                    self.month_cache[calendar_row_idx][(start_col + col)-1] = replacement_matrix[row][col]
+                    self.month_cache[calendar_row_idx][start_col + col] = replacement_matrix[row][col]
                 except IndexError as e:
                     print("IndexError encountered!")
                     print(f'cache is of size: {len(self.month_cache)} x {len(self.month_cache[0])}')
@@ -90,35 +85,93 @@ class CalendarCache:
         This matrix represents the part where you can write shift info on the calendar.  Note, however, that this is setting the date header, and not 
         the shift body.  So, get the coordinates, and you will populate the value in start_row-1, start_col
         """
-        start_row, start_col, end_row, end_col = self.__spreadsheet_to_cache(get_calendar_coordinates(target_date))
-        self.month_cache[start_row-1][start_col-1] = target_date.strftime('%d')
+        start_row, start_col = get_layout(target_date).get_offsets(target_date.day)
+        self.month_cache[start_row-1][start_col] = target_date.strftime('%d')
+        self.mark_dirty(start_row-1, start_col, 1, 1)
         # Easy - Peasy - lemon squeezy
 
-    def delete(self, key):
-        del self.cache[key]
-   
-    def __spreadsheet_to_cache(self, spreadsheet):
-        def split_letters_numbers(input_str):
-            match = re.match(r"([A-Z]+)(\d+):([A-Z]+)(\d+)", input_str)
-            if match:
-                return match.groups()
-            return None        
-        
-        def letter_to_col(letters):
-            total = 0
-            group = 0
-            for letter in letters:
-                total += ord(letter) - ord('A') + (group * 26)
-                group += 1
-            return total
+    def mark_dirty(self, row, col, num_rows, num_cols):
+        """
+        Remember that the rectangle starting at month matrix [row][col] was changed
+        """
+        if num_rows == 0 or num_cols == 0:
+            return
+        rect = self.dirty.setdefault((row, col), [0, 0])
+        rect[0] = max(rect[0], num_rows)
+        rect[1] = max(rect[1], num_cols)
+
+    def get_dirty_ranges(self, diff_only=False):
+        """
+        Return the ranges that were changed since the month was read (or since mark_clean), ready for a batchUpdate.
+
+        diff_only = False: every dirty rectangle is returned as it is in the cache
+        diff_only = True: cells that still have the value that was read are left out.  Each row of a rectangle is reduced
+                          to the runs of cells that changed, so cells we didn't change are never written back
 
-        coord_tuple = split_letters_numbers(spreadsheet.split('!')[1])
-        start_col = letter_to_col(coord_tuple[0])
-        start_row = int(coord_tuple[1]) - config.CALENDAR_OFFSET
-        end_col = letter_to_col(coord_tuple[2])
-        end_row = int(coord_tuple[3]) - config.CALENDAR_OFFSET
+        Returns: list of (location, rows).  Example: [('June 2024!F7:I15', [[...], ...])]
+        """
+        ranges = []
+        for (row, col), (num_rows, num_cols) in sorted(self.dirty.items()):
+            if not diff_only:
+                values = [self.month_cache[row + i][col:col + num_cols] for i in range(num_rows)]
+                ranges.append((self.to_location(row, col, row + num_rows - 1, col + num_cols - 1), values))
+                continue
+
+            for row_idx in range(row, row + num_rows):
+                run_start = None
+                for col_idx in range(col, col + num_cols + 1):
+                    changed = col_idx < col + num_cols and self.month_cache[row_idx][col_idx] != self.original[row_idx][col_idx]
+                    if changed and run_start is None:
+                        run_start = col_idx
+                    elif not changed and run_start is not None:
+                        ranges.append((self.to_location(row_idx, run_start, row_idx, col_idx - 1),
+                                       [self.month_cache[row_idx][run_start:col_idx]]))
+                        run_start = None
+        return ranges
+
+    def mark_clean(self):
+        """
+        The dirty ranges were written to Google.  What is in the cache is now the original
+        """
+        self.original = [list(row) for row in self.month_cache]
+        self.dirty = {}
 
-        return start_row, start_col, end_row, end_col
+    def to_location(self, start_row, start_col, end_row, end_col):
+        """
+        Month matrix coordinates (row 0 = spreadsheet row 6, col 0 = column B) to a spreadsheet location
+        """
+        first_row = config.CALENDAR_OFFSET + 1
+        return (f'{self.tab_name}!{index_to_column(start_col + 1)}{start_row + first_row}:'
+                f'{index_to_column(end_col + 1)}{end_row + first_row}')
+
+    def update_range(self, location, values):
+        """
+        Write values that were sent to Google (eg: 'June 2024!F7:I16') into the cache so that it stays in step with the sheet.
+        Returns False if the location falls outside of the month matrix (the caller should then discard the cache)
+        """
+        parsed = parse_location(location)
+        if parsed is None:
+            return False
+
+        _tab, start_row, start_col, end_row, end_col = parsed
+        row_idx = start_row - (config.CALENDAR_OFFSET + 1)
+        col_idx = start_col - 1     # The month matrix starts on column B
+        if row_idx < 0 or col_idx < 0 or row_idx + len(values) > len(self.month_cache):
+            return False
+
+        for row_num, row in enumerate(values):
+            cache_row = self.month_cache[row_idx + row_num]
+            if col_idx + len(row) > len(cache_row):
+                return False
+            for col_num, value in enumerate(row):
+                cache_row[col_idx + col_num] = value if isinstance(value, str) else str(value)
+                # This is already in Google, so it is not a change to write back
+                self.original[row_idx + row_num][col_idx + col_num] = cache_row[col_idx + col_num]
+
+        return True
+
+    def delete(self, key):
+        del self.cache[key]
 
 
 if __name__ == '__main__':
@@ -129,14 +182,9 @@ if __name__ == '__main__':
     # # calendar_coordinates = 'June 2024!J16:M25'
     # calendar_coordinates = 'June 2024!R36:C25'
     # c = CalendarCache('June 2024', month_matrix)
-    # print(f'Will retrieve: {c.__spreadsheet_to_cache(calendar_coordinates)}')
     # day_matrix = c.get_day(calendar_coordinates)
     # print_matrix(day_matrix)
 
-    # c = CalendarCache('June 2024', [])
-    # # print(c.__spreadsheet_to_cache('June 2024!Z26:AC35'))
-    # print(c.spreadsheet_to_cache('December 2024!V6:Y15')) # (1, 20, 15, 24)
-    # print(c.spreadsheet_to_cache('December 2024!Z6:AC15'))
 
 
 
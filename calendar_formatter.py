@@ -1,6 +1,8 @@
 import dataclasses
 import re
 from models import SchedDate, SquadShift
+from utils.territory_utils import get_territory_manager
+from cell_parser import parse_slot_cell, parse_squad_cell, rows_to_shifts
 from calendar_slot_utils import day_from_shifts, split_timeslot
 from collections import Counter
 import sys
@@ -9,7 +11,6 @@ import bcolors
 
 CALENDAR_ROWS = 9
 CALENDAR_COLS = 4
-squad_rx = "(\d{2})\s?\(\s?(\d)\s?truck.?\s?\)"
 territory_map = {}
 
 
@@ -115,20 +116,11 @@ def shifts_to_google(shifts):
     return pad_day_matrix(formatted)
 
 
-def all_empty(row: SchedDate):
-    return len(row) == 0 or (row[0] == '' and row.count('') == CALENDAR_COLS)
-
-
 def parse_slot(slot):
-    # print(f'Parsing slot: {slot}')
-    slot_parts = slot.split('\n')
-    if len(slot_parts) < 2:
-        return (slot_parts[0], None)
-    else:
-        m = re.match(r'\(tango:\s?(\d\d\d?)\)', slot_parts[1], re.IGNORECASE)
-        if m is None:
-            print(f'Tango not found! {slot} parts[0] {slot_parts[0]} parts[1] {slot_parts[1]}')
-        return slot_parts[0], int(m.group(1))
+    """
+    '1800 - 0600\n(Tango:34)' -> ('1800 - 0600', 34)  (see cell_parser.parse_slot_cell)
+    """
+    return parse_slot_cell(slot)
 
 
 def parse_squad_shift(squad_shift_str):
@@ -140,73 +132,26 @@ def parse_squad_shift(squad_shift_str):
     "35(2 trucks)\n['All']"
     '35(2 trucks)\n[35, 43]'
 
-    Return tuple: (squad, num_trucks, territory_list)
+    Return tuple: (squad, num_trucks, territory_list), or None for 'Out of service'
+    The parsing is done (and cached) by cell_parser.parse_squad_cell
     """
-    no_crew = False
-    territories = []
-    if '\n' in squad_shift_str:
-        (squad_str, terr) = squad_shift_str.split('\n')
-        if 'nocrew' in terr.lower().replace(' ', ''):
-            no_crew = True
-        elif 'all' in terr.lower():
-            territories = ['All']
-        else:
-            territories = terr.replace('[', '').replace(']', '').replace(' ', '').split(',')
-            territories = [eval(i) for i in territories]
-    else:
-        squad_str = squad_shift_str
-        
-
-    if no_crew:
-        trucks = 0
-    else:
-        trucks = 1
-
-    squad = None
-    if 'truck' in squad_str.lower():
-        m = re.match(squad_rx, squad_str, re.IGNORECASE)
-        if m is None:
-            squad = int(squad_str.replace(' ', ''))
-        else:
-            squad = int(m.group(1))
-            trucks = int(m.group(2))
-    elif 'out of service' in squad_str.lower():
+    parsed = parse_squad_cell(squad_shift_str)
+    if parsed is None:
         return None
-    else:
-        squad = int(squad_str.replace(' ', ''))
-    
-    return (squad, trucks, territories)
+    (squad, trucks, territories) = parsed
+    return (squad, trucks, list(territories))
 
 
 def google_to_shifts(rows, target_date):
     """Takes rows from Google Calendar and returns a list of SchedDate objects
     ## Arguments:
     * rows - Matrix as received from Google Calendar
-    * month
-    * day
-    * year
+    * target_date
 
     ## Returns:
     * list (list of SchedDate)
     """
-    # print(f'Converting {rows} rows to shifts for date: {target_date}')
-    shifts = []
-    for row in rows:
-        # print(f'Processing row: {row}')
-        if not all_empty(row):
-            timeslot, tango = parse_slot(row[0])
-            shift = []
-            for col in row[1:]:
-                if len(col.strip()) > 0:
-                    # (squad, num_trucks, territory_list) = parse_squad_shift(col)
-                    resp = parse_squad_shift(col)
-                    if resp is not None:
-                        (squad, num_trucks, territory_list) = resp
-                        shift.append(SquadShift(squad=squad, number_of_trucks=num_trucks, squad_covering=territory_list))
-
-            shifts.append(SchedDate(target_date, timeslot, tango, shift))
-
-    return shifts
+    return rows_to_shifts(rows, target_date)
 
 """
 class SquadShift:
@@ -319,6 +264,7 @@ def to_squad_shifts(target_date, raw_slots, territory_map, overrides):
     ## Returns:
     list of SchedDate objects
     """
+    territory_manager = get_territory_manager(territory_map)
     squad_shifts = []  
     for slot in raw_slots:
         tally = Counter(slot[2:])
@@ -326,9 +272,12 @@ def to_squad_shifts(target_date, raw_slots, territory_map, overrides):
         (no_crew, unique_squads) = filter_squads(unique_squads)
         shift = []
         if len(unique_squads) > 1:            
-            key = make_territory_key(unique_squads)
-            territories = get_territories_with_ovr(slot[1], key, territory_map, overrides)
+            if overrides is None or len(overrides) == 0:
+                territories = territory_manager.get_coverage(unique_squads)
+            else:
+                territories = get_territories_with_ovr(slot[1], make_territory_key(unique_squads), territory_map, overrides)
             if territories is None:
+                key = make_territory_key(unique_squads)
                 print(f'{bcolors.bcolors.BOLD}{bcolors.bcolors.FAIL}Unable to find territories for key: {key}{bcolors.bcolors.ENDC}')
                 sys.exit()
             for squad in unique_squads:
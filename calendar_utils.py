@@ -1,15 +1,17 @@
 from datetime import datetime
+import re
 
-from config import CALENDAR_COLS, CALENDAR_OFFSET, CALENDAR_ROWS
-from models import CalendarTab
+from config import CALENDAR_COLS, CALENDAR_ROWS
+import month_layout
+
+LOCATION_PARTS_RE = re.compile(r"^(?:(.+)!)?([A-Z]+)(\d+)(?::([A-Z]+)(\d+))?$")
 
 def get_calendar_coordinates(target_date):
     """
     For a given date, get the coordinates of the cell in the calendar
     Coordinates are of the form: tab_name!A1:B2 (eg: 'June 2024!A1:B2')
     """
-    tab = str(CalendarTab.from_date(target_date))
-    return f'{tab}!{get_cell_range(target_date)}'
+    return month_layout.get_layout(target_date).get_coordinates(target_date.day)
 
 def pad_month(month_rows):
     """
@@ -33,52 +35,56 @@ def pad_month(month_rows):
 
     return padded_matrix
 
-def get_cell_range(target_date):
+def column_to_index(letters):
     """
-    For a given date, get the range of cells that the date occupies in the calendar
+    Convert spreadsheet column letters to a zero based index ('A' = 0, 'Z' = 25, 'AC' = 28)
     """
+    index = 0
+    for letter in letters:
+        index = index * 26 + (ord(letter) - ord('A') + 1)
+    return index - 1
 
-    def get_month_row(day, days_on_first_row):
-        """
-        On a calendar that starts with Sunday and ends with Saturday,
-        On which row does the given day fall?  
-        """
-        if day <= days_on_first_row:
-            month_row = 0
-        else:
-            month_row = int(((day - days_on_first_row) + 6) / 7)
-
-        return month_row 
 
-    # weekday() - Mon = 0, Tues = 1...Sun = 6
-    day_of_week = target_date.weekday()
-    # print(f'Date: {the_date} daofw: {day_of_week}')
+def index_to_column(index):
+    """
+    Convert a zero based column index back to spreadsheet column letters (28 = 'AC')
+    """
+    letters = ''
+    index += 1
+    while index > 0:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
 
-    days_offsets = [('F', 'I'),('J', 'M'),('N','Q'),('R','U'),('V','Y'),('Z', 'AC'),('B', 'E')]
 
-    day_num = 0
-    first_day_of_month = datetime.strptime(f'{target_date.year}-{target_date.month}-01', '%Y-%m-%d')
-    # Since 0 = Mon and 6 = Sunday, but our cally starts with Sunday, adjust the first day of month
-    # so that Sunday = 0 and Saturday = 6
-    if first_day_of_month.weekday() == 6:
-        day_num = 0
-    else:
-        day_num = first_day_of_month.weekday() + 1
+def parse_location(location):
+    """
+    Split a location into its parts.
+    Example: 'June 2024!J16:M25' -> ('June 2024', 16, 9, 25, 12)
 
-    days_on_first_row = 7 - day_num
+    Returns: (tab, start_row, start_col, end_row, end_col) where rows are spreadsheet row numbers and
+    columns are zero based indexes.  A single cell location (eg: 'Audit!A2') has start == end.
+    Returns None if the location cannot be parsed.
+    """
+    match = LOCATION_PARTS_RE.match(location.strip())
+    if not match:
+        return None
 
-    # month_row is zero based
-    month_row = get_month_row(target_date.day, days_on_first_row)
+    tab, start_letters, start_row, end_letters, end_row = match.groups()
+    if tab is not None:
+        tab = tab.strip("'")
+    if end_letters is None:
+        end_letters, end_row = start_letters, start_row
 
-    # print(f'Day of week for: {target_month} day: {day} is {day_of_week}')
-    col_tuple = days_offsets[day_of_week]
+    return (tab, int(start_row), column_to_index(start_letters), int(end_row), column_to_index(end_letters))
 
-    # CALENDAR_ROWS should really be 10
-    start_row = CALENDAR_OFFSET + 1 + (month_row*(CALENDAR_ROWS+1))
-    end_row = start_row + (CALENDAR_ROWS+1) - 1   
 
-    # Note: The row starts on start_row, but since the first row is the header, we need to skip it
-    return f'{col_tuple[0]}{start_row}:{col_tuple[1]}{end_row}'
+def get_cell_range(target_date):
+    """
+    For a given date, get the range of cells that the date occupies in the calendar (header row included)
+    Example: 12/15/2024 -> 'B26:E35'
+    """
+    return month_layout.get_layout(target_date).get_cell_range(target_date.day)
 
 if __name__ == '__main__':
    the_date = datetime(2024, 12, 1)
@@ -0,0 +1,208 @@
+from calendar import monthrange
+from datetime import datetime
+from functools import lru_cache
+import re
+import config
+from models import SchedDate, SquadShift
+from month_layout import get_layout
+
+"""
+Parser for the cells of the calendar (see calendar_formatter for the format).
+
+The calendar only holds a handful of different cells ('34\n[34, 42, 54]', "54\n['All']", '1800 - 0600\n(Tango:34)' ...),
+so each cell string is parsed once with precompiled patterns and the result is kept in a bounded LRU cache.
+Cached results are tuples; callers get fresh lists when they build SquadShifts (squad_covering is changed in place
+elsewhere).
+
+month_to_shifts parses a whole month block (B6:AC65, 60 x 28) in one pass instead of slicing it day by day.
+"""
+
+TANGO_RE = re.compile(r'\(tango:\s?(\d\d\d?)\)', re.IGNORECASE)
+SQUAD_TRUCKS_RE = re.compile(r'(\d{2})\s?\(\s?(\d)\s?truck.?\s?\)', re.IGNORECASE)
+NO_CREW_RE = re.compile(r'no *crew', re.IGNORECASE)
+ALL_RE = re.compile(r'all', re.IGNORECASE)
+TERRITORY_RE = re.compile(r'\d+')
+TRUCK_RE = re.compile(r'truck', re.IGNORECASE)
+OUT_OF_SERVICE_RE = re.compile(r'out of service', re.IGNORECASE)
+
+def all_empty(row):
+    return len(row) == 0 or (row[0] == '' and row.count('') == config.CALENDAR_COLS)
+
+
+@lru_cache(maxsize=config.CELL_PARSER_CACHE_SIZE)
+def parse_slot_cell(slot):
+    """
+    '1800 - 0600\n(Tango:34)' -> ('1800 - 0600', 34)
+    '0600 - 1800' -> ('0600 - 1800', None)
+    """
+    slot_time, _, tango_part = slot.partition('\n')
+    if tango_part == '':
+        return slot_time, None
+
+    m = TANGO_RE.match(tango_part)
+    if m is None:
+        raise ValueError(f'Tango not found! {slot}')
+    return slot_time, int(m.group(1))
+
+
+@lru_cache(maxsize=config.CELL_PARSER_CACHE_SIZE)
+def parse_squad_cell(squad_shift_str):
+    """
+    Parse a squad cell (see calendar_formatter.parse_squad_shift)
+    ## Returns
+    (squad, num_trucks, territory_tuple), or None for 'Out of service'
+    """
+    squad_str, newline, terr = squad_shift_str.partition('\n')
+    trucks = 1
+    territories = ()
+    if newline != '':
+        if NO_CREW_RE.search(terr) is not None:
+            trucks = 0
+        elif ALL_RE.search(terr) is not None:
+            territories = ('All',)
+        else:
+            territories = tuple(int(territory) for territory in TERRITORY_RE.findall(terr))
+
+    if TRUCK_RE.search(squad_str) is not None:
+        m = SQUAD_TRUCKS_RE.match(squad_str)
+        if m is None:
+            return int(squad_str.replace(' ', '')), trucks, territories
+        return int(m.group(1)), int(m.group(2)), territories
+
+    if OUT_OF_SERVICE_RE.search(squad_str) is not None:
+        return None
+
+    return int(squad_str.replace(' ', '')), trucks, territories
+
+
+def row_to_shift(row, target_date):
+    """
+    One (non empty) row of a day: [slot, squad, squad, squad] -> SchedDate
+    """
+    timeslot, tango = parse_slot_cell(row[0])
+    squads = []
+    for col in row[1:]:
+        if len(col.strip()) > 0:
+            parsed = parse_squad_cell(col)
+            if parsed is not None:
+                squads.append(SquadShift(squad=parsed[0], number_of_trucks=parsed[1], squad_covering=list(parsed[2])))
+    return SchedDate(target_date, timeslot, tango, squads)
+
+
+def rows_to_shifts(rows, target_date):
+    """
+    The rows of one day (as read from Google) -> list of SchedDate
+    """
+    return [row_to_shift(row, target_date) for row in rows if not all_empty(row)]
+
+
+def month_to_shifts(month_rows, month_date):
+    """Parse the whole month block in one pass
+
+    ## Parameters
+    * month_rows: the month block (B6:AC65) as read from Google.  Short or missing rows are fine
+    * month_date (datetime): only year and month are used
+
+    ## Returns
+    dict: key = day of the month, value = list of SchedDate (same as google_to_shifts on that day's rows)
+    """
+    layout = get_layout(month_date)
+    # Days of each week row of the calendar: [(first column, day date), ...]
+    weeks = [[(layout.get_position(day).col, datetime(layout.year, layout.month, day)) for day in week]
+             for week in layout.weeks]
+
+    shifts_by_day = {day: [] for day in range(1, layout.days_in_month + 1)}
+    for row_num, row in enumerate(month_rows):
+        week, day_row = divmod(row_num, layout.rows_per_day)
+        # The header row has the day numbers, and (like get_matrix_from_calendar) the last row of a day is not used
+        if len(row) == 0 or day_row == 0 or day_row >= config.CALENDAR_ROWS or week >= len(weeks):
+            continue
+        for col, day_date in weeks[week]:
+            cells = row[col:col + config.CALENDAR_COLS]
+            if not all_empty(cells):
+                shifts_by_day[day_date.day].append(row_to_shift(cells, day_date))
+
+    return shifts_by_day
+
+
+if __name__ == '__main__':
+    # Benchmark on the May 2024 fixture:  python cell_parser.py
+    from ast import literal_eval
+    import timeit
+    from calendar_cache import CalendarCache
+
+    squad_rx = r"(\d{2})\s?\(\s?(\d)\s?truck.?\s?\)"
+
+    def eval_parse_slot(slot):
+        slot_parts = slot.split('\n')
+        if len(slot_parts) < 2:
+            return (slot_parts[0], None)
+        m = re.match(r'\(tango:\s?(\d\d\d?)\)', slot_parts[1], re.IGNORECASE)
+        return slot_parts[0], int(m.group(1))
+
+    def eval_parse_squad_shift(squad_shift_str):
+        # The parser this module replaced (split, lower, re.match with an uncompiled pattern, eval)
+        no_crew = False
+        territories = []
+        if '\n' in squad_shift_str:
+            (squad_str, terr) = squad_shift_str.split('\n')
+            if 'nocrew' in terr.lower().replace(' ', ''):
+                no_crew = True
+            elif 'all' in terr.lower():
+                territories = ['All']
+            else:
+                territories = terr.replace('[', '').replace(']', '').replace(' ', '').split(',')
+                territories = [eval(i) for i in territories]
+        else:
+            squad_str = squad_shift_str
+        trucks = 0 if no_crew else 1
+        if 'truck' in squad_str.lower():
+            m = re.match(squad_rx, squad_str, re.IGNORECASE)
+            if m is None:
+                squad = int(squad_str.replace(' ', ''))
+            else:
+                squad = int(m.group(1))
+                trucks = int(m.group(2))
+        elif 'out of service' in squad_str.lower():
+            return None
+        else:
+            squad = int(squad_str.replace(' ', ''))
+        return (squad, trucks, territories)
+
+    def eval_google_to_shifts(rows, target_date):
+        shifts = []
+        for row in rows:
+            if not all_empty(row):
+                timeslot, tango = eval_parse_slot(row[0])
+                shift = []
+                for col in row[1:]:
+                    if len(col.strip()) > 0:
+                        resp = eval_parse_squad_shift(col)
+                        if resp is not None:
+                            shift.append(SquadShift(squad=resp[0], number_of_trucks=resp[1], squad_covering=resp[2]))
+                shifts.append(SchedDate(target_date, timeslot, tango, shift))
+        return shifts
+
+    with open(f'{config.TEST_PATH}/expected_results/May_2024.txt', 'r') as f:
+        month_rows = literal_eval(f.read())
+    month_date = datetime(2024, 5, 1)
+    cache = CalendarCache('May 2024', month_rows)
+    days = [datetime(2024, 5, day) for day in range(1, monthrange(2024, 5)[1] + 1)]
+
+    def per_day_eval():
+        return {day.day: eval_google_to_shifts(cache.get_date(day), day) for day in days}
+
+    def per_day_compiled():
+        return {day.day: rows_to_shifts(cache.get_date(day), day) for day in days}
+
+    def whole_month():
+        return month_to_shifts(month_rows, month_date)
+
+    print(f'Same shifts: {per_day_eval() == per_day_compiled() == whole_month()}')
+    print(f'Cells cached: {parse_squad_cell.cache_info().currsize + parse_slot_cell.cache_info().currsize}')
+    runs = 200
+    eval_time = timeit.timeit(per_day_eval, number=runs) / runs
+    for name, method in [('Per day, eval parser', per_day_eval), ('Per day, compiled parser', per_day_compiled),
+                         ('month_to_shifts', whole_month)]:
+        method_time = timeit.timeit(method, number=runs) / runs
+        print(f'{name:26} {method_time*1e3:8.3f} ms per month  ({eval_time/method_time:.1f}x)')
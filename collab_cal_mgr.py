@@ -1,7 +1,9 @@
+from contextlib import contextmanager
 import time
-from calendar_slot_utils import add_to_calendar, build_tango_slots, remove_from_calendar, get_slots, build_day, add_tango_to_calendar
-from calendar_formatter import google_to_shifts, day_from_shifts, to_squad_shifts, shifts_to_google, pad_day_matrix, CALENDAR_ROWS, CALENDAR_COLS
-from models import ModifyShiftRequest, SchedDate, SquadContacts, SquadShift, MAX_TRUCKS_PER_SHIFT, squads
+from calendar_slot_utils import add_tango_to_calendar
+from calendar_formatter import google_to_shifts, to_squad_shifts, shifts_to_google, pad_day_matrix, CALENDAR_ROWS, CALENDAR_COLS
+from cell_parser import month_to_shifts
+from models import CalendarDay, CalendarTab, ModifyShiftRequest, SchedDate, SquadContacts, SquadShift, MAX_TRUCKS_PER_SHIFT, squads
 from google_calendar_mgr import LOCATION_RE
 from collections import defaultdict
 import datetime
@@ -13,6 +15,14 @@ from bcolors import bcolors
 from calendar import monthrange
 import traceback
 from google_calendar_mgr import PROD_COLLAB_CALENDAR_SPREADSHEET_ID, BETA_COLLAB_CALENDAR_SPREADSHEET_ID, GCal
+from cached_google_calendar_mgr import CachedGCal
+from write_behind_buffer import WriteBehindBuffer
+from transactioned_calendar_delegate import CalendarDelegate
+from audit_log import AuditLog
+import config
+from month_layout import get_layout
+from tally_ledger import get_tally_ledger, tally_day
+from utils.tango_util import TangoAllocator
 from ersats_google_calendar_mgr import ErsatsGCal
 from test.src.decorators.shift_testing_capture import shift_testing_capture
 
@@ -22,19 +32,27 @@ class CollabCalendarManager:
     def __init__(self, environment, config_dir, interactive_mode=True):
         self.interactive_mode = interactive_mode
         self.config_dir = config_dir
+        self.write_buffer = None
+        self.reference_data = None
 
+        # CachedGCal reads each month once and serves the days from memory
         if environment == 'prod':
-            self.gcal = GCal(PROD_COLLAB_CALENDAR_SPREADSHEET_ID)
-            self.master_gcal = GCal(PROD_COLLAB_CALENDAR_SPREADSHEET_ID)            
+            self.gcal = CachedGCal(PROD_COLLAB_CALENDAR_SPREADSHEET_ID, config_dir)
+            self.master_gcal = CachedGCal(PROD_COLLAB_CALENDAR_SPREADSHEET_ID, config_dir)
         elif environment == 'devo':
-            self.gcal = GCal(BETA_COLLAB_CALENDAR_SPREADSHEET_ID)
-            self.master_gcal = GCal(BETA_COLLAB_CALENDAR_SPREADSHEET_ID)
+            self.gcal = CachedGCal(BETA_COLLAB_CALENDAR_SPREADSHEET_ID, config_dir)
+            self.master_gcal = CachedGCal(BETA_COLLAB_CALENDAR_SPREADSHEET_ID, config_dir)
         elif environment == 'test':
             self.gcal = ErsatsGCal('TEST')
         else:
             raise Exception(f'Invalid environment passed to CollabCalendarManager: {environment}')
         
         self.master_gcal.set_calendar_tab('Master')
+        self.audit_log = AuditLog(self.gcal, config_dir)
+        # Running hour / tango totals (the test calendar doesn't keep any)
+        self.tally_ledger = get_tally_ledger(config_dir, self.gcal.CALENDAR_SPREADSHEET_ID) \
+            if self.gcal.supports_batch_writes else None
+        self.tally_seeded = {}  # key = tab, value = month load (see CachedGCal.get_month_load) the ledger was checked at
 
 
     def set_calendar_tab(self, target_tab):
@@ -42,6 +60,82 @@ class CollabCalendarManager:
         self.target_tab = target_tab
 
     
+    def begin_write_batch(self, max_batch_size=config.WRITE_BATCH_SIZE):
+        """
+        From now on, days written to the calendar are held in a WriteBehindBuffer and sent together
+        (as one batchUpdate) when flush_writes() is called
+        """
+        if self.gcal.supports_batch_writes:
+            self.write_buffer = WriteBehindBuffer(self.gcal, max_batch_size)
+
+
+    def flush_writes(self):
+        """
+        Send the writes held since begin_write_batch() and go back to writing each day as it is changed
+        """
+        if self.write_buffer is not None:
+            # Back to writing each day even if the batch fails
+            write_buffer, self.write_buffer = self.write_buffer, None
+            write_buffer.flush()
+        self.audit_log.flush()
+
+
+    def discard_writes(self):
+        """
+        Drop the writes held since begin_write_batch() (eg: the month could not be read) and go back to writing each
+        day as it is changed
+        """
+        if self.write_buffer is not None:
+            write_buffer, self.write_buffer = self.write_buffer, None
+            write_buffer.discard()
+
+
+    @contextmanager
+    def write_batch(self, max_batch_size=config.WRITE_BATCH_SIZE):
+        """
+        begin_write_batch() / flush_writes() around a block.  If the block raises, the held writes are dropped.
+        Yields the WriteBehindBuffer (None if the calendar doesn't batch writes)
+
+            with manager.write_batch() as write_buffer:
+                ...
+        """
+        self.begin_write_batch(max_batch_size)
+        try:
+            yield self.write_buffer
+        except BaseException:
+            self.discard_writes()
+            raise
+        self.flush_writes()
+
+
+    def write_day_to_calendar(self, target_date, formatted_rows, extra_ranges=None):
+        """
+        extra_ranges (list of (location, rows), eg: the tally rows) are sent in the same batchUpdate as the day
+
+        Returns the response of the write (or its HttpError).  None if the write is held in the write batch
+        """
+        if self.write_buffer is not None:
+            self.write_buffer.write_day_to_calendar(target_date, formatted_rows)
+            for location, rows in extra_ranges or []:
+                self.write_buffer.update_values(location, "USER_ENTERED", rows)
+            return None
+        elif extra_ranges:
+            write_buffer = WriteBehindBuffer(self.gcal)
+            write_buffer.write_day_to_calendar(target_date, formatted_rows)
+            for location, rows in extra_ranges:
+                write_buffer.update_values(location, "USER_ENTERED", rows)
+            return write_buffer.flush()
+        else:
+            return self.gcal.write_day_to_calendar(target_date, formatted_rows)
+
+
+    def is_written(self, result):
+        """
+        GCal returns the HttpError of a write that failed (instead of raising it)
+        """
+        return not isinstance(result, Exception)
+
+
     def set_territory_map(self, territory_map):
         self.territory_map = territory_map
 
@@ -52,11 +146,42 @@ class CollabCalendarManager:
             if val.lower() != 'y':
                 raise Exception(f'Did not select y for: {prompt}')
 
+    def load_reference_data(self, include_template=True):
+        """
+        Read the territory map, contacts, tabs (and template) in one go.  get_tabs, read_territory_map, read_contacts
+        and get_calendar_template are then served from memory
+        """
+        if self.gcal.supports_batch_writes:
+            self.reference_data = self.gcal.get_reference_data(include_template)
+        return self.reference_data
+
+
+    def refresh(self):
+        """
+        For a long running process: read again what changed in the spreadsheet since the last call (one metadata
+        request when nothing changed)
+        ## Returns
+        True if the spreadsheet changed (the reference data is then read again)
+        """
+        if not isinstance(self.gcal, CachedGCal):
+            return False
+        revision = self.gcal.get_revision()
+        changed = self.gcal.refresh(revision)
+        self.master_gcal.refresh(revision)
+        if changed and self.reference_data is not None:
+            self.reference_data = self.gcal.get_reference_data(self.reference_data.calendar_template is not None)
+        return changed
+
+
     def get_tabs(self):
+        if self.reference_data is not None:
+            return self.reference_data.tabs
         return self.gcal.get_tabs()
     
 
     def read_territory_map(self):
+        if self.reference_data is not None:
+            return self.reference_data.territory_map
         return self.gcal.read_territory_map()
     
 
@@ -100,6 +225,8 @@ class CollabCalendarManager:
             row_num += 1
 
     def get_calendar_template(self):
+        if self.reference_data is not None and self.reference_data.calendar_template is not None:
+            return self.reference_data.calendar_template
         return self.gcal.get_calendar_template()
 
 
@@ -122,6 +249,58 @@ class CollabCalendarManager:
         return google_to_shifts(calendar_day_rows, target_date)
 
 
+    def get_month(self, tab):
+        """Get every day of a month
+        ## Parameters:
+        * tab: 'May 2024' (str or CalendarTab)
+
+        ## Returns:
+        * list of CalendarDay, one per day of the month
+        """
+        first_day = CalendarTab.from_components(str(tab)).as_date()
+        return self.get_range(first_day, first_day.replace(day=monthrange(first_day.year, first_day.month)[1]))
+
+
+    def get_range(self, from_date, to_date, existing_tabs_only=False):
+        """Get the days from from_date to to_date (both included)
+        The month grids are read with one request, even when the range spans two tabs, and each month is parsed in
+        one pass (see cell_parser.month_to_shifts)
+
+        ## Parameters:
+        * existing_tabs_only: leave out the days of months without a tab (eg: next month's tab is not created yet),
+          instead of failing the whole read
+
+        ## Returns:
+        * list of CalendarDay
+
+        Raises Exception if the months can't be read
+        """
+        dates = [from_date + datetime.timedelta(days=day) for day in range((to_date - from_date).days + 1)]
+        tabs = list(dict.fromkeys(get_layout(target_date).tab_name for target_date in dates))
+        if existing_tabs_only and len(tabs) > 1:
+            existing_tabs = set(self.get_tabs())
+            missing_tabs = [tab for tab in tabs if tab not in existing_tabs]
+            if len(missing_tabs) > 0:
+                print(f'{bcolors.WARNING}No tab for: {", ".join(missing_tabs)} (days left out){bcolors.ENDC}')
+                tabs = [tab for tab in tabs if tab in existing_tabs]
+                dates = [target_date for target_date in dates if get_layout(target_date).tab_name in existing_tabs]
+        if len(tabs) == 0:
+            return []
+
+        months = self.gcal.get_months(tabs)
+        if months is None:
+            raise Exception(f'Unable to read: {", ".join(tabs)}')
+
+        shifts_by_tab = {}
+        calendar_days = []
+        for target_date in dates:
+            tab = get_layout(target_date).tab_name
+            if tab not in shifts_by_tab:
+                shifts_by_tab[tab] = month_to_shifts(months[tab], target_date)
+            calendar_days.append(CalendarDay(target_date=target_date, slots=shifts_by_tab[tab][target_date.day]))
+        return calendar_days
+
+
     def to_squad_array(self, squads):
         squad_array = []
         for _squad in squads:
@@ -182,35 +361,121 @@ class CollabCalendarManager:
         """
         changes is a list of ModifyShiftRequest requests
         """
-        if initial_build:
-            matrix = build_day()
-            tango_array = build_tango_slots()
+        calendar_day_rows = None if initial_build else self.gcal.get_day_from_calendar(target_date)
+        formatted_rows = self.apply_changes_to_day(target_date, calendar_day_rows, changes, territory_map,
+                                                   prompt_method, territory_overrides)
+        
+        tally_ranges = []
+        if not initial_build:
+            self.save_day(target_date)
+            tally_ranges = self.update_tally(target_date, self.day_tally(google_to_shifts(calendar_day_rows or [], target_date)),
+                                             self.day_tally(google_to_shifts(formatted_rows, target_date)))
+
+        result = self.write_day_to_calendar(target_date, formatted_rows, tally_ranges)
+        self.commit_tally(self.is_written(result), [get_layout(target_date).tab_name])
+        
+        if not initial_build and is_audited:
+            self.audit_changes(target_date, changes)
+
+
+    def apply_changes_to_day(self, target_date, calendar_day_rows, changes, territory_map,
+                             prompt_method=None, territory_overrides=None):
+        """Apply the changes to a day read from the calendar
+        ## Parameters:
+        * calendar_day_rows: the day as read from the calendar (None = start from an empty day)
+        * changes: list of ModifyShiftRequest
+
+        ## Returns:
+        * formatted rows for the calendar
+        """
+        # Imported here so that runs that never change a day don't load numpy
+        if config.SHIFT_ENGINE == 'intervals':
+            from shift_intervals import IntervalDay as shift_engine
+        else:
+            from day_matrix import DayMatrix as shift_engine
+        if calendar_day_rows is None:
+            day = shift_engine()
         else:
-            calendar_day_rows = self.gcal.get_day_from_calendar(target_date)
             day_shifts = google_to_shifts(calendar_day_rows, target_date)
-            tango_array, matrix = day_from_shifts(day_shifts)
+            day = shift_engine.from_shifts(day_shifts)
 
         # Implement changes here in bulk
-        for _change in changes:
-            change: ModifyShiftRequest = _change
-            if change.modify_options.is_add :
-                add_to_calendar(matrix, change.start_time, change.end_time, change.squad)
-            else:
-                remove_from_calendar(matrix, change.start_time, change.end_time, change.squad, change.modify_options)
+        day.apply_changes(changes)
 
         start, end = self.get_shift_range(target_date)
-        slots = get_slots(tango_array, matrix, start, end)
+        slots = day.get_slots(start, end)
         shifts = to_squad_shifts(target_date, slots, territory_map, territory_overrides)
-        
-        if not initial_build:
+
+        if calendar_day_rows is not None:
             self.fix_tangos(shifts, prompt_method)
-            self.save_day(target_date)
 
-        formatted_rows = shifts_to_google(shifts)
-        self.gcal.write_day_to_calendar(target_date, formatted_rows)
-        
-        if not initial_build and is_audited:
-            self.audit_changes(target_date, changes)
+        return shifts_to_google(shifts)
+
+
+    def apply_changes(self, changes_by_date, territory_map, is_audited=True, prompt_method=None, territory_overrides=None):
+        """Apply changes to many days at once.
+        Each month tab is read once (CalendarDelegate transaction), all of its days are changed in memory and written
+        back with one batchUpdate.  The months are saved once (see revert) and the audit rows are appended in one call.
+
+        ## Parameters:
+        * changes_by_date (dict): key = date, value = list of ModifyShiftRequest
+
+        ## Returns:
+        * Number of days changed.  A month whose batchUpdate failed is not changed (nor audited): its days are not counted
+        """
+        if not self.gcal.supports_batch_writes:
+            # The test calendar writes day by day
+            for target_date in sorted(changes_by_date.keys()):
+                self.add_remove_shifts(target_date, changes_by_date[target_date], territory_map, is_audited=is_audited,
+                                       prompt_method=prompt_method, territory_overrides=territory_overrides)
+            return len(changes_by_date)
+
+        dates_by_tab = defaultdict(list)
+        for target_date in sorted(changes_by_date.keys()):
+            dates_by_tab[str(CalendarTab.from_date(target_date))].append(target_date)
+
+        delegates = []
+        audit_rows_by_tab = defaultdict(list)
+        try:
+            for tab, dates in dates_by_tab.items():
+                self.seed_tally(tab)
+                delegate = CalendarDelegate(self.gcal, CalendarTab.from_date(dates[0]))
+                delegate.begin_transaction()
+                delegates.append(delegate)
+                for target_date in dates:
+                    print(f'{bcolors.OKBLUE}Applying {len(changes_by_date[target_date])} change(s) to: {target_date.strftime("%m/%d/%Y")}{bcolors.ENDC}')
+                    calendar_day_rows = delegate.get_day_from_calendar(target_date)
+                    formatted_rows = self.apply_changes_to_day(target_date, calendar_day_rows, changes_by_date[target_date],
+                                                               territory_map, prompt_method, territory_overrides)
+                    delegate.write_day_to_calendar(target_date, formatted_rows)
+                    # Seeded above, before the first change of the month
+                    self.update_tally(target_date, self.day_tally(google_to_shifts(calendar_day_rows or [], target_date)),
+                                      self.day_tally(google_to_shifts(formatted_rows, target_date)), seed=False)
+                    audit_rows_by_tab[tab].extend(self.to_audit_rows(target_date, changes_by_date[target_date]))
+        except Exception:
+            for delegate in delegates:
+                delegate.rollback()
+            self.commit_tally(False, list(dates_by_tab.keys()))
+            raise
+
+        self.save_months(delegates, min(changes_by_date.keys()))
+        written_tabs = []
+        for delegate in delegates:
+            tab = str(delegate.calendar_tab)
+            # The tally rows of the month go with its days
+            result = delegate.end_transaction(extra_ranges=self.get_tally_ranges(tab))
+            if self.is_written(result):
+                written_tabs.append(tab)
+            else:
+                print(f'{bcolors.FAIL}The changes to {tab} were not written: {result}{bcolors.ENDC}')
+                delegate.rollback()
+        self.commit_tally(len(written_tabs) == len(delegates), list(dates_by_tab.keys()))
+
+        if is_audited:
+            self.audit_log.append([row for tab in written_tabs for row in audit_rows_by_tab[tab]])
+            self.audit_log.flush()
+
+        return sum(len(dates_by_tab[tab]) for tab in written_tabs)
 
 
     def adjust_territories(self, target_date, shifts, change_slot_idx, territory_map):
@@ -234,7 +499,7 @@ class CollabCalendarManager:
 
         # Write the day back to the calendar
         formatted_rows = shifts_to_google(shifts)
-        self.gcal.write_day_to_calendar(target_date, formatted_rows)
+        self.write_day_to_calendar(target_date, formatted_rows)
 
 
     def pad_location(self, location:str):
@@ -287,7 +552,12 @@ class CollabCalendarManager:
         
         Returns a map of SquadContacts objects key=squad
         """
-        raw_contacts = self.gcal.get_contacts()
+        if self.reference_data is not None:
+            return self.to_squad_contacts(self.reference_data.contacts)
+        return self.to_squad_contacts(self.gcal.get_contacts())
+
+
+    def to_squad_contacts(self, raw_contacts):
         contacts = {}
         for row in raw_contacts:
             if len(row) > 3:
@@ -323,13 +593,38 @@ class CollabCalendarManager:
         print(bcolors.OKBLUE + 'Saved Snapshot' + bcolors.ENDC)
         
 
+    def save_months(self, delegates, first_date):
+        """ Saves a snapshot of the months of open transactions (as they were read) to the snapshot file used by revert()"""
+        ranges = [[delegate.location, delegate.calendar_cache.original] for delegate in delegates]
+        snapshot = {
+            'location': ranges[0][0],
+            'month': first_date.month,
+            'day': first_date.day,
+            'year': first_date.year,
+            'day_rows': ranges[0][1],
+            'ranges': ranges
+        }
+
+        if not os.path.exists(self.config_dir):
+            os.makedirs(self.config_dir)
+
+        with open(f'{self.config_dir}/last_snapshot.json', 'w+') as writer:
+            json.dump(snapshot, writer)
+
+        print(bcolors.OKBLUE + f'Saved Snapshot of {len(ranges)} month(s)' + bcolors.ENDC)
+
+
     def revert(self):
         snapshot_fn = f'{self.config_dir}/last_snapshot.json'
         if os.path.exists(snapshot_fn):
             with open(snapshot_fn) as rdr:
                 snapshot = json.load(rdr)
 
-            self.gcal.update_values(snapshot['location'], "USER_ENTERED", snapshot['day_rows'])
+            if 'ranges' in snapshot and self.gcal.supports_batch_writes:
+                # Snapshot of whole months (see apply_changes)
+                self.gcal.batch_update_values([tuple(snapshot_range) for snapshot_range in snapshot['ranges']], "USER_ENTERED")
+            else:
+                self.gcal.update_values(snapshot['location'], "USER_ENTERED", snapshot['day_rows'])
             print(bcolors.OKGREEN + 'Reverted' + bcolors.ENDC)
 
 
@@ -365,6 +660,16 @@ class CollabCalendarManager:
         ## Returns:
         * Nothing
         """
+        self.audit_log.append(self.to_audit_rows(target_date, changes))
+        if self.write_buffer is None:
+            # Not batching writes, so the audit goes out now as well
+            self.audit_log.flush()
+
+
+    def to_audit_rows(self, target_date, changes: list):
+        """
+        The Audit tab rows for the changes made to target_date (see audit_changes)
+        """
         new_audit_rows = []
         for _change in changes:
             change: ModifyShiftRequest = _change
@@ -386,7 +691,7 @@ class CollabCalendarManager:
             ]
             new_audit_rows.append(row)
 
-        self.gcal.append_to_audit_rows(new_audit_rows)
+        return new_audit_rows
        
 
 
@@ -422,6 +727,7 @@ class CollabCalendarManager:
 
         day_shifts = self.gcal.get_day_from_calendar(target_date)
         shifts = google_to_shifts(day_shifts, target_date)
+        old_tally = self.day_tally(shifts)
 
         for _change in tangos:
             change: ModifyShiftRequest = _change
@@ -437,7 +743,8 @@ class CollabCalendarManager:
                 print(f'Request for tango: {change} Squad is not in slot: {slot}')
 
         formatted_rows = shifts_to_google(shifts)
-        self.gcal.write_day_to_calendar(target_date, formatted_rows)
+        result = self.write_day_to_calendar(target_date, formatted_rows, self.update_tally(target_date, old_tally, self.day_tally(shifts)))
+        self.commit_tally(self.is_written(result), [get_layout(target_date).tab_name])
 
 
     def populate_day_headers(self, target_tab):
@@ -568,12 +875,19 @@ class CollabCalendarManager:
         shift_days = defaultdict(list)
         tango_hours = {34:0, 35:0, 42:0, 43:0, 54:0}
         days = []
-        for day in range(1, relative_days):
-            curr_date = target_date.replace(day=day)
+        try:
+            calendar_days = self.get_range(target_date.replace(day=1), target_date.replace(day=relative_days - 1)) \
+                if relative_days > 1 else []
+        except Exception:
+            traceback.print_exc()
+            print(f'{bcolors.FAIL} Problem reading the month -- exiting {bcolors.ENDC}')
+            sys.exit()
+
+        for calendar_day in calendar_days:
+            day = calendar_day.target_date.day
             print(f'{bcolors.OKBLUE} Processing day: {day} {bcolors.ENDC}')
-            day_rows = self.gcal.get_day_from_calendar(curr_date)
             try:
-                day_shifts = google_to_shifts(day_rows, curr_date)
+                day_shifts = calendar_day.slots
                 days.append(day_shifts)
 
                 for _shift in day_shifts:
@@ -596,9 +910,127 @@ class CollabCalendarManager:
                 sys.exit()
 
         self.save_day_snapshot(snapshot_file, days)
+        if self.tally_ledger is not None and relative_days > monthrange(target_date.year, target_date.month)[1]:
+            tab = get_layout(target_date).tab_name
+            self.tally_ledger.reset_month(tab, hours_by_squad, tango_hours, self.get_month_key(tab))
+            self.tally_seeded[tab] = self.get_month_load(tab)
+            self.save_tally_ledger()
         return (hours_by_squad, tango_hours, calendar_warnings)   
 
 
+    def day_tally(self, shifts):
+        """
+        (hours_by_squad, tango_hours) of one day, see tally_ledger.tally_day
+        """
+        return tally_day(shifts, self.calculate_slot_hours)
+
+
+    def seed_tally(self, tab, calendar_days=None):
+        """
+        Make sure the ledger has the totals of the month as it is in the sheet: the month is tallied (calendar_days, or
+        the cached month) if the ledger doesn't have it, or if the month was read from the sheet since it was seeded
+        and is not the month the totals were tallied from (it may have been edited by hand or from another machine)
+        """
+        tab = str(tab)
+        if self.tally_ledger is None:
+            return
+        if self.tally_ledger.has_month(tab):
+            if self.tally_seeded.get(tab) == self.get_month_load(tab):
+                return
+            # Read again (or saved by an earlier run): the totals still hold if the month didn't change
+            month_key = self.get_month_key(tab)
+            if month_key is not None and month_key == self.tally_ledger.get_month_key(tab):
+                self.tally_seeded[tab] = self.get_month_load(tab)
+                return
+        hours_by_squad = defaultdict(int)
+        tango_hours = defaultdict(int)
+        for calendar_day in calendar_days if calendar_days is not None else self.get_month(tab):
+            day_hours, day_tango = self.day_tally(calendar_day.slots)
+            for squad, hours in day_hours.items():
+                hours_by_squad[squad] += hours
+            for squad, hours in day_tango.items():
+                tango_hours[squad] += hours
+        self.tally_ledger.reset_month(tab, hours_by_squad, tango_hours, self.get_month_key(tab))
+        self.tally_seeded[tab] = self.get_month_load(tab)
+
+
+    def get_month_load(self, tab):
+        """
+        See CachedGCal.get_month_load (None for a calendar that doesn't cache months)
+        """
+        return self.gcal.get_month_load(tab) if isinstance(self.gcal, CachedGCal) else None
+
+
+    def get_month_key(self, tab, read=True):
+        """
+        See CachedGCal.get_month_key (None for a calendar that doesn't cache months)
+        """
+        return self.gcal.get_month_key(tab, read) if isinstance(self.gcal, CachedGCal) else None
+
+
+    def update_tally(self, target_date, old_tally, new_tally, seed=True):
+        """Apply the change of a day to the tally ledger (saved by commit_tally once the day is written)
+
+        ## Parameters:
+        * old_tally, new_tally: day_tally of the day before and after the change
+        * seed: seed the month first if needed (see seed_tally).  False when the month was seeded before the edit
+          started, so that changes not written yet are not lost to a new read of the month
+
+        ## Returns:
+        * the tally rows of the month to write with the day (see get_tally_ranges)
+        """
+        if self.tally_ledger is None:
+            return []
+        tab = get_layout(target_date).tab_name
+        # Tallied before the change is written, so that a month seeded here doesn't count it twice
+        if seed:
+            self.seed_tally(tab)
+        self.tally_ledger.apply_day(tab, old_tally, new_tally)
+        return self.get_tally_ranges(tab)
+
+
+    def get_tally_ranges(self, tab):
+        """
+        ## Returns:
+        * [(HOURS_COMMITTED location, rows), (TANGO_HOURS location, rows)] of the tab, from the ledger
+          (empty if the ledger doesn't have the month)
+        """
+        if self.tally_ledger is None or not self.tally_ledger.has_month(tab):
+            return []
+        hours_row, tango_row = self.tally_ledger.get_rows(tab)
+        return [(f'{tab}!{self.gcal.HOURS_COMMITTED}', [hours_row]), (f'{tab}!{self.gcal.TANGO_HOURS}', [tango_row])]
+
+
+    def save_tally_ledger(self):
+        if self.tally_ledger is not None:
+            self.tally_ledger.save()
+
+
+    def commit_tally(self, written, tabs):
+        """After the days of an edit (and their tally rows) were sent
+
+        ## Parameters:
+        * written: the writes went through.  The ledger is saved, with the key of the months as they are now (the
+          cached months have the writes)
+          Otherwise the sheet has the old totals (or part of the edit): the ledger goes back to what was saved and the
+          months are dropped from it, to be seeded again from the sheet on their next edit
+        * tabs: the months of the edit
+        """
+        if self.tally_ledger is None or self.write_buffer is not None:
+            # In a write batch: committed once it is flushed
+            return
+        if not written:
+            print(f'{bcolors.FAIL}The write failed, the tallies of {", ".join(tabs)} will be read again from the sheet{bcolors.ENDC}')
+            self.tally_ledger.load()
+            for tab in tabs:
+                self.tally_ledger.drop_month(str(tab))
+                self.tally_seeded.pop(str(tab), None)
+        else:
+            for tab in tabs:
+                self.tally_ledger.set_month_key(str(tab), self.get_month_key(tab, read=False))
+        self.tally_ledger.save()
+
+
     def save_tally(self, shift_hours, tango_hours, is_actual):
 
         keys = sorted(shift_hours.keys())
@@ -655,33 +1087,37 @@ class CollabCalendarManager:
         Nada 
         """
         self.capture_month(target_tab)
-
-        for day in range(1, monthrange(target_date.year, target_date.month)[1]+1):
-            # Throttle the requests to the calendar to avoid rate limiting
-            if day % 5 == 0:
-                # Sleep for 5 seconds
-                time.sleep(5)
-                
-            target_date = target_date.replace(day=day)
-            print(f'*** Assigning tango to day: {day}')
-            day_rows = self.gcal.get_day_from_calendar(target_date)
-            print(f'Got day rows: {day_rows}')
-            day_shifts = google_to_shifts(day_rows, target_date)
-            is_modified = False
-            for _shift in day_shifts:
-                shift: SchedDate = _shift
-                if shift.tango is None:
-                    shift_hours = self.calculate_slot_hours(shift.slot)
-                    new_tango_squad = self.find_squad_with_least_tango(tango_hours, shift.squads)
-                    shift.tango = new_tango_squad
-                    tango_hours[shift.tango] = tango_hours[shift.tango] + shift_hours
-                    is_modified = True
-
-            if is_modified:
-                #  Write the day back to the calendar
-                formatted_rows = shifts_to_google(day_shifts)
-                self.gcal.write_day_to_calendar(target_date, formatted_rows)
-
+        # The days are sent to the calendar together when the month is done (nothing is sent if it fails half way)
+        try:
+            with self.write_batch() as write_buffer:
+                # The whole month is read (and parsed) once.  No need to throttle the writes: GCal requests wait for
+                # the quota (and retry 429s) in the RateLimiter
+                calendar_days = self.get_month(target_tab)
+                self.seed_tally(target_tab, calendar_days)
+                old_tallies = [self.day_tally(calendar_day.slots) for calendar_day in calendar_days]
+
+                # All the slots of the month are assigned at once (the squad on duty with the least tango hours gets
+                # the slot)
+                allocator = TangoAllocator(tango_hours, slot_hours=self.calculate_slot_hours, fill_empty=True)
+                assigned = {id(shift) for shift in allocator.allocate(calendar_days)}
+                for shift in allocator.empty_slots:
+                    print(f'{bcolors.FAIL}No squads on duty! {shift.target_date.strftime("%m/%d/%Y")} {shift.slot}{bcolors.ENDC}')
+                tango_hours.update(allocator.tango_hours)
+
+                for calendar_day, old_tally in zip(calendar_days, old_tallies):
+                    if any(id(shift) in assigned for shift in calendar_day.slots):
+                        #  Write the day back to the calendar (the tally rows are only sent once, with the last change)
+                        target_date = calendar_day.target_date
+                        print(f'*** Assigned tango(s) on day: {target_date.day}')
+                        formatted_rows = shifts_to_google(calendar_day.slots)
+                        tally_ranges = self.update_tally(target_date, old_tally, self.day_tally(calendar_day.slots))
+                        self.write_day_to_calendar(target_date, formatted_rows, tally_ranges)
+
+                print(allocator.fairness_report())
+        except Exception:
+            self.commit_tally(False, [str(target_tab)])
+            raise
+        self.commit_tally(write_buffer is None or write_buffer.failed_requests == 0, [str(target_tab)])
         return tango_hours
 
 
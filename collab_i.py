@@ -10,7 +10,6 @@ This is an interactive terminal client to the Collaborative Calendar utility
 import argparse
 import calendar
 from dataclasses import dataclass
-from simple_term_menu import TerminalMenu
 from bcolors import bcolors
 import os
 import sys
@@ -22,7 +21,9 @@ from collab_cal_mgr import CollabCalendarManager
 from calendar_slot_utils import split_timeslot
 from datetime import datetime
 from calendar import monthrange
+from collections import defaultdict
 from test.src.decorators.shift_testing_capture import shift_testing_capture
+from utils.territory_utils import get_territory_manager
 
 collab_cal_manager: CollabCalendarManager = None
 current_tab: str = None
@@ -34,6 +35,7 @@ target_tab = None
 args = None
 
 def prompt_menu(title, options):
+    from simple_term_menu import TerminalMenu
     terminal_menu = TerminalMenu(title=title, menu_entries= options)
     menu_entry_index = terminal_menu.show()
     selection = options[menu_entry_index]
@@ -43,6 +45,7 @@ def prompt_menu(title, options):
 
 
 def prompt_menu_multiselect(title, options, show_multi_select_hint=False):
+    from simple_term_menu import TerminalMenu
     terminal_menu = TerminalMenu(title=title, menu_entries= options, 
                                  multi_select=True,
                                  show_multi_select_hint=show_multi_select_hint)
@@ -146,11 +149,6 @@ def build_calendar():
     For each SchedDate, create a ModifyShiftRequest object for each squad in the SchedDate
     """
     for day in range(1, monthrange(target_date.year, target_date.month)[1] + 1):
-        # Throttle the calls so that we don't blow out the API
-        if day % 10 == 0:
-            # Sleep for 5 seconds
-            time.sleep(5)
-
         shifts_for_day = collab_cal_manager.get_day_from_master(target_date.replace(day=day))
         slot_squads = []
         for _sched_date in shifts_for_day:
@@ -293,11 +291,12 @@ def tally_shifts(target_date=None, save_tally=False):
     if tally_to_date:
         rel_date_val = input(f'Enter relative date [1 - {last_day_of_month}] (Default: {datetime.now().strftime("%d")}) ')
         if rel_date_val == '':
-            relative_days = datetime.now().strftime("%d")
+            relative_days = int(datetime.now().strftime("%d"))
         else:
             relative_days = int(rel_date_val)
     else:
-        relative_days = last_day_of_month
+        # tally_shifts counts the days before relative_days
+        relative_days = last_day_of_month + 1
 
 
     current_time_millis = int(round(time.time() * 1000))
@@ -348,28 +347,20 @@ def read_territory_map():
     """
 
     territory_map = collab_cal_manager.read_territory_map()
-    for key, value in territory_map.items():
-        num_in_key = len(key.split(','))
-        all_terr = []
-        for terr in value.values():
-            all_terr.extend(terr)
-        if len(set(all_terr)) != 5:
-            print(f'Total territories do not sum to 5! {key}')
-            sys.exit()
+    try:
+        # Validated (and compiled for to_squad_shifts) once, here
+        territory_manager = get_territory_manager(territory_map)
+    except ValueError as e:
+        print(e)
+        sys.exit()
 
-        for squad, covering in value.items():
-            # Squad should always cover themselves
-            if squad not in covering:
-                print(f'For key: {key}, squad: {squad} not covering themselves')
-                sys.exit()
-            # If key is only 2 squads, the one with 2 cannot be 42 (unless they are 42)
-            if num_in_key == 2 and '42' not in key and len(covering) == 2 and 42 in covering:
-                print(f'{bcolors.WARNING}Squad {squad} only covering itself and 42') 
-                r = input('Do you want to fix this? [y/n] ')
-                if r.lower() == 'y':
-                    sys.exit()
+    for warning in territory_manager.warnings:
+        print(f'{bcolors.WARNING}{warning}{bcolors.ENDC}')
+        r = input('Do you want to fix this? [y/n] ')
+        if r.lower() == 'y':
+            sys.exit()
 
-        return territory_map
+    return territory_map
 
 
 def quick_test():
@@ -425,63 +416,70 @@ def select_target_tab(specified_date=None):
     selected_tab = prompt_menu('Select target tab: ', tabs)
     return selected_tab
 
+def parse_bulk_changes(lines):
+    """
+    Parse bulk add/remove lines:  Action,Date,Timeslot,Squad,Audit
+    Example: +,4/28/2024,600-1800,42,[GroupMe] Javier informed 4/24@10:00
+
+    The [source] at the start of the audit text is the requested by, the rest is the reason.
+    Blank lines and lines starting with # are skipped
+
+    ## Returns
+    changes_by_date (dict): key = date, value = list of ModifyShiftRequest
+    """
+    changes_by_date = defaultdict(list)
+    for line_num, line in enumerate(lines, start=1):
+        if len(line.strip()) == 0 or line.strip().startswith('#'):
+            continue
+
+        fields = [field.strip() for field in line.split(',', 4)]
+        if len(fields) < 4 or fields[0] not in ['+', '-']:
+            raise Exception(f'Line {line_num}: expected: [+/-],date,start-end,squad[,audit] got: {line.strip()}')
+
+        action, change_date, timeslot, squad = fields[0:4]
+        audit = fields[4] if len(fields) > 4 else ''
+        if '[' in squad:
+            print(f'{bcolors.WARNING}Line {line_num}: territories are taken from the territory map, ignoring: {squad}{bcolors.ENDC}')
+            squad = squad.split('[')[0]
+
+        match = re.match(r'^\[(.+?)\]\s*(.*)$', audit)
+        requested_by, reason = (match.group(1), match.group(2)) if match else ('', audit)
+        start, end = split_timeslot(timeslot)
+        options = ModifyOptions(is_add=(action == '+'), requested_by=requested_by, reason=reason)
+        changes_by_date[datetime.strptime(change_date, '%m/%d/%Y')].append(ModifyShiftRequest(start, end, int(squad), None, options))
+
+    return changes_by_date
+
+
 def bulk_add_remove():
-    pass
-    # os.system('clear')
-    # print(f'{bcolors.OKGREEN}Bulk Add/Remove{bcolors.ENDC}')
-    # print(f'{bcolors.OKGREEN}Action: [+/-], Date: 4/28/2024, Timeslot: 600-1800, Squad with optional territories: 42[35/43], Audit: [GroupMe] Javier informed{bcolors.ENDC}')
-    # print(f'{bcolors.OKBLUE}Examples:{bcolors.ENDC}')
-    # print(f'{bcolors.OKBLUE}+,4/28/2024,600-1800,42[42],[GroupMe] Javier informed 4/24@10:00{bcolors.ENDC}')
-    # print(f'{bcolors.OKBLUE}-,4/30/2024,600-1800,34,[GroupMe] No Crew{bcolors.ENDC}')
-    # print(f'{bcolors.OKGREEN}----------------{bcolors.ENDC}')
-    # target_date = get_target_date()
-    # sched_dates = collab_cal_manager.get_day_from_calendar(target_date)
-    # timeslots = []
-    # for _sched_date in sched_dates:
-    #     sched_date: SchedDate = _sched_date
-
-    #     timeslots.append(sched_date.slot)
-    #     shift_str = ''
-    #     for _squad_shift in sched_date.squads:
-    #         squad_shift: SquadShift = _squad_shift
-    #         shift_str += f'{bcolors.REVGREEN}{squad_shift.squad}{bcolors.ENDC} '
-    #         shift_str += f'{bcolors.OKGREEN}'
-    #         if squad_shift.number_of_trucks > 1:
-    #             shift_str += f' (Trucks: {squad_shift.number_of_trucks})'
-    #         shift_str += str(squad_shift.squad_covering)
-    #         shift_str += '; '
-
-    #     print(f'{bcolors.OKGREEN}{sched_date.slot}{bcolors.ENDC} Tango: {bcolors.OKGREEN}{sched_date.tango} {shift_str} {bcolors.ENDC}')
-
-    # print('')
-    # slot_sel = prompt_menu('Select timeslot: ', timeslots+['Custom'])
-    # start = 0
-    # end = 0
-
-    # if slot_sel == 'Custom':
-    #     start = int(input('Start time: eg: 600: '))
-    #     end = int(input('End time: eg: 1800: '))
-    # else:
-    #     start = int(slot_sel.split('-')[0])
-    #     end = int(slot_sel.split('-')[1])
-
-    # squad_sel = int(prompt_menu('Squad? ', ['34', '35', '42', '43', '54']))
-    # print(f'Going to {action} squad: {squad_sel} to slot: {slot_sel}')
-
-    # if (is_audit):
-    #     request_source = prompt_menu('Request source: ', ['[g] GroupMe', '[t] Text', '[e] Email', '[o] Other'])
-    #     if request_source == 'Other':
-    #         request_source = input('Enter source: ')
-
-    #     reason = input('Reason: ')
-
-    #     options.requested_by = request_source or ''
-    #     options.reason = reason or ''
-
-    # changes = []
-    # changes.append(ModifyShiftRequest(start, end, squad_sel, 77, options))
-    # collab_cal_manager.add_remove_shifts(target_date, changes, territory_map, is_audited=is_audit,
-    #     prompt
+    os.system('clear')
+    print(f'{bcolors.OKGREEN}Bulk Add/Remove{bcolors.ENDC}')
+    print(f'{bcolors.OKGREEN}Action: [+/-], Date: 4/28/2024, Timeslot: 600-1800, Squad: 42, Audit: [GroupMe] Javier informed{bcolors.ENDC}')
+    print(f'{bcolors.OKBLUE}Examples:{bcolors.ENDC}')
+    print(f'{bcolors.OKBLUE}+,4/28/2024,600-1800,42,[GroupMe] Javier informed 4/24@10:00{bcolors.ENDC}')
+    print(f'{bcolors.OKBLUE}-,4/30/2024,600-1800,34,[GroupMe] No Crew{bcolors.ENDC}')
+    print(f'{bcolors.OKGREEN}----------------{bcolors.ENDC}')
+
+    csv_file = os.path.expanduser(input('CSV file with the changes: ').strip())
+    with open(csv_file, 'r') as reader:
+        changes_by_date = parse_bulk_changes(reader.readlines())
+
+    for change_date in sorted(changes_by_date.keys()):
+        for _change in changes_by_date[change_date]:
+            change: ModifyShiftRequest = _change
+            action = 'Add' if change.modify_options.is_add else 'No Crew'
+            print(f'{bcolors.OKGREEN}{change_date.strftime("%m/%d/%Y")}{bcolors.ENDC} {action} {change.squad} '
+                  f'{change.start_time:04d} - {change.end_time:04d} {change.modify_options.requested_by} {change.modify_options.reason}')
+
+    if not prompt_confirm(f'Apply {sum(len(changes) for changes in changes_by_date.values())} change(s) to {len(changes_by_date)} day(s)?'):
+        return
+
+    days_changed = collab_cal_manager.apply_changes(changes_by_date, territory_map, prompt_method=prompt_tango_method)
+    if days_changed < len(changes_by_date):
+        print(f'{bcolors.FAIL}Changed {days_changed} of {len(changes_by_date)} day(s).  Check the calendar and try again{bcolors.ENDC}')
+    else:
+        print(f'{bcolors.OKGREEN}Changed {days_changed} day(s){bcolors.ENDC}')
+
 
 def get_selected_weekdays_for_month(target_month, selected_weekdays):
     """
@@ -690,6 +688,7 @@ def main(environment=None, target_date=None):
         environment = prompt_for_environment()
 
     collab_cal_manager = CollabCalendarManager(environment, config_dir)
+    collab_cal_manager.load_reference_data()
     target_tab = select_target_tab(target_date)
     collab_cal_manager.set_calendar_tab(target_tab)   
     territory_map = read_territory_map()
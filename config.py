@@ -39,6 +39,54 @@ CALENDAR_COLS = 4       # 4 columns per day
 CALENDAR_OFFSET = 5     # Calendar starts on the 6th row
 CALENDAR_MONTH_BOUNDARIES = 'B6:AC65'
 
+# -------------------------------------------
+# Calendar cache
+CALENDAR_CACHE_TTL = 300    # Seconds a month read by CachedGCal is served before it is read again
+WRITE_BATCH_SIZE = 50       # Ranges a WriteBehindBuffer holds before it flushes on its own
+TRANSACTION_DIFF_ONLY = True    # CalendarDelegate.end_transaction only writes cells whose value changed
+CELL_PARSER_CACHE_SIZE = 1024   # Distinct calendar cells cell_parser keeps parsed (LRU)
+WARM_CACHE_DIR = 'warm_cache'   # Months and reference data kept between runs (in the config dir).  None = always start cold
+TALLY_LEDGER_DIR = 'tally_ledger'   # Running hour / tango totals of each month (in the config dir).  None = no ledger
+
+# -------------------------------------------
+# Sheets API quota (RateLimiter) and concurrency (AsyncGCal)
+SHEETS_MAX_CONCURRENCY = 4      # Requests in flight at the same time
+SHEETS_REQUESTS_PER_MINUTE = 60 # Sheets read quota is 60 requests / minute / user
+SHEETS_REQUEST_BURST = 10       # Requests that may be sent back to back before pacing kicks in
+SHEETS_MAX_RETRIES = 5          # Retries of a request that got a 429 or 5xx
+SHEETS_BACKOFF_BASE = 1.0       # Seconds.  Backoff before retry n is random up to base * 2^n
+SHEETS_BACKOFF_MAX = 32.0       # Seconds.  Longest backoff between retries
+
+
+# -------------------------------------------
+# Audit log
+AUDIT_BATCH_SIZE = 50           # Audit rows held before they are appended to the Audit tab on their own
+AUDIT_LOG_FILE = 'audit_log.jsonl'  # Local copy of the audit rows (in the config dir).  None = no local copy
+
+
+# -------------------------------------------
+# Shift engine used by add_remove_shifts
+# 'matrix' = DayMatrix (whole hours), 'intervals' = IntervalDay (to the minute, eg: 0630 handovers)
+SHIFT_ENGINE = 'matrix'
+
+
+# -------------------------------------------
+# Email (Notifier)
+SMTP_HOST = 'smtp.mail.yahoo.com'
+SMTP_PORT = 465                 # SSL
+SMTP_TIMEOUT = 30               # Seconds
+SMTP_WORKERS = 2                # Emails of a batch sent at the same time (one SMTP session each).  1 = one after the other
+SMTP_MAX_RETRIES = 2            # Reconnects of a dropped session, per email
+EMAIL_LOG_RETENTION_DAYS = 400  # Sent emails kept in the send log (send_log.py).  None = keep all
+OUTBOX_MAX_ATTEMPTS = 5         # Times an email of the outbox (outbox.py) is tried before giving up
+OUTBOX_RETRY_DELAY = 30         # Seconds before trying a failed email again (doubled after each failure)
+OUTBOX_POLL_INTERVAL = 60       # Seconds between looks at the outbox by the background worker
+OUTBOX_DRAIN_TIMEOUT = 120      # Seconds crew_notifier waits for the outbox to be sent.  What is left goes with the next run
+NOTIFICATION_SNAPSHOT_FILE = 'notified_shifts.json'   # Shifts in the last email to each squad (in the Notifier log directory)
+NOTIFIER_SCHEDULE = '*/15 6-21 * * *'   # crew_notifier --daemon: when to look for changes (cron: minute hour day month weekday)
+NOTIFIER_STATUS_FILE = 'notifier_status.json'   # crew_notifier --daemon health (in the Notifier log directory)
+NOTIFIER_HEARTBEAT = 60         # Seconds between updates of the status file while waiting
+
 
 # -------------------------------------------
 # All Squads
@@ -1,12 +1,20 @@
 import argparse
 import datetime
+import json
 import os
+import signal
+import threading
+import traceback
 from utils import shift_collapse
 from bcolors import bcolors
 from collab_cal_mgr import CollabCalendarManager
 from models import SchedDate, SquadShift
 from email_templates import shift_template_text, shift_template_html
-from email_manager import Notifier
+from email_manager import Notifier, OutgoingEmail
+from outbox import Outbox, OutboxWorker, PENDING
+from cron_schedule import CronSchedule
+from notification_snapshot import NotificationSnapshots, SnapshotDiff, diff_snapshots, take_snapshot
+import config
 
 
 shift_util = shift_collapse.ShiftUtils()
@@ -16,8 +24,12 @@ contacts = None
 args = None
 target_date = None
 
-email_manager = Notifier('/Users/georgenowakowski/Downloads/collab_config/sent_mail_log', 
-                         '/Users/georgenowakowski/Downloads/collab_config/contacts.json')
+email_manager = None
+outbox = None
+outbox_worker = None
+notification_snapshots = None
+stop_event = threading.Event()
+daemon_status = {}
 squad_map = {34: 'Green Knoll Rescue Squad', 35: 'Finderne Rescue Squad', 42: 'Manville Rescue Squad', 43: 'Martinsville Rescue Squad', 54: 'Somerville Rescue Squad'}
 
 table_style = "border-collapse:collapse; margin:25px 0; font-size:0.9em; font-family:sans-serif; min-width:400px; box-shadow:0 0 20px rgba(0, 0, 0, 0.15)"
@@ -28,6 +40,8 @@ tr_body_style_odd = "border-bottom: 1px solid black;background-color: #9FE2BF"
 td_body_style = "padding:12px 15px; text-align:center;border-right: 1px solid gray;"
 last_td_body_style = "padding:12px 15px; text-align:center"
 
+digest_subject = 'Somerset County EMS Collaborative - Upcoming Shifts Notification Digest'
+
 # test_to_email = 'gnowakowski@gmail.com,gmn314@yahoo.com'
 test_to_email = 'gmn314@yahoo.com, gnowakowski@gmail.com'
 
@@ -35,9 +49,21 @@ test_to_email = 'gmn314@yahoo.com, gnowakowski@gmail.com'
 def init():
     global collab_cal_manager
     global contacts
+    global email_manager
+    global outbox
+    global outbox_worker
+    global notification_snapshots
+
+    email_manager = Notifier('/Users/georgenowakowski/Downloads/collab_config/sent_mail_log', 
+                             '/Users/georgenowakowski/Downloads/collab_config/contacts.json')
+    outbox = Outbox(email_manager.log_status_path)
+    notification_snapshots = NotificationSnapshots(f'{email_manager.log_status_path}/{config.NOTIFICATION_SNAPSHOT_FILE}')
+    # A squad is up to date once its email is sent
+    outbox_worker = OutboxWorker(outbox, email_manager, on_sent=notification_snapshots.record_sent)
 
     collab_cal_manager = CollabCalendarManager(args.environment, 
                                                '/Users/georgenowakowski/Downloads/collab_config')
+    collab_cal_manager.load_reference_data(include_template=False)
     contacts = collab_cal_manager.read_contacts()
 
     collab_cal_manager.set_calendar_tab(target_date.strftime('%B %Y'))   
@@ -45,18 +71,16 @@ def init():
 
 def get_upcoming_shifts():
 
-    # iterate over the next notify_interval days
-    # get the shifts for each day
-
-    upcoming_shifts = []
-    for day in range(notify_interval):
-        process_date = target_date + datetime.timedelta(days=day)
-        upcoming_shifts.append(collab_cal_manager.get_day_from_calendar(process_date))
+    # The next notify_interval days, read with one request (the window may run into next month's tab).  The days of
+    # both months are in date order, so each squad's shifts run on across the end of the month.  If next month's tab
+    # doesn't exist yet, its days are left out rather than failing the run
+    last_date = target_date + datetime.timedelta(days=notify_interval - 1)
+    upcoming_days = collab_cal_manager.get_range(target_date, last_date, existing_tabs_only=True)
 
     shifts_by_squad = {}
     tango_by_squad = {}
-    for day in upcoming_shifts:
-        for _sched_date in day:
+    for calendar_day in upcoming_days:
+        for _sched_date in calendar_day.slots:
             sched_date: SchedDate = _sched_date
             for _squad_shift in sched_date.squads:
                 squad_shift: SquadShift = _squad_shift
@@ -104,12 +128,34 @@ squads = [34, 35, 42, 43, 54]
 
 none_table = """ <H1>None</H1>"""
 
-def format_emails(shifts_by_squad, tangos_by_squad):
+def get_changes(shifts_by_squad, tangos_by_squad):
+    """
+    Compare each squad's upcoming shifts and tangos with the ones in its last email
+    ## Returns
+    (changes_by_squad, snapshot_by_squad): key = squad, values = SnapshotDiff, take_snapshot
+    """
+    changes_by_squad = {}
+    snapshot_by_squad = {}
+    for squad in squads:
+        snapshot = take_snapshot(shifts_by_squad.get(squad, []), tangos_by_squad.get(squad, []))
+        snapshot_by_squad[squad] = snapshot
+        changes_by_squad[squad] = diff_snapshots(notification_snapshots.get(squad), snapshot, target_date)
+    return changes_by_squad, snapshot_by_squad
+
+
+def format_emails(shifts_by_squad, tangos_by_squad, changes_by_squad=None, notify_squads=None):
+    """
+    ## Parameters
+    * changes_by_squad: SnapshotDiff by squad, listed at the top of the email (None = no changes listed)
+    * notify_squads: the squads to format (None = every squad with shifts or tangos)
+    """
 
     formatted_by_squad = {} 
 
     for squad in squads:
-        if squad in shifts_by_squad or squad in tangos_by_squad:
+        if notify_squads is not None and squad not in notify_squads:
+            continue
+        if squad in shifts_by_squad or squad in tangos_by_squad or notify_squads is not None:
             shift_string = 'Upcoming Shifts:\n'
             html_shift_string = '<h2>Upcoming Shifts:</h2>'
 
@@ -144,8 +190,9 @@ def format_emails(shifts_by_squad, tangos_by_squad):
 
                 html_tango_string += build_table(['Date', 'Hours', 'Tango'], tango_rows)
 
-            formatted_by_squad[squad] = (shift_template_text.substitute(squad=squad_map[squad], shifts=shift_string, tangos=tango_string),
-                                        shift_template_html.substitute(squad=squad_map[squad], shifts=html_shift_string, tangos=html_tango_string))
+            changes = SnapshotDiff() if changes_by_squad is None else changes_by_squad[squad]
+            formatted_by_squad[squad] = (shift_template_text.substitute(squad=squad_map[squad], changes=changes.summary_text(), shifts=shift_string, tangos=tango_string),
+                                        shift_template_html.substitute(squad=squad_map[squad], changes=changes.summary_html(), shifts=html_shift_string, tangos=html_tango_string))
 
     return formatted_by_squad
 
@@ -167,29 +214,61 @@ def send_digest(date_sent, email_log):
     digest_html += '</table>'
     digest_html += '</body></html>'
 
-    email_manager.send_email(subject='Somerset County EMS Collaborative - Upcoming Shifts Notification Digest', 
-                             to_email='gmn314@yahoo.com', body_html=digest_html, 
-                             body_text=digest_text, bcc_email=None, cc_email=None)
+    # After the crew emails
+    outbox.enqueue(OutgoingEmail(subject=digest_subject, 
+                                 to_email='gmn314@yahoo.com', body_html=digest_html, 
+                                 body_text=digest_text, bcc_email=None, cc_email=None), priority=1)
 
 
 def notify_crews():
     upcoming_shifts, tangos = get_upcoming_shifts()
-    email_body_by_squad = format_emails(upcoming_shifts, tangos)
 
+    # Only the squads whose shifts changed since their last email
+    changes_by_squad, snapshot_by_squad = get_changes(upcoming_shifts, tangos)
+    if args.force_notification:
+        notify_squads = [squad for squad in squads if squad in upcoming_shifts or squad in tangos or not changes_by_squad[squad].is_empty()]
+    else:
+        notify_squads = [squad for squad in squads if not changes_by_squad[squad].is_empty()]
+    print(f'Squads with changes: {notify_squads}')
+    email_body_by_squad = format_emails(upcoming_shifts, tangos, changes_by_squad, notify_squads)
+
+    queued = 0
     for squad in email_body_by_squad.keys():
         contacts_for_squad = contacts[str(squad)]
-        send_email(contacts_for_squad.to_list, 
-                                      contacts_for_squad.cc_list, 
-                                      email_body_by_squad[squad] )
-
-
-    send_date = datetime.datetime.now()
-    email_log = email_manager.get_email_log(send_date)        
-    send_digest(send_date, email_log)
+        email = build_email(contacts_for_squad.to_list, 
+                            contacts_for_squad.cc_list, 
+                            email_body_by_squad[squad])
+        # The snapshot is kept once the email is sent (see OutboxWorker.on_sent).  Test emails don't count
+        snapshot = snapshot_by_squad[squad] if not args.to_test_email else None
+        if outbox.enqueue(email, squad=squad, snapshot=snapshot):
+            queued += 1
+        else:
+            print(f'{bcolors.WARNING}Email to {email.to_email} already queued today{bcolors.ENDC}')
+
+    if args.enqueue_only:
+        print(f'Queued {outbox.count()} emails in {outbox.db_file}')
+        return
+
+    # Sent in the background (with retries); what is not sent by the timeout stays queued for the next run
+    outbox_worker.start()
+    outbox_worker.notify()
+    # The digest lists the crew emails sent today, so only when this pass queued some (not the digests already sent)
+    if outbox_worker.wait_until_empty(config.OUTBOX_DRAIN_TIMEOUT) and queued > 0:
+        send_date = datetime.datetime.now()
+        email_log = email_manager.get_email_log(send_date, exclude_subject=digest_subject)
+        if email_log is not None:
+            send_digest(send_date, email_log)
+            outbox_worker.notify()
+            outbox_worker.wait_until_empty(config.OUTBOX_DRAIN_TIMEOUT)
+    if not args.daemon:
+        outbox_worker.stop()
+
+    for _email_id, queue_date, to_email, _subject, attempts, last_error in outbox.get_entries(PENDING):
+        print(f'{bcolors.WARNING}Still queued: {to_email} ({attempts} attempts, {last_error}){bcolors.ENDC}')
         
 
-def send_email(_to_list, _cc_list, body):
-    print(f'send_email called with to_list: {_to_list} and cc_list: {_cc_list}')
+def build_email(_to_list, _cc_list, body) -> OutgoingEmail:
+    print(f'build_email called with to_list: {_to_list} and cc_list: {_cc_list}')
     if args.to_test_email:
         to_list = test_to_email
         cc_list = None
@@ -197,10 +276,81 @@ def send_email(_to_list, _cc_list, body):
     else:
         to_list = _to_list
         cc_list = _cc_list
-        print(f'Sent email to: {to_list}')
+        print(f'Sending email to: {to_list}')
     
 
-    email_manager.send_email('Somerset County EMS Collaborative - Upcoming Shifts Notification', body[0], body[1], to_list, cc_list)
+    return OutgoingEmail('Somerset County EMS Collaborative - Upcoming Shifts Notification', body[0], body[1], to_list, cc_list)
+
+
+def run_pass():
+    """
+    One pass of the daemon: the calendar is only read again if it changed since the last pass
+    """
+    global target_date
+    global contacts
+
+    target_date = datetime.datetime.now() if args.date is None else datetime.datetime.strptime(args.date, '%Y%m%d')
+    if collab_cal_manager.refresh():
+        contacts = collab_cal_manager.read_contacts()
+    collab_cal_manager.set_calendar_tab(target_date.strftime('%B %Y'))
+    notify_crews()
+
+
+def write_status(**changes):
+    """
+    Update the health / status file of the daemon (written to the side and renamed)
+    """
+    daemon_status.update(changes)
+    daemon_status['heartbeat'] = datetime.datetime.now().isoformat(timespec='seconds')
+    daemon_status['outbox_pending'] = outbox.count()
+    daemon_status['outbox_failed'] = outbox.count('failed')
+    daemon_status['api_reads'] = getattr(collab_cal_manager.gcal, 'api_reads', None)
+    daemon_status['cache_hits'] = getattr(collab_cal_manager.gcal, 'cache_hits', None)
+
+    status_file = f'{email_manager.log_status_path}/{config.NOTIFIER_STATUS_FILE}'
+    temp_file = f'{status_file}.tmp'
+    with open(temp_file, 'w') as writer:
+        json.dump(daemon_status, writer, indent=4)
+    os.replace(temp_file, status_file)
+
+
+def run_daemon():
+    """
+    Stay up and run a pass now, then on the schedule (args.schedule), until SIGTERM / SIGINT.
+    The Sheets session, the cached months and the outbox worker are kept between passes
+    """
+    schedule = CronSchedule(args.schedule)
+    signal.signal(signal.SIGTERM, lambda _signum, _frame: stop_event.set())
+    signal.signal(signal.SIGINT, lambda _signum, _frame: stop_event.set())
+
+    write_status(pid=os.getpid(), started=datetime.datetime.now().isoformat(timespec='seconds'),
+                 schedule=str(schedule), state='starting', passes=0, failures=0, last_run=None, last_success=None,
+                 last_error=None, next_run=None)
+    next_run = datetime.datetime.now()
+    while not stop_event.is_set():
+        wait = (next_run - datetime.datetime.now()).total_seconds()
+        if wait > 0:
+            write_status(state='waiting', next_run=next_run.isoformat(timespec='seconds'))
+            stop_event.wait(min(wait, config.NOTIFIER_HEARTBEAT))
+            continue
+
+        started = datetime.datetime.now()
+        write_status(state='running', last_run=started.isoformat(timespec='seconds'))
+        try:
+            run_pass()
+            write_status(passes=daemon_status['passes'] + 1, last_success=started.isoformat(timespec='seconds'),
+                         last_error=None)
+        except Exception as e:
+            # Keep running: the next pass starts from the calendar again
+            traceback.print_exc()
+            write_status(passes=daemon_status['passes'] + 1, failures=daemon_status['failures'] + 1,
+                         last_error=f'{started.isoformat(timespec="seconds")}: {e}')
+        print(f'Pass done in {(datetime.datetime.now() - started).total_seconds():.1f} s')
+        next_run = schedule.next_run(datetime.datetime.now())
+
+    outbox_worker.stop()
+    write_status(state='stopped', next_run=None)
+    print('Notifier stopped')
 
 
 def parse_args():
@@ -208,13 +358,17 @@ def parse_args():
     parser.add_argument('--environment', type=str, nargs='?', default=None, help='Environment [devo | prod]')
     parser.add_argument('--date', type=str, nargs='?', default=None, help='Date (yyyyMMdd)')
     parser.add_argument('--to_test_email', action='store_true', default=False, help='Only send to test emails')
-    parser.add_argument('--force_notification', action='store_true', default=False, help='Save commands into a test file')
+    parser.add_argument('--enqueue_only', action='store_true', default=False, help='Only queue the emails (sent by: python outbox.py --drain)')
+    parser.add_argument('--daemon', action='store_true', default=False, help='Stay up and notify on the schedule (see --schedule)')
+    parser.add_argument('--schedule', type=str, default=config.NOTIFIER_SCHEDULE, help=f'Cron expression of the daemon passes (default: {config.NOTIFIER_SCHEDULE})')
+    parser.add_argument('--force_notification', action='store_true', default=False, help='Email every squad with upcoming shifts, even if nothing changed')
     args = parser.parse_args()
     return args
 
 """
 python crew_notifier.py --environment devo --date 20231111
 python crew_notifier.py --environment devo --to_test_email
+python crew_notifier.py --environment prod --daemon --schedule '*/10 6-21 * * *'
 """
 
 if __name__ == '__main__':
@@ -228,5 +382,8 @@ if __name__ == '__main__':
         target_date = datetime.datetime.strptime(args.date, '%Y%m%d')
 
     init()
-    notify_crews()
+    if args.daemon:
+        run_daemon()
+    else:
+        notify_crews()
 
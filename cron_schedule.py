@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta
+import sys
+
+"""
+Cron style schedules ('*/15 6-21 * * *'), for crew_notifier --daemon.
+
+Five fields: minute (0-59), hour (0-23), day of the month (1-31), month (1-12), day of the week (0-6, 0 = Sunday, 7 is
+also Sunday).  Each field is *, a value, a range (6-21), a step (*/15, 6-21/3) or a list of them (0,30).  As in cron,
+when both the day of the month and the day of the week are given, a day matching either one runs.
+"""
+
+FIELDS = [('minute', 0, 59), ('hour', 0, 23), ('day', 1, 31), ('month', 1, 12), ('weekday', 0, 7)]
+
+
+def parse_field(field, low, high):
+    """
+    '*/15' (0, 59) -> {0, 15, 30, 45}
+    """
+    values = set()
+    for part in field.split(','):
+        value_range, _slash, step = part.partition('/')
+        step = int(step) if step != '' else 1
+        if value_range == '*':
+            first, last = low, high
+        elif '-' in value_range:
+            first, last = [int(value) for value in value_range.split('-')]
+        else:
+            first = int(value_range)
+            last = high if step > 1 else first
+        if first < low or last > high or first > last or step < 1:
+            raise ValueError(f'Invalid cron field: {field} (values are {low}-{high})')
+        values.update(range(first, last + 1, step))
+    return values
+
+
+class CronSchedule:
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f'A cron expression has 5 fields (minute hour day month weekday): {expression}')
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = \
+            [parse_field(field, low, high) for field, (_name, low, high) in zip(fields, FIELDS)]
+        # cron: 0 = Sunday.  datetime.weekday(): 0 = Monday
+        self.weekdays = {(weekday - 1) % 7 for weekday in weekdays}
+        # As in cron, a field starting with * (eg: */2) does not restrict the day
+        self.any_day = fields[2].startswith('*')
+        self.any_weekday = fields[4].startswith('*')
+
+
+    def __str__(self):
+        return self.expression
+
+
+    def matches_day(self, day: datetime):
+        in_days = day.day in self.days
+        in_weekdays = day.weekday() in self.weekdays
+        if self.any_day or self.any_weekday:
+            return in_days and in_weekdays
+        return in_days or in_weekdays
+
+
+    def next_run(self, after: datetime) -> datetime:
+        """
+        The first time of the schedule after after (to the minute)
+        """
+        candidate = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        # At most a few years ahead (eg: 29 Feb on a Monday)
+        limit = candidate + timedelta(days=366 * 8)
+        while candidate < limit:
+            if candidate.month not in self.months:
+                year, month = (candidate.year + 1, 1) if candidate.month == 12 else (candidate.year, candidate.month + 1)
+                candidate = candidate.replace(year=year, month=month, day=1, hour=0, minute=0)
+            elif not self.matches_day(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+            elif candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError(f'The schedule never runs: {self.expression}')
+
+
+if __name__ == '__main__':
+    # python cron_schedule.py '*/15 6-21 * * 1-5'
+    schedule = CronSchedule(sys.argv[1] if len(sys.argv) > 1 else '*/15 6-21 * * *')
+    run = datetime.now()
+    for _ in range(10):
+        run = schedule.next_run(run)
+        print(run.strftime('%a %Y-%m-%d %H:%M'))
@@ -0,0 +1,285 @@
+from functools import lru_cache
+import numpy as np
+from calendar_slot_utils import NUMBER_OF_SQUADS, UNASSIGNED_SQUAD, range_from_start_end
+from models import ModifyOptions, ModifyShiftRequest
+
+"""
+Array backed version of the day matrix in calendar_slot_utils.
+
+The day covers 48 hours (starting at midnight, so that overnight shifts can run past 2400).  Each hour is a row of
+3 squads.  The same few rows come back over and over (a shift covers many hours), so every distinct row is stored once
+in RowStates and the day only keeps a vector of 48 row codes plus the 48 long tango vector.
+
+A change (eg: add squad 35) moves each row to another row.  That move is worked out once per distinct row and kept in a
+transition table, so applying a change to a range of hours is a single lookup over the range: table[codes[hours]].
+DayMatrix.matrix gives the usual 48 x 3 int16 matrix.
+
+The results are the same as calendar_slot_utils (add_to_calendar, remove_from_calendar, get_slots):
+* Only the first matching cell of a row is replaced
+* The row is then sorted by abs(), keeping the order of equal values (stable)
+"""
+
+HOURS = 48
+NO_TANGO = 0    # Stands for tango = None in the tango vector
+
+
+def replace_first_in_row(row, from_value, fallback_value, to_value):
+    """
+    Replace the first from_value of row (or the first fallback_value if there is no from_value) and sort by abs().
+    Same as calendar_slot_utils.replace_in_row, for a tuple
+    """
+    if from_value in row:
+        i = row.index(from_value)
+    elif fallback_value in row:
+        i = row.index(fallback_value)
+    else:
+        return row
+    return tuple(sorted(row[:i] + (to_value,) + row[i+1:], key=abs))
+
+
+class RowStates:
+    """
+    Every distinct day row seen so far (code -> row), and the transition tables of the changes (code -> code).
+    The tables are kept complete: a new row gets its entry in every table, and a new table gets an entry for every row.
+    So a lookup never misses, and applying a change needs no checks
+    """
+
+    def __init__(self, capacity=256):
+        self.rows = []
+        self.ids = {}
+        self.array = np.zeros((capacity, NUMBER_OF_SQUADS), dtype=np.int16)
+        self.tables = {}    # key = (from_value, fallback_value, to_value), value = code -> code
+
+    def get_code(self, row):
+        row = tuple(row)
+        code = self.ids.get(row)
+        if code is None:
+            code = self.add_row(row)
+            self.fill_tables(list(self.tables.keys()), code)
+        return code
+
+    def add_row(self, row):
+        code = len(self.rows)
+        if code == len(self.array):
+            self.grow()
+        self.rows.append(row)
+        self.ids[row] = code
+        self.array[code] = row
+        return code
+
+    def grow(self):
+        self.array = np.concatenate((self.array, np.zeros_like(self.array)))
+        for change, table in self.tables.items():
+            self.tables[change] = np.concatenate((table, np.zeros_like(table)))
+
+    def get_table(self, change):
+        table = self.tables.get(change)
+        if table is None:
+            self.tables[change] = np.zeros(len(self.array), dtype=np.int32)
+            self.fill_tables([change], 0)
+            table = self.tables[change]
+        return table
+
+    def fill_tables(self, changes, first_code):
+        """
+        Work out the entries of changes for the rows from first_code on.  Rows found along the way are added, and
+        get their entries in every table
+        """
+        known_rows = len(self.rows)
+        code = first_code
+        while code < len(self.rows):
+            for change in (changes if code < known_rows else list(self.tables.keys())):
+                new_row = replace_first_in_row(self.rows[code], *change)
+                new_code = self.ids.get(new_row)
+                if new_code is None:
+                    new_code = self.add_row(new_row)
+                self.tables[change][code] = new_code
+            code += 1
+
+
+@lru_cache(maxsize=None)
+def hours_slice(start, end):
+    """
+    The rows of the day matrix covered by start - end (see calendar_slot_utils.range_from_start_end)
+    """
+    hours = range_from_start_end(start, end)
+    return slice(hours.start, hours.stop)
+
+
+row_states = RowStates()
+UNASSIGNED_ROW = row_states.get_code((UNASSIGNED_SQUAD,) * NUMBER_OF_SQUADS)
+
+
+class DayMatrix:
+
+    def __init__(self):
+        self.codes = np.full(HOURS, UNASSIGNED_ROW, dtype=np.int32)
+        self.tango = np.full(HOURS, UNASSIGNED_SQUAD, dtype=np.int16)
+
+
+    @property
+    def matrix(self):
+        """
+        48 x 3 int16 matrix of squads (like calendar_slot_utils.build_day)
+        """
+        return row_states.array[self.codes]
+
+
+    @classmethod
+    def from_shifts(cls, shifts: list):
+        """
+        Same as calendar_slot_utils.day_from_shifts
+        """
+        day = cls()
+        for shift in shifts:
+            if shift.slot is None or shift.slot == '':
+                continue
+            hrs = shift.slot.replace(' ', '').split('-')
+            start = int(hrs[0])
+            end = int(hrs[1])
+            if len(shift.squads) > 0:
+                day.set_tango(start, end, shift.tango)
+            for col in shift.squads:
+                if col.number_of_trucks == 0:
+                    day.add(start, end, -1*col.squad)
+                else:
+                    for _truck in range(col.number_of_trucks):
+                        day.add(start, end, col.squad)
+        return day
+
+
+    @classmethod
+    def from_lists(cls, tango_array, matrix):
+        day = cls()
+        day.codes[:len(matrix)] = [row_states.get_code(row) for row in matrix]
+        day.tango[:len(tango_array)] = [NO_TANGO if tango is None else tango for tango in tango_array]
+        return day
+
+
+    def to_lists(self):
+        """
+        ## Returns
+        (tango_array, matrix) as lists, like calendar_slot_utils.day_from_shifts
+        """
+        return [None if tango == NO_TANGO else tango for tango in self.tango.tolist()], self.matrix.tolist()
+
+
+    def hours(self, start, end):
+        return hours_slice(start, end)
+
+
+    def replace_first(self, hours, from_value, fallback_value, to_value):
+        """
+        In every row of hours, replace the first from_value with to_value.  Rows without from_value have their first
+        fallback_value replaced instead.  Rows where something was replaced are sorted by abs()
+        """
+        if hours.start >= hours.stop:
+            return
+        self.codes[hours] = row_states.get_table((from_value, fallback_value, to_value))[self.codes[hours]]
+
+
+    def add(self, start, end, squad):
+        # If there is a -squad (meaning "no crew"), replace it with the squad.  Otherwise take an unassigned slot
+        self.replace_first(self.hours(start, end), -1*squad, UNASSIGNED_SQUAD, squad)
+
+
+    def remove(self, start, end, squad, modify_options: ModifyOptions):
+        # Obliterate means remove the squad from the row.  Otherwise the squad is marked as "no crew" (-squad)
+        if modify_options.obliterate:
+            modify_to_value = UNASSIGNED_SQUAD
+        else:
+            modify_to_value = -1*squad
+        self.replace_first(self.hours(start, end), squad, -1*squad, modify_to_value)
+
+
+    def set_tango(self, start, end, squad):
+        self.tango[self.hours(start, end)] = NO_TANGO if squad is None else squad
+
+
+    def apply_changes(self, changes: list):
+        """
+        Apply a list of ModifyShiftRequest, in order
+        """
+        for _change in changes:
+            change: ModifyShiftRequest = _change
+            if change.modify_options.is_add:
+                self.add(change.start_time, change.end_time, change.squad)
+            else:
+                self.remove(change.start_time, change.end_time, change.squad, change.modify_options)
+
+
+    def get_slots(self, start, end):
+        """
+        Same as calendar_slot_utils.get_slots: a new slot starts wherever the squads or the tango change from one hour to the next.
+        ## Returns
+        slots (list): [[tango, 'HHMM - HHMM', squad1, squad2, squad3], ...]
+        """
+        hours = self.hours(start, end)
+        first_hour = start // 100
+        if first_hour == hours.start:
+            codes = self.codes[hours]
+            tangos = self.tango[hours]
+        else:
+            codes = np.concatenate((self.codes[first_hour:first_hour+1], self.codes[hours]))
+            tangos = np.concatenate((self.tango[first_hour:first_hour+1], self.tango[hours]))
+            hours = slice(hours.start - 1, hours.stop)
+
+        # Equal rows have equal codes, so comparing the codes compares the rows
+        changed = (codes[1:] != codes[:-1]) | (tangos[1:] != tangos[:-1])
+        boundaries = (np.flatnonzero(changed) + (hours.start + 1)).tolist()
+
+        slot_starts = [first_hour] + [hour % 24 for hour in boundaries]
+        slot_ends = slot_starts[1:] + [end // 100]
+        slot_rows = [first_hour] + boundaries
+        all_codes = self.codes.tolist()
+        all_tangos = self.tango.tolist()
+
+        slots = []
+        for slot_start, slot_end, slot_row in zip(slot_starts, slot_ends, slot_rows):
+            tango = all_tangos[slot_row]
+            row = [None if tango == NO_TANGO else tango, f'{slot_start*100:04d} - {slot_end*100:04d}']
+            row.extend(row_states.rows[all_codes[slot_row]])
+            slots.append(row)
+        return slots
+
+
+if __name__ == '__main__':
+    # Benchmark: build a day from its shifts, apply changes and get the slots, with lists and with DayMatrix
+    import random
+    import timeit
+    from calendar_slot_utils import add_to_calendar, remove_from_calendar, get_slots, day_from_shifts
+    from models import SchedDate, SquadShift
+
+    squad_numbers = [34, 35, 42, 43, 54]
+    shifts = [
+        SchedDate(None, '0600 - 1800', 34, [SquadShift(34, 1, []), SquadShift(42, 1, []), SquadShift(54, 0, [])]),
+        SchedDate(None, '1800 - 0600', 35, [SquadShift(35, 2, []), SquadShift(43, 1, [])]),
+    ]
+    random.seed(7)
+    changes = []
+    for _ in range(6):
+        start = random.choice(range(0, 2400, 100))
+        end = random.choice(range(0, 2400, 100))
+        changes.append(ModifyShiftRequest(start, end, random.choice(squad_numbers), None,
+                                          ModifyOptions(is_add=random.random() < 0.5, obliterate=random.random() < 0.5)))
+
+    def apply_lists():
+        tango_array, matrix = day_from_shifts(shifts)
+        for change in changes:
+            if change.modify_options.is_add:
+                add_to_calendar(matrix, change.start_time, change.end_time, change.squad)
+            else:
+                remove_from_calendar(matrix, change.start_time, change.end_time, change.squad, change.modify_options)
+        return get_slots(tango_array, matrix, 600, 600)
+
+    def apply_day_matrix():
+        day = DayMatrix.from_shifts(shifts)
+        day.apply_changes(changes)
+        return day.get_slots(600, 600)
+
+    print(f'Same slots: {apply_lists() == apply_day_matrix()}')
+    runs = 2000
+    lists_time = timeit.timeit(apply_lists, number=runs) / runs
+    day_matrix_time = timeit.timeit(apply_day_matrix, number=runs) / runs
+    print(f'Lists:     {lists_time*1e6:8.1f} us per day')
+    print(f'DayMatrix: {day_matrix_time*1e6:8.1f} us per day  ({lists_time/day_matrix_time:.1f}x)')
@@ -1,11 +1,18 @@
-import csv
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
 from datetime import datetime
 import os
+import sys
+import threading
+import time
 from bcolors import bcolors
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import hashlib
+import config
+from send_log import SendLog
 
 """
 Notification module.
@@ -15,72 +22,196 @@ The "Golden Rules":
  * No Crew gets emailed to everyone (no more than once per day)
 
  Note: Add exports for YAHOO_EMAIL and YAHOO_PASSWORD to the venv/bin/activate script
+
+Sending: every email used to open its own SSL connection and log in.  Inside Notifier.session() (and send_emails) the
+emails go through an SmtpPool instead: each session is logged in once and reused for the whole batch, a session that was
+dropped is opened again, and send_emails can use a few sessions at the same time (config.SMTP_WORKERS).
 """
 
+def get_checksum(email_body):
+    """This function returns the checksum of a file."""
+    sha256_hash = hashlib.sha256()
+    sha256_hash.update(email_body.encode('utf-8'))
+    return sha256_hash.hexdigest()    
+
+
+class SmtpPool:
+    """
+    Logged in SMTP sessions, reused until the pool is closed.  At most max_sessions are open (one per sending thread)
+    """
+
+    def __init__(self, host, port, user, password, use_ssl=True, max_sessions=1, timeout=config.SMTP_TIMEOUT,
+                 max_retries=config.SMTP_MAX_RETRIES):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.use_ssl = use_ssl
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.sessions = threading.Semaphore(max_sessions)
+        self.lock = threading.Lock()
+        self.idle = []
+        self.connects = 0
+        self.reconnects = 0
+
+    def connect(self):
+        if self.use_ssl:
+            server = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.user is not None:
+            server.login(self.user, self.password)
+        with self.lock:
+            self.connects += 1
+        return server
+
+
+    def sendmail(self, from_email, recipients, message):
+        """
+        Send on an idle session (or a new one).  If the session was dropped (eg: the server closed it after a while) it
+        is opened again, up to max_retries times.  Other errors (eg: a recipient refused) are raised as they are
+        """
+        with self.sessions:
+            with self.lock:
+                server = self.idle.pop() if len(self.idle) > 0 else None
+            try:
+                for attempt in range(self.max_retries + 1):
+                    try:
+                        if server is None:
+                            server = self.connect()
+                        server.sendmail(from_email, recipients, message)
+                        break
+                    except (smtplib.SMTPServerDisconnected, smtplib.SMTPResponseException, ConnectionError,
+                            TimeoutError) as e:
+                        if isinstance(e, smtplib.SMTPResponseException) and e.smtp_code != 421:
+                            # Refused by the server, the session is still good
+                            raise
+                        if server is not None:
+                            self.quit(server)
+                        server = None
+                        if attempt == self.max_retries:
+                            raise
+                        print(f'{bcolors.WARNING}SMTP connection lost ({e}), connecting again{bcolors.ENDC}')
+                        with self.lock:
+                            self.reconnects += 1
+            finally:
+                if server is not None:
+                    with self.lock:
+                        self.idle.append(server)
+
+
+    def quit(self, server):
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for server in idle:
+            self.quit(server)
+
+
+@dataclass
+class OutgoingEmail:
+    subject: str
+    body_text: str
+    body_html: str
+    to_email: str
+    cc_email: str = None
+    bcc_email: str = None
+
+
+@dataclass
+class SendResult:
+    to_email: str
+    sent: bool              # False if it was not sent (already sent today, or error)
+    latency: float = 0.0    # Seconds spent sending
+    error: str = None
+
+
 class Notifier :
 
-    def __init__(self, log_status_path, contacts_by_squad_map):
+    def __init__(self, log_status_path, contacts_by_squad_map, smtp_host=config.SMTP_HOST, smtp_port=config.SMTP_PORT,
+                 use_ssl=True, login=True):
+        """
+        smtp_host, smtp_port, use_ssl, login: the defaults are Yahoo's.  A local stand-in (eg: aiosmtpd) is
+        ('127.0.0.1', 8025, use_ssl=False, login=False)
+        """
         self.log_status_path = log_status_path
+        self.send_log = SendLog(log_status_path)
+        self.send_log.compact(config.EMAIL_LOG_RETENTION_DAYS)
         self.contacts_by_squad_map = contacts_by_squad_map
         self.yahoo_email = os.environ['YAHOO_EMAIL']
         self.yahoo_password = os.environ['YAHOO_PASSWORD']
+        self.smtp_host = smtp_host
+        self.smtp_port = smtp_port
+        self.use_ssl = use_ssl
+        self.login = login
+        self.smtp_pool = None
 
 
-    def get_email_log_dir_name(self, send_date):
-        return f"{self.log_status_path}/{send_date.strftime('%Y%m%d')}"
-    
-    def get_checksum(self, email_body):
-        """This function returns the checksum of a file."""
-        sha256_hash = hashlib.sha256()
-        sha256_hash.update(email_body.encode('utf-8'))
-        return sha256_hash.hexdigest()    
+    def create_smtp_pool(self, max_sessions=1) -> SmtpPool:
+        return SmtpPool(self.smtp_host, self.smtp_port, self.yahoo_email if self.login else None, self.yahoo_password,
+                        use_ssl=self.use_ssl, max_sessions=max_sessions)
 
 
-    def get_email_log(self, send_date):
-        log_dir_name = self.get_email_log_dir_name(send_date)
-        file_name = f'{log_dir_name}/email_log.csv'
-        if not os.path.exists(file_name):
-            return None
+    @contextmanager
+    def session(self, workers=1):
+        """
+        Emails sent inside the with block reuse the same logged in session(s)
+
+            with notifier.session():
+                notifier.send_email(...)
+                notifier.send_email(...)
+        """
+        if self.smtp_pool is not None:
+            # Already in a session
+            yield self
+            return
+
+        self.smtp_pool = self.create_smtp_pool(workers)
+        try:
+            yield self
+        finally:
+            self.smtp_pool.close()
+            self.smtp_pool = None
+
+
+    def get_checksum(self, email_body):
+        return get_checksum(email_body)
 
-        log = []        
-        with open(file_name, 'r') as reader:
-            sent_reader = csv.reader(reader, delimiter='|')
-            for line in sent_reader:
-                log.append(line)
 
-        return log 
+    def get_email_log(self, send_date, exclude_subject=None):
+        """
+        ## Returns
+        [[checksum, to_email, cc_email, bcc_email], ...] of the emails sent on send_date, without the ones with subject
+        exclude_subject (None if there are none)
+        """
+        log = self.send_log.get_day(send_date, exclude_subject)
+        return log if len(log) > 0 else None
 
 
     def should_send_email(self, send_date, checksum):
-        log_dir_name = self.get_email_log_dir_name(send_date)
-        file_name = f'{log_dir_name}/email_log.csv'
-        if not os.path.exists(file_name):
-            return True
-        
-        with open(file_name, 'r') as reader:
-            sent_reader = csv.reader(reader, delimiter='|')
-            for line in sent_reader:
-                if line[0].strip() == checksum:
-                    return False
-
-        return True 
+        return not self.send_log.has_sent(send_date, checksum)
             
 
-    def log_sent_email(self, date, to_email, cc_email, bcc_email, checksum):
-        log_dir_name = self.get_email_log_dir_name(date)
-        os.makedirs(log_dir_name, exist_ok=True)
-        file_name = f'{log_dir_name}/email_log.csv'
-        with open(file_name, 'a') as writer:
-            csv_writer = csv.writer(writer, delimiter='|')
-            csv_writer.writerow([checksum, to_email, cc_email, bcc_email])
+    def log_sent_email(self, date, to_email, cc_email, bcc_email, checksum, subject=None):
+        self.send_log.log_sent(date, checksum, to_email, cc_email, bcc_email, subject)
 
 
     def send_email(self, subject, body_text, body_html, to_email, cc_email=None, bcc_email=None, dup_send_override=False):
-
+        """
+        ## Returns
+        SendResult (errors are raised)
+        """
         checksum = self.get_checksum(body_html)
         if not dup_send_override and not self.should_send_email(datetime.now(), checksum):
             print(f'{bcolors.WARNING}Email already sent today{bcolors.ENDC}')
-            return
+            return SendResult(to_email, sent=False)
 
         # Set up the MIME
         message = MIMEMultipart('alternative')
@@ -96,27 +227,130 @@ class Notifier :
         cc_email = '' if cc_email is None else cc_email
         bcc_email = '' if bcc_email is None else bcc_email
 
-        # Connect to Yahoo's SMTP server
-        with smtplib.SMTP_SSL('smtp.mail.yahoo.com', 465) as server:
+        part1 = MIMEText(body_text, 'plain')
+        part2 = MIMEText(body_html, 'html')
 
-            part1 = MIMEText(body_text, 'plain')
-            part2 = MIMEText(body_html, 'html')
+        message.attach(part1)
+        message.attach(part2)
 
-            message.attach(part1)
-            message.attach(part2)
-            
-            # Login to your Yahoo account
-            server.login(self.yahoo_email, self.yahoo_password)
+        recipients = [recipient for recipient in to_email.split(',') + cc_email.split(',') + bcc_email.split(',')
+                      if recipient.strip() != '']
 
-            recipients = to_email.split(',') + cc_email.split(',') + bcc_email.split(',')
-            
-            # Send the email
-            server.sendmail(self.yahoo_email, recipients, message.as_string())
+        # Outside of a session: connect (to Yahoo's SMTP server), log in and send just this one
+        start = time.perf_counter()
+        with self.session():
+            self.smtp_pool.sendmail(self.yahoo_email, recipients, message.as_string())
+        latency = time.perf_counter() - start
+
+        self.log_sent_email(datetime.now(), to_email, cc_email, bcc_email, checksum, subject)
+        return SendResult(to_email, sent=True, latency=latency)
+
+
+    def send_emails(self, emails, workers=config.SMTP_WORKERS):
+        """Send a batch of emails, reusing logged in sessions, up to workers at the same time
+
+        ## Parameters
+        * emails: list of OutgoingEmail
+
+        ## Returns
+        list of SendResult, in the same order as emails.  An email that fails doesn't stop the others
+        """
+        def send(email: OutgoingEmail):
+            start = time.perf_counter()
+            try:
+                return self.send_email(email.subject, email.body_text, email.body_html, email.to_email,
+                                       email.cc_email, email.bcc_email)
+            except (smtplib.SMTPException, OSError) as e:
+                print(f'{bcolors.FAIL}Unable to send email to: {email.to_email}: {e}{bcolors.ENDC}')
+                return SendResult(email.to_email, sent=False, latency=time.perf_counter() - start, error=str(e))
+
+        workers = max(1, min(workers, len(emails)))
+        with self.session(workers):
+            if workers == 1:
+                return [send(email) for email in emails]
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='smtp') as executor:
+                return list(executor.map(send, emails))
+
+
+def print_send_report(results):
+    """
+    One line per email (latency), then the totals
+    """
+    for result in results:
+        if result.error is not None:
+            print(f'{bcolors.FAIL}  {result.to_email:50} failed after {result.latency*1000:7.1f} ms: {result.error}{bcolors.ENDC}')
+        elif result.sent:
+            print(f'  {result.to_email:50} sent in {result.latency*1000:7.1f} ms')
+        else:
+            print(f'{bcolors.WARNING}  {result.to_email:50} not sent (already sent today){bcolors.ENDC}')
+    latencies = sorted([result.latency for result in results if result.sent])
+    if len(latencies) > 0:
+        print(f'Sent {len(latencies)}/{len(results)}  latency: median {latencies[len(latencies) // 2]*1000:.1f} ms  '
+              f'max {latencies[-1]*1000:.1f} ms')
+
+
+def benchmark(messages=20, workers=config.SMTP_WORKERS, delay=0.05, connect_delay=0.2):
+    """
+    Send messages emails to a local aiosmtpd server, which waits like a remote one: connect_delay seconds to greet a new
+    connection (SSL handshake + login) and delay seconds per message.
+    One connection per email (as before) vs one pooled session vs workers pooled sessions
+    """
+    import tempfile
+    from aiosmtpd.controller import Controller
+
+    class SlowHandler:
+        def __init__(self):
+            self.received = 0
+
+        async def handle_EHLO(self, server, session, envelope, hostname, responses):
+            import asyncio
+            await asyncio.sleep(connect_delay)
+            session.host_name = hostname
+            return responses
+
+        async def handle_DATA(self, server, session, envelope):
+            import asyncio
+            await asyncio.sleep(delay)
+            self.received += 1
+            return '250 OK'
+
+    handler = SlowHandler()
+    controller = Controller(handler, hostname='127.0.0.1', port=8025)
+    controller.start()
+    os.environ.setdefault('YAHOO_EMAIL', 'sender@localhost')
+    os.environ.setdefault('YAHOO_PASSWORD', '')
+    try:
+        with tempfile.TemporaryDirectory() as log_dir:
+            notifier = Notifier(log_dir, None, smtp_host=controller.hostname, smtp_port=controller.port,
+                                use_ssl=False, login=False)
+            emails = [OutgoingEmail(f'Test {i}', f'Text {i}', f'<p>Body {i}</p>', f'crew{i}@localhost')
+                      for i in range(messages)]
+
+            start = time.perf_counter()
+            for email in emails:
+                notifier.send_email(email.subject, email.body_text, email.body_html, email.to_email,
+                                    dup_send_override=True)
+            print(f'One connection per email:     {time.perf_counter() - start:6.2f} s')
+
+            for label, batch_workers in (('Pooled session:', 1), (f'Pooled, {workers} workers:', workers)):
+                for email in emails:
+                    email.body_html += ' '      # New checksums: not sent yet today
+                start = time.perf_counter()
+                results = notifier.send_emails(emails, workers=batch_workers)
+                print(f'{label:29} {time.perf_counter() - start:6.2f} s')
+            print_send_report(results)
+            print(f'Received {handler.received} emails')
+    finally:
+        controller.stop()
 
-        self.log_sent_email(datetime.now(), to_email, cc_email, bcc_email, checksum)
 
 # Example usage
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == 'benchmark':
+        # python email_manager.py benchmark   (needs aiosmtpd: pip install -r requirements-dev.txt)
+        benchmark()
+        sys.exit(0)
+
     subject = "Test Email"
     body = "This is a test email sent from Python."
     to_email = "gnowakowski@gmail.com"
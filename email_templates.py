@@ -7,6 +7,7 @@ Dear $squad,
 This is a reminder that your squad is scheduled to be in service and or assume the role of Tango over the next few days.  Please see the schedule below for details.  
 If you have any questions or concerns, please notify The Collaborative in the group chat as soon as possible!.
 
+$changes
 Upcoming Shifts:
 $shifts
                                
@@ -30,6 +31,7 @@ shift_template_html = Template("""
         Please see the schedule below for details.  
 If you have any questions or concerns, please notify The Collaborative in the group chat as soon as possible!.<br>
                                
+         $changes
          $shifts<br>
                                <br>
 
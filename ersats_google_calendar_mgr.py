@@ -1,14 +1,15 @@
 from datetime import datetime
 from ast import literal_eval
 from bcolors import bcolors
-from math import ceil
 from global_testing_state import GlobalTestState
 from google_calendar_mgr import GCal
+from month_layout import get_layout
 import sys
 from test.src.decorators.shift_testing_capture import shift_testing_capture
 
 
 class ErsatsGCal (GCal):
+    supports_batch_writes = False   # Days must go through write_day_to_calendar so that they are checked/captured
     months = {}
     expected_months = {}
     row_offset = 5
@@ -58,34 +59,19 @@ class ErsatsGCal (GCal):
         self.expected_months[calendar_tab] = expected_month_matrix
 
 
-    def week_of_month(self, dt):
-        """ Returns the week of the month for the specified date.
+    def get_day_coordinates(self, target_date):
         """
-
-        first_day = dt.replace(day=1)
-
-        dom = dt.day
-        adjusted_dom = dom + first_day.weekday()
-
-        return int(ceil(adjusted_dom/7.0))
+        (row, col) of the first shift cell of the day in the month matrix
+        """
+        return get_layout(target_date).get_offsets(target_date.day)
     
 
-    def day_of_week(self, dt):
-        # weekday() returns 0 = Monday; 6 = Sunday
+    def get_months(self, tabs):
+        for tab in tabs:
+            if tab not in self.months:
+                self.set_calendar_tab(tab)
+        return {tab: self.months[tab] for tab in tabs}
 
-        weekday = dt.weekday()
-        if (weekday == 6):
-            return 0
-        else:
-            return weekday + 1
-        
-
-    def get_day_coordinates(self, target_date):
-        week_of_month = self.week_of_month(target_date)
-        day_of_week = self.day_of_week(target_date)
-
-        return ((week_of_month-1) * (self.rows_per_month_row))+1, (day_of_week * self.cols_per_day)
-    
 
     def get_tabs(self):
         return ["May 2024"]
@@ -212,19 +198,6 @@ class ErsatsGCal (GCal):
     def get_contacts(self):
         raise NotImplementedError('get_contacts not implemented')
 
-    def get_month_row(self, day, days_on_first_row):
-        """
-        On a calendar that starts with Sunday and ends with Saturday,
-        On which row does the given day fall?  
-        """
-        if day <= days_on_first_row:
-            month_row = 0
-        else:
-            month_row = int(((day - days_on_first_row) + 6) / 7)
-
-        return month_row 
-
-
     def append_to_audit_rows(self, new_audit_rows):
         pass
 
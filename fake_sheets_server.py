@@ -0,0 +1,190 @@
+from ast import literal_eval
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import json
+import threading
+import time
+from urllib.parse import parse_qs, unquote, urlparse
+from calendar_utils import index_to_column, parse_location
+import config
+
+"""
+A local stand-in for the parts of the Sheets API that GCal uses (values get / batchGet / update / batchUpdate / append and
+the tab list).
+Point a spreadsheet at it with google_calendar_mgr.set_sheets_endpoint.
+
+Tabs are kept in memory as grids of strings.  'May 2024' is loaded from the test fixture so days can be read back.
+latency (seconds) is added to every response to look like a round trip to Google.
+fail_next(count, status) makes the next requests fail (eg: 429) to exercise the RateLimiter retries.
+The Drive modifiedTime of the spreadsheet (GCal.get_revision) changes with every write.
+"""
+
+FIXTURE_TAB = 'May 2024'
+FIXTURE_FILE = f'{config.TEST_PATH}/expected_results/May_2024.txt'
+
+
+class FakeSheetsHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, body, status=200):
+        time.sleep(self.server.latency)
+        failure_status = self.server.take_failure()
+        if failure_status is not None:
+            status = failure_status
+            body = {'error': {'code': failure_status, 'message': 'Injected failure'}}
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def do_GET(self):
+        self.server.request_count += 1
+        url = urlparse(self.path)
+        parts = url.path.split('/')
+        # /v4/spreadsheets/{id}  or  /v4/spreadsheets/{id}/values/{range}  or  /v4/spreadsheets/{id}/values:batchGet
+        # or (Drive) /files/{id}
+        if parts[1] == 'files':
+            self.send_json({'modifiedTime': self.server.modified_time})
+        elif len(parts) == 4:
+            self.send_json({'sheets': [{'properties': {'title': tab}} for tab in self.server.tabs.keys()]})
+        elif len(parts) == 6 and parts[4] == 'values':
+            location = unquote(parts[5])
+            self.send_json({'range': location, 'values': self.server.read_range(location)})
+        elif len(parts) == 5 and parts[4] == 'values:batchGet':
+            locations = parse_qs(url.query).get('ranges', [])
+            self.send_json({'valueRanges': [{'range': location, 'values': self.server.read_range(location)} for location in locations]})
+        else:
+            self.send_json({'error': {'code': 404, 'message': f'Not found: {self.path}'}}, 404)
+
+    def do_PUT(self):
+        self.server.request_count += 1
+        parts = urlparse(self.path).path.split('/')
+        location = unquote(parts[5])
+        values = self.read_body().get('values', [])
+        self.send_json({'updatedRange': location, 'updatedCells': self.server.write_range(location, values)})
+
+    def do_POST(self):
+        self.server.request_count += 1
+        path = urlparse(self.path).path
+        if path.endswith(':append'):
+            location = unquote(path.split('/')[5])[:-len(':append')]
+            values = self.read_body().get('values', [])
+            self.send_json({'updates': {'updatedRows': len(values), 'updatedCells': self.server.append_rows(location, values)}})
+            return
+
+        if not path.endswith('values:batchUpdate'):
+            self.send_json({'error': {'code': 404, 'message': f'Not found: {self.path}'}}, 404)
+            return
+
+        updated = 0
+        data = self.read_body().get('data', [])
+        for value_range in data:
+            updated += self.server.write_range(value_range['range'], value_range.get('values', []))
+        self.send_json({'totalUpdatedCells': updated, 'totalUpdatedRanges': len(data)})
+
+
+class FakeSheetsServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.0):
+        super().__init__(('127.0.0.1', port), FakeSheetsHandler)
+        self.latency = latency
+        self.request_count = 0
+        self.lock = threading.Lock()
+        self.tabs = {}
+        self.failures = []
+        self.revision = 0
+        self.modified_time = self.make_modified_time()
+        self.load_fixture(FIXTURE_TAB, FIXTURE_FILE)
+
+    def make_modified_time(self):
+        return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime()) + f'.{self.revision:03d}Z'
+
+    def fail_next(self, count, status=429):
+        with self.lock:
+            self.failures.extend([status] * count)
+
+    def take_failure(self):
+        with self.lock:
+            return self.failures.pop(0) if len(self.failures) > 0 else None
+
+    def load_fixture(self, tab, file_name):
+        """
+        The fixture is the month block, which starts at B6
+        """
+        with open(file_name, 'r') as f:
+            month_matrix = literal_eval(f.read())
+        grid = [[] for _ in range(config.CALENDAR_OFFSET)]
+        grid.extend([[''] + list(row) for row in month_matrix])
+        self.tabs[tab] = grid
+
+    def read_range(self, location):
+        tab, start_row, start_col, end_row, end_col = parse_location(location)
+        grid = self.tabs.get(tab, [])
+        rows = []
+        with self.lock:
+            for row_num in range(start_row - 1, end_row):
+                row = grid[row_num][start_col:end_col + 1] if row_num < len(grid) else []
+                # Like Google, trailing empty cells and rows are left out
+                while len(row) > 0 and row[-1] == '':
+                    row = row[:-1]
+                rows.append(list(row))
+        while len(rows) > 0 and len(rows[-1]) == 0:
+            rows.pop()
+        return rows
+
+    def write_range(self, location, values):
+        tab, start_row, start_col, _end_row, _end_col = parse_location(location)
+        updated = 0
+        with self.lock:
+            self.revision += 1
+            self.modified_time = self.make_modified_time()
+            grid = self.tabs.setdefault(tab, [])
+            for row_num, row in enumerate(values):
+                while len(grid) < start_row + row_num:
+                    grid.append([])
+                grid_row = grid[start_row - 1 + row_num]
+                for col_num, value in enumerate(row):
+                    while len(grid_row) <= start_col + col_num:
+                        grid_row.append('')
+                    grid_row[start_col + col_num] = str(value)
+                    updated += 1
+        return updated
+
+
+    def append_rows(self, location, values):
+        """
+        Write the rows after the last row of the tab that has something in it
+        """
+        tab, _start_row, start_col, _end_row, end_col = parse_location(location)
+        with self.lock:
+            grid = self.tabs.get(tab, [])
+            last_row = len(grid)
+            while last_row > 0 and not any(grid[last_row - 1]):
+                last_row -= 1
+        first_row = last_row + 1
+        end_row = first_row + len(values) - 1
+        return self.write_range(f'{tab}!{index_to_column(start_col)}{first_row}:{index_to_column(end_col)}{end_row}', values)
+
+
+def start_fake_sheets_server(port=0, latency=0.0) -> FakeSheetsServer:
+    """
+    Start the server on a background thread.  port = 0 picks a free port (see server.server_port)
+    """
+    server = FakeSheetsServer(port, latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    server = FakeSheetsServer(8085)
+    print(f'Fake Sheets API on http://127.0.0.1:{server.server_port}')
+    server.serve_forever()
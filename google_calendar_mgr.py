@@ -1,28 +1,171 @@
 import json
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 from datetime import datetime
 import sys
 import re
 import os
+import threading
 from bcolors import bcolors
+from rate_limiter import get_rate_limiter
 import traceback
-import gspread
-import gspread_formatting as gsf
 
+from calendar_utils import pad_month
+import config
 from models import Environment
+from month_layout import get_layout
 from spreadsheet_info import BETA_COLLAB_CALENDAR_SPREADSHEET_ID, PROD_COLLAB_CALENDAR_SPREADSHEET_ID 
 
 
 # The ID and range of a sample spreadsheet.
 LOCATION_RE = r"(\w+ \d{4})!(\D{1,2})(\d+):(\D{1,2})(\d+)"
 
-SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
+# drive.metadata.readonly lets GCal.get_revision read the spreadsheet's modified time (see warm_cache.py).
+# A token.json granted before it was added keeps working; the warm cache is just not used until the next login
+SCOPES = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive.metadata.readonly']
 collab_tabs = []
 
+
+class SheetsSession:
+    """
+    Process-wide connection to one spreadsheet (see get_sheets_session).
+
+    Building the Sheets service (discovery client) and reading token.json used to happen on every GCal call.  The session
+    builds the service once, on first use, and keeps it.  Reusing the service also reuses its HTTP connection (keep-alive).
+    The credentials are read from token.json once per process and refreshed in memory when they expire.
+
+    The HTTP connection under a service can't be shared between threads, so each thread gets its own service.
+    api_endpoint / credentials point the session somewhere other than Google (eg: fake_sheets_server for testing)
+
+    The Google client libraries (and gspread) are imported the first time they are needed, not when the module is
+    imported: they take longer to import than most runs of the CLI spend before their first request.
+    """
+
+    # Counters for the whole process (all spreadsheets)
+    stats = {'service_builds': 0, 'builds_avoided': 0, 'token_reads': 0, 'token_reads_avoided': 0}
+    creds = None
+    creds_lock = threading.Lock()
+
+    def __init__(self, spreadsheet_id):
+        self.spreadsheet_id = spreadsheet_id
+        self.thread_services = threading.local()
+        self.gspread_spreadsheet = None
+        self.api_endpoint = None
+        self.credentials = None
+
+    def set_endpoint(self, api_endpoint, credentials=None):
+        """
+        Send the requests of this spreadsheet to api_endpoint (eg: 'http://127.0.0.1:8085') with the given credentials.
+        api_endpoint = None goes back to Google
+        """
+        self.api_endpoint = api_endpoint
+        self.credentials = credentials
+        self.thread_services = threading.local()
+
+    @classmethod
+    def get_creds(cls):
+        creds = cls.creds
+        if creds is not None and creds.valid:
+            cls.stats['token_reads_avoided'] += 1
+            return creds
+
+        with cls.creds_lock:
+            return cls.load_creds()
+
+    @classmethod
+    def load_creds(cls):
+        creds = cls.creds
+        if creds is not None and creds.valid:
+            # Another thread refreshed them while we waited for the lock
+            return creds
+
+        from google.auth.transport.requests import Request
+        from google.oauth2.credentials import Credentials
+        from google_auth_oauthlib.flow import InstalledAppFlow
+
+        if creds is None and os.path.exists('token.json'):
+            cls.stats['token_reads'] += 1
+            # The scopes saved with the token (asking for more than were granted would fail the refresh)
+            creds = Credentials.from_authorized_user_file('token.json')
+        # If there are no (valid) credentials available, let the user log in.
+        if not creds or not creds.valid:
+            if creds and creds.expired and creds.refresh_token:
+                creds.refresh(Request())
+            else:
+                flow = InstalledAppFlow.from_client_secrets_file(
+                    'credentials.json', SCOPES)
+                creds = flow.run_local_server(port=0)
+            # Save the credentials for the next run
+            with open('token.json', 'w') as token:
+                token.write(creds.to_json())
+
+        cls.creds = creds
+        return creds
+
+    def get_service(self):
+        creds = self.credentials if self.credentials is not None else self.get_creds()
+        local = self.thread_services
+        if getattr(local, 'service', None) is not None and local.creds is creds:
+            self.stats['builds_avoided'] += 1
+            return local.service
+
+        from googleapiclient.discovery import build
+
+        self.stats['service_builds'] += 1
+        client_options = {'api_endpoint': self.api_endpoint} if self.api_endpoint is not None else None
+        local.service = build('sheets', 'v4', credentials=creds, cache_discovery=False, client_options=client_options)
+        local.creds = creds
+        return local.service
+
+    def get_drive_service(self):
+        """
+        Drive service, only used to read the modified time of the spreadsheet (same rules as get_service)
+        """
+        creds = self.credentials if self.credentials is not None else self.get_creds()
+        local = self.thread_services
+        if getattr(local, 'drive_service', None) is not None and local.drive_creds is creds:
+            return local.drive_service
+
+        from googleapiclient.discovery import build
+
+        client_options = {'api_endpoint': self.api_endpoint} if self.api_endpoint is not None else None
+        local.drive_service = build('drive', 'v3', credentials=creds, cache_discovery=False, client_options=client_options)
+        local.drive_creds = creds
+        return local.drive_service
+
+    def get_gspread_spreadsheet(self):
+        """
+        gspread is only needed for formatting, so the client is only opened when it is asked for
+        """
+        if self.gspread_spreadsheet is None:
+            import gspread
+            gc = gspread.service_account()
+            self.gspread_spreadsheet = gc.open_by_key(self.spreadsheet_id)
+        return self.gspread_spreadsheet
+
+
+sheets_sessions = {}
+
+def get_sheets_session(spreadsheet_id) -> SheetsSession:
+    """
+    Return the process-wide session for the spreadsheet, creating it on first use
+    """
+    if spreadsheet_id not in sheets_sessions:
+        sheets_sessions[spreadsheet_id] = SheetsSession(spreadsheet_id)
+    return sheets_sessions[spreadsheet_id]
+
+def set_sheets_endpoint(spreadsheet_id, api_endpoint, credentials=None):
+    """
+    Send the requests for spreadsheet_id to another server (eg: a local fake of the Sheets API)
+    """
+    get_sheets_session(spreadsheet_id).set_endpoint(api_endpoint, credentials)
+
+def get_session_stats():
+    """
+    ## Returns
+    dict: how many service builds / token.json reads were done, and how many were avoided by reusing the session
+    """
+    return dict(SheetsSession.stats)
+
 class GCal:
 
     TEMPLATE_TAB_RANGE = 'Template!A1:R54'
@@ -31,15 +174,18 @@ class GCal:
     CONTACTS_TAB = 'Contacts!A3:D7'
     SAMPLE_RANGE_NAME = 'August 2023!A6:0'
     AUDIT_RANGE = f'Audit!A2:I300'
+    AUDIT_TABLE = 'Audit!A1:I1'     # values().append finds the table from here and adds the rows after its last row
+    TABS_FIELDS = 'sheets.properties.title'
 
     HOURS_COMMITTED = 'B69:F69'
     HOURS_TO_DATE = 'B70:F70'
-    TANGO_HOURS = 'B71'
+    TANGO_HOURS = 'B71:F71'
 
     # CALENDAR_TEMPLATE_LOCATION = 'Shift Template!A1:F41'
     CALENDAR_TEMPLATE_LOCATION = 'Shift Template!A1:H300'
 
     calendar_tab = None
+    supports_batch_writes = True
     row_offset = 5
     rows_per_month_row = 10
     cols_per_day = 4
@@ -60,20 +206,47 @@ class GCal:
     def __init__(self, spreadsheet_id, config_dir=None):
         self.set_spreadsheet_id(spreadsheet_id)
         self.config_dir = config_dir
-
-        gc = gspread.service_account()
-        self.spreadsheet_for_gspread = gc.open_by_key(spreadsheet_id)
         # worksheet = sh.worksheet('September 2023')
 
+    @property
+    def spreadsheet_for_gspread(self):
+        return get_sheets_session(self.CALENDAR_SPREADSHEET_ID).get_gspread_spreadsheet()
+
+    def get_service(self):
+        return get_sheets_session(self.CALENDAR_SPREADSHEET_ID).get_service()
+
+    def get_revision(self):
+        """
+        The time the spreadsheet was last changed (by anyone), from Drive.  One small metadata request
+        ## Returns
+        modifiedTime (str, eg: '2024-05-03T14:02:11.123Z') or None if it can't be read (eg: token without the Drive scope)
+        """
+        try:
+            drive = get_sheets_session(self.CALENDAR_SPREADSHEET_ID).get_drive_service()
+            result = self.execute_request(drive.files().get(fileId=self.CALENDAR_SPREADSHEET_ID, fields='modifiedTime',
+                                                            supportsAllDrives=True))
+            return result.get('modifiedTime')
+        except HttpError as err:
+            print(f'Unable to read the spreadsheet revision: {err}')
+            return None
+
+    def execute_request(self, request):
+        """
+        Every request to Google goes through here: it waits for the quota and retries 429 / 5xx errors
+        """
+        return get_rate_limiter().execute(request)
+
 
     def set_calendar_tab(self, calendar_tab):
         self.calendar_tab = calendar_tab
 
 
     def get_tabs(self):
-        service = build('sheets', 'v4', credentials=self.get_creds())
+        service = self.get_service()
 
-        sheet_metadata = service.spreadsheets().get(spreadsheetId=self.CALENDAR_SPREADSHEET_ID).execute()
+        # Only the tab titles (without the mask the whole spreadsheet metadata comes back)
+        sheet_metadata = self.execute_request(service.spreadsheets().get(spreadsheetId=self.CALENDAR_SPREADSHEET_ID,
+                                                                         fields=self.TABS_FIELDS))
         sheets = sheet_metadata.get('sheets', '')
 
         tab_titles = []
@@ -99,22 +272,7 @@ class GCal:
 
 
     def get_creds(self):
-        creds = None
-        if os.path.exists('token.json'):
-            creds = Credentials.from_authorized_user_file('token.json', SCOPES)
-        # If there are no (valid) credentials available, let the user log in.
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                creds.refresh(Request())
-            else:
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    'credentials.json', SCOPES)
-                creds = flow.run_local_server(port=0)
-            # Save the credentials for the next run
-            with open('token.json', 'w') as token:
-                token.write(creds.to_json())
-
-        return creds
+        return SheetsSession.get_creds()
 
 
     def update_values(self, range_name, value_input_option, _values):
@@ -134,31 +292,45 @@ class GCal:
         for guides on implementing OAuth2 for the application.
         """
         try:
-            service = build('sheets', 'v4', credentials=self.get_creds())
+            service = self.get_service()
             body = {
                 'values': _values
             }
-            result = service.spreadsheets().values().update(
+            result = self.execute_request(service.spreadsheets().values().update(
                 spreadsheetId=self.CALENDAR_SPREADSHEET_ID, range=range_name,
-                valueInputOption=value_input_option, body=body).execute()
+                valueInputOption=value_input_option, body=body))
             print(f"{result.get('updatedCells')} cells updated.")
             return result
         except HttpError as error:
             print(f"An error occurred: {error}")
             return error
 
-    def get_month_row(self, day, days_on_first_row):
-        """
-        On a calendar that starts with Sunday and ends with Saturday,
-        On which row does the given day fall?  
-        """
-        if day <= days_on_first_row:
-            month_row = 0
-        else:
-            month_row = int(((day - days_on_first_row) + 6) / 7)
+    def batch_update_values(self, data, value_input_option):
+        """Update several ranges of the Google Calendar with a single request
 
-        return month_row 
+        ## Parameters
+        * data = list of (range_name, _values) tuples.  Example: [('May 2024!F7:I15', [[...], ...]), ...]
+        * value_input_option = "USER_ENTERED"
 
+        ## Returns
+        * The batchUpdate response (or the HttpError)
+        """
+        if len(data) == 0:
+            return None
+
+        try:
+            service = self.get_service()
+            body = {
+                'valueInputOption': value_input_option,
+                'data': [{'range': range_name, 'values': _values} for range_name, _values in data]
+            }
+            result = self.execute_request(service.spreadsheets().values().batchUpdate(
+                spreadsheetId=self.CALENDAR_SPREADSHEET_ID, body=body))
+            print(f"{result.get('totalUpdatedCells')} cells updated in {len(data)} range(s).")
+            return result
+        except HttpError as error:
+            print(f"An error occurred: {error}")
+            return error
 
     def populate_day_headers(self, target_tab, first_week_offset, days_in_month):
         """
@@ -168,6 +340,7 @@ class GCal:
         end_col = 'AC'
         days_to_skip = first_week_offset
         calendar_day = 1
+        week_rows = []
         for week in range(0, 6):
             row = week * self.rows_per_month_row + self.row_offset + 1
             week_row = []
@@ -180,7 +353,9 @@ class GCal:
                     calendar_day += 1
                 week_row.extend(day_row)
 
-            self.update_values(f'{target_tab}!{start_col}{row}:{end_col}{row}', "USER_ENTERED", [week_row])
+            week_rows.append((f'{target_tab}!{start_col}{row}:{end_col}{row}', [week_row]))
+
+        self.batch_update_values(week_rows, "USER_ENTERED")
    
 
     def update_header_row(self, tab, week_of_month, header_row):
@@ -189,35 +364,11 @@ class GCal:
         
 
     def get_cell_range(self, target_date):
-        rows_to_skip_per_month_row = 2
+        """
+        The rows of the day below its header (eg: 'F7:I12'), see MonthLayout
+        """
         cells_to_fill = 5
-
-        # weekday() - Mon = 0, Tues = 1...Sun = 6
-        day_of_week = target_date.weekday()
-        # print(f'Date: {the_date} daofw: {day_of_week}')
-
-        days_offsets = [('F', 'I'),('J', 'M'),('N','Q'),('R','U'),('V','Y'),('Z', 'AC'),('B', 'E')]
-
-        day_num = 0
-        first_day_of_month = datetime.strptime(f'{target_date.year}-{target_date.month}-01', '%Y-%m-%d')
-        # Since 0 = Mon and 6 = Sunday, but our cally starts with Sunday, adjust the first day of month
-        # so that Sunday = 0 and Saturday = 6
-        if first_day_of_month.weekday() == 6:
-            day_num = 0
-        else:
-            day_num = first_day_of_month.weekday() + 1
-
-        days_on_first_row = 7 - day_num
-
-        month_row = self.get_month_row(target_date.day, days_on_first_row)
-
-        # print(f'Day of week for: {target_month} day: {day} is {day_of_week}')
-        col_tuple = days_offsets[day_of_week]
-
-        start_row = self.row_offset + rows_to_skip_per_month_row + (month_row*self.rows_per_month_row)
-        end_row = start_row + cells_to_fill
-
-        return f'{col_tuple[0]}{start_row}:{col_tuple[1]}{end_row}'
+        return get_layout(target_date).get_body_range(target_date.day, cells_to_fill + 1)
 
 
     # def get_location(self, target_tab, target_date):
@@ -234,6 +385,13 @@ class GCal:
         from that location on the master tab!
         ** Clever **
         """
+        return f'{"Master"}!{self.get_cell_range(self.get_master_date(target_date))}'
+
+
+    def get_master_date(self, target_date):
+        """
+        Translate the given date into the date in December 2024 that occupies the same cell on the Master tab
+        """
         def get_corresponding_day(target_date):
             # Find the day of week for the first day of the month
             first_day_of_month = datetime(target_date.year, target_date.month, 1)
@@ -247,8 +405,7 @@ class GCal:
 
             return corresponding_day
 
-        target_date = datetime(2024, 12, get_corresponding_day(target_date))
-        return f'{"Master"}!{self.get_cell_range(target_date)}'
+        return datetime(2024, 12, get_corresponding_day(target_date))
 
 
     def expand_location(self, location, rows):
@@ -277,10 +434,13 @@ class GCal:
         * target_tab
         * target_date
         * rows (list): formatted rows for calendar (padded to the matrix size)
+
+        ## Returns
+        * The update response (or the HttpError)
         """
         location = self.get_location(self.calendar_tab, target_date)
         location = self.expand_location(location, rows)
-        self.update_values(location, "USER_ENTERED", rows)
+        return self.update_values(location, "USER_ENTERED", rows)
 
 
     def get_calendar_template(self):
@@ -289,12 +449,12 @@ class GCal:
 
     def get_data_from_calendar(self, location):
         try:
-            service = build('sheets', 'v4', credentials=self.get_creds())
+            service = self.get_service()
 
             # Call the Sheets API
             sheet = service.spreadsheets()
 
-            result = sheet.values().get(spreadsheetId=self.CALENDAR_SPREADSHEET_ID,range=location).execute()
+            result = self.execute_request(sheet.values().get(spreadsheetId=self.CALENDAR_SPREADSHEET_ID,range=location))
             values = result.get('values', [])
             return values
         except HttpError as err:
@@ -304,11 +464,70 @@ class GCal:
         return self.get_data_from_calendar(self.CONTACTS_TAB)
 
 
+    def batch_get_values(self, locations):
+        """Read several ranges with a single request
+
+        ## Parameters
+        * locations = list of ranges.  Example: ['Territories!B2:F11', 'Contacts!A3:D7']
+
+        ## Returns
+        * list of values (list of lists), in the same order as locations
+        """
+        try:
+            service = self.get_service()
+            result = self.execute_request(service.spreadsheets().values().batchGet(
+                spreadsheetId=self.CALENDAR_SPREADSHEET_ID, ranges=locations))
+            return [value_range.get('values', []) for value_range in result.get('valueRanges', [])]
+        except HttpError as err:
+            print(err)
+
+
+    def get_months(self, tabs):
+        """Read the month block (B6:AC65) of several tabs with a single request
+
+        ## Parameters
+        * tabs = list of tab names.  Example: ['May 2024', 'June 2024']
+
+        ## Returns
+        * dict: key = tab, value = month rows (padded, see pad_month).  None if the months could not be read
+        """
+        values = self.batch_get_values([f'{tab}!{config.CALENDAR_MONTH_BOUNDARIES}' for tab in tabs])
+        if values is None:
+            return None
+        return {tab: pad_month(month_rows) for tab, month_rows in zip(tabs, values)}
+
+
     def append_to_audit_rows(self, changes):
-        self.update_values(self.AUDIT_RANGE, 
-                           "USER_ENTERED",
-                            self.get_data_from_calendar(self.AUDIT_RANGE) + changes    
-                            )
+        """
+        Add the rows after the last row of the Audit tab.  Only the new rows are sent, however long the audit gets
+        """
+        return self.append_values(self.AUDIT_TABLE, "USER_ENTERED", changes)
+
+
+    def append_values(self, range_name, value_input_option, _values):
+        """Append rows after the last row of the table found in range_name (values().append)
+
+        ## Parameters
+        * range_name = 'tab!A:I'
+        * value_input_option = "USER_ENTERED"
+        * _values = list of lists of columns
+
+        ## Returns
+        * The append response (or the HttpError)
+        """
+        try:
+            service = self.get_service()
+            body = {
+                'values': _values
+            }
+            result = self.execute_request(service.spreadsheets().values().append(
+                spreadsheetId=self.CALENDAR_SPREADSHEET_ID, range=range_name,
+                valueInputOption=value_input_option, insertDataOption='INSERT_ROWS', body=body))
+            print(f"{result.get('updates', {}).get('updatedRows')} rows appended.")
+            return result
+        except HttpError as error:
+            print(f"An error occurred: {error}")
+            return error
 
 
     def populate_hours_committed(self, hours_row):
@@ -380,33 +599,24 @@ class GCal:
         The keys are the territory keys, and the values are dictionaries of the squads and their covering
         squads
         """
-        territory_map = {}
-        try:
-            service = build('sheets', 'v4', credentials=self.get_creds())
-
-            # Call the Sheets API
-            sheet = service.spreadsheets()
-
-            # Two territory range
-            result = sheet.values().get(spreadsheetId=self.CALENDAR_SPREADSHEET_ID,range=self.TERRITORY_TAB_2_RANGE).execute()
-            values = result.get('values', [])
+        values = self.batch_get_values([self.TERRITORY_TAB_2_RANGE, self.TERRITORY_TAB_3_RANGE])
+        if values is None:
+            return None
+        return territory_map_from_rows(values[0], values[1])
 
-            for row in values:
-                territory_map[row[0]] = { int(row[1]): [int(i) for i in row[2].split(',')], int(row[3]): [int(i) for i in row[4].split(',')] }
-
-            # Three territory map
-            result = sheet.values().get(spreadsheetId=self.CALENDAR_SPREADSHEET_ID,range=self.TERRITORY_TAB_3_RANGE).execute()
-            values = result.get('values', [])
 
-            for row in values:
-                territory_map[row[0]] = { int(row[1]): [int(i) for i in row[2].split(',')], int(row[3]): [int(i) for i in row[4].split(',')], int(row[5]): [int(i) for i in row[6].split(',')] }
-
-            return territory_map
-        
-        except HttpError as err:
-            print(err)
+def territory_map_from_rows(two_squad_rows, three_squad_rows):
+    """
+    Build the territory map (see GCal.read_territory_map) from the rows of the two and the three territory ranges
+    """
+    territory_map = {}
+    for row in two_squad_rows:
+        territory_map[row[0]] = { int(row[1]): [int(i) for i in row[2].split(',')], int(row[3]): [int(i) for i in row[4].split(',')] }
 
+    for row in three_squad_rows:
+        territory_map[row[0]] = { int(row[1]): [int(i) for i in row[2].split(',')], int(row[3]): [int(i) for i in row[4].split(',')], int(row[5]): [int(i) for i in row[6].split(',')] }
 
+    return territory_map
 
 
 if __name__ == '__main__':
@@ -421,6 +631,8 @@ if __name__ == '__main__':
     gcal.set_calendar_tab('May 2024')
     target_date = datetime(2024, 11, 29)
     print(gcal.get_master_location(target_date))
+    print(f'Sheets session: {get_session_stats()}')
+    print(f'Rate limiter: {get_rate_limiter().get_metrics()}')
 
 
 
@@ -4,7 +4,6 @@ import sys
 from models import CalendarDay, CalendarTab, Environment
 from picchiello_reader import PReader
 from google_calendar_mgr import GCal
-from calendar_renderer import CalendarRenderer
 import copy
 
 
@@ -68,7 +67,8 @@ class MonthFromTemplate:
 
         final_calendar_days = self.update_calendar_dates(self.target_month, month_calendar_days)
 
-        # Render the calendar using CalendarRenderer
+        # Render the calendar using CalendarRenderer (rich is only imported when rendering)
+        from calendar_renderer import CalendarRenderer
         renderer = CalendarRenderer()
         renderer.render_calendar_month(final_calendar_days, self.target_month)
         print(f"Successfully generated and rendered calendar for {self.target_month}")
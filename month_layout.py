@@ -0,0 +1,142 @@
+from calendar import monthrange
+from datetime import datetime
+from functools import lru_cache
+from typing import NamedTuple
+import calendar_utils
+import config
+from models import CalendarTab
+
+"""
+Where each day of a month sits on the calendar grid.
+
+A month tab is a grid of weeks (one row of 7 days each, starting on Sunday) at B6:AC65.  Each day is a block of
+10 rows x 4 columns: a header row with the day number, then the rows of shifts.  MonthLayout works out the position of
+every day of a month once, so that the A1 ranges (for Google) and the offsets into the month block (for the caches)
+are lookups.
+
+get_month_layout(year, month) builds the layout of a month the first time it is asked for.  A calendar laid out
+differently (another first cell, day size or first day of the week) is a MonthLayout with other parameters.
+"""
+
+class DayPosition(NamedTuple):
+    week: int           # Week row of the calendar (0 based)
+    weekday: int        # Column of the day in its week (0 = first day of the week)
+    row: int            # Month block row of the first shift row (the one below the header)
+    col: int            # Month block column of the first cell of the day (0 = first column of the grid)
+    header_row: int     # Spreadsheet row of the header
+    first_column: str   # Spreadsheet columns of the day (eg: 'F', 'I')
+    last_column: str
+    cell_range: str     # The whole day, header included (eg: 'F6:I15')
+
+
+class MonthLayout:
+
+    def __init__(self, tab: CalendarTab, first_row=config.CALENDAR_OFFSET + 1, first_col=1,
+                 rows_per_day=config.CALENDAR_ROWS + 1, cols_per_day=config.CALENDAR_COLS, first_weekday=6):
+        """
+        ## Parameters
+        * tab: the month
+        * first_row: spreadsheet row of the top of the grid (6)
+        * first_col: zero based spreadsheet column of the left of the grid (1 = 'B')
+        * rows_per_day: rows of a day, header included (10)
+        * cols_per_day: columns of a day (4)
+        * first_weekday: weekday() of the first column of the grid (6 = Sunday)
+        """
+        self.tab = tab
+        self.tab_name = str(tab)
+        self.first_row = first_row
+        self.first_col = first_col
+        self.rows_per_day = rows_per_day
+        self.cols_per_day = cols_per_day
+        self.first_weekday = first_weekday
+
+        first_day = tab.as_date()
+        self.year = first_day.year
+        self.month = first_day.month
+        self.days_in_month = monthrange(self.year, self.month)[1]
+        # Column of the first of the month
+        self.first_day_column = (first_day.weekday() - first_weekday) % 7
+
+        self.days = [None]       # index = day of the month
+        self.weeks = []          # Days of each week row: [[1, 2, 3, 4], [5, ... 11], ...]
+        for day in range(1, self.days_in_month + 1):
+            week, weekday = divmod(self.first_day_column + day - 1, 7)
+            self.days.append(self.to_position(week, weekday))
+            if week == len(self.weeks):
+                self.weeks.append([])
+            self.weeks[week].append(day)
+
+
+    def to_position(self, week, weekday) -> DayPosition:
+        row = week * self.rows_per_day
+        col = weekday * self.cols_per_day
+        header_row = self.first_row + row
+        first_column = calendar_utils.index_to_column(self.first_col + col)
+        last_column = calendar_utils.index_to_column(self.first_col + col + self.cols_per_day - 1)
+        return DayPosition(week=week, weekday=weekday, row=row + 1, col=col, header_row=header_row,
+                           first_column=first_column, last_column=last_column,
+                           cell_range=f'{first_column}{header_row}:{last_column}{header_row + self.rows_per_day - 1}')
+
+
+    def get_position(self, day) -> DayPosition:
+        return self.days[day]
+
+
+    def get_cell_range(self, day):
+        """
+        The whole day, header included (eg: 'F6:I15')
+        """
+        return self.days[day].cell_range
+
+
+    def get_coordinates(self, day):
+        """
+        eg: 'May 2024!F6:I15'
+        """
+        return f'{self.tab_name}!{self.days[day].cell_range}'
+
+
+    def get_body_range(self, day, num_rows):
+        """
+        num_rows rows of the day, starting below the header (eg: 'F7:I12')
+        """
+        position = self.days[day]
+        start_row = position.header_row + 1
+        return f'{position.first_column}{start_row}:{position.last_column}{start_row + num_rows - 1}'
+
+
+    def get_offsets(self, day):
+        """
+        ## Returns
+        (row, col) of the first shift cell of the day in the month block
+        """
+        position = self.days[day]
+        return position.row, position.col
+
+
+@lru_cache(maxsize=None)
+def get_month_layout(year, month) -> MonthLayout:
+    return MonthLayout(CalendarTab.from_month_year(month, year))
+
+
+def get_layout(target_date: datetime) -> MonthLayout:
+    """
+    The layout of the month of target_date
+    """
+    return get_month_layout(target_date.year, target_date.month)
+
+
+@lru_cache(maxsize=256)
+def location_to_offsets(location):
+    """
+    A day's location (as given by get_coordinates) to its offsets in the month block (see MonthLayout.get_offsets)
+    Example: 'June 2024!Z26:AC35' -> (21, 24)
+    """
+    _tab, start_row, start_col, _end_row, _end_col = calendar_utils.parse_location(location)
+    return start_row - config.CALENDAR_OFFSET, start_col - 1
+
+
+if __name__ == '__main__':
+    layout = get_month_layout(2024, 5)
+    for week in layout.weeks:
+        print('  '.join(f'{day:2}: {layout.get_cell_range(day):9}' for day in week))
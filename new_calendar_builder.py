@@ -3,16 +3,15 @@ import calendar
 from datetime import datetime
 import csv
 import os
-from calendar_renderer import CalendarRenderer
 from config import CALENDAR_COLS
-from google_calendar_mgr import GCal
+from cached_google_calendar_mgr import CachedGCal
 from models import CalendarDay, CalendarTab, Environment, SchedDate, SquadShift
 from month_from_template import MonthFromTemplate
 from picchiello_reader import PReader
 from transactioned_calendar_delegate import CalendarDelegate
 from utils.cal_tab_utils import get_month_tabs
 from utils.tango_util import TangoUtil
-from utils.territory_utils import TerritoryManager
+from utils.territory_utils import get_territory_manager
 from calendar_formatter import google_to_shifts, shifts_to_google
 from utils.ui_utils import CP, TerminalUI
 
@@ -39,6 +38,7 @@ class NewCalendarBuilder:
         self.calendar_delegate = None
         self.tab = None
         self.territory_manager = None
+        self.reference_data = None
         self.template_reader = None
         self.termy = None
 
@@ -52,9 +52,11 @@ class NewCalendarBuilder:
 
         self.termy = TerminalUI()
 
-        self.gcal = GCal.create_gcal_for_environment(environment, config_dir)
+        self.gcal = CachedGCal.create_gcal_for_environment(environment, config_dir)
+        # Tabs and territory map in one round trip, or from the warm cache (the template is read by the template reader)
+        self.reference_data = self.gcal.get_reference_data(include_template=False)
         if self.tab is None:
-            selected_tab = self.prompt_for_target_tab(self.gcal)
+            selected_tab = self.prompt_for_target_tab(self.reference_data.tabs)
             if selected_tab is None:
                 raise Exception('No tab selected!')
             self.tab = CalendarTab.from_string(selected_tab)
@@ -64,7 +66,9 @@ class NewCalendarBuilder:
 
         self.calendar_delegate = CalendarDelegate(self.gcal, selected_tab)
         self.TEMPLATE_CELL_LOC = BASE_TEMPLATE_CELL_LOC.format(tab=selected_tab)
-        self.territory_manager = TerritoryManager(self.calendar_delegate.read_territory_map())
+        self.territory_manager = get_territory_manager(self.reference_data.territory_map)
+        for warning in self.territory_manager.warnings:
+            CP.print_yellow(warning)
 
         if self.args.reader == 'Picchiello':
             print('Using Picchiello Reader')
@@ -72,8 +76,8 @@ class NewCalendarBuilder:
         else:
             self.template_reader = self.get_template_reader()
 
-    def prompt_for_target_tab(self, gcal: GCal):
-        tabs = get_month_tabs(gcal.get_tabs())
+    def prompt_for_target_tab(self, tabs: list):
+        tabs = get_month_tabs(tabs)
         return self.termy.prompt_menu('Select target tab: ', tabs)
 
     def get_template_reader(self):
@@ -206,6 +210,7 @@ class NewCalendarBuilder:
 
         if self.args.preview:
             print('Previewing calendar month:')
+            from calendar_renderer import CalendarRenderer     # rich is only needed for the preview
             CalendarRenderer().render_calendar_month(calendar_days, self.tab)
             print('Preview complete. No changes made to the calendar.')
             return
@@ -274,8 +279,9 @@ class NewCalendarBuilder:
         print(f'Shift Tally: {shift_tally}')
         print(f'Tango Tally: {tango_tally}')
 
-        tu.assign_tango(calendar_days, re_tango=True)
+        fairness_report = tu.assign_tango(calendar_days, re_tango=True)
         print(f'Days after tango assignment:{calendar_days}')
+        print(f'Tango fairness: {fairness_report}')
 
 
 
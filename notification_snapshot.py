@@ -0,0 +1,130 @@
+from dataclasses import dataclass, field
+import datetime
+import json
+import os
+import threading
+
+"""
+What each squad was last told about its upcoming shifts, to only email the squads whose shifts changed.
+
+crew_notifier rendered and queued an email for every squad on every run, and relied on the body checksum to not send
+the same email twice in a day.  Now the shifts and tango assignments in the window are compared with the ones in the
+last email sent to the squad: a squad is emailed when something was added (including a day that came into the window)
+or removed, and the email lists the changes.  Running every few minutes costs a calendar read, not emails.
+
+The snapshot goes in the outbox with the email and is only kept here once the email is sent (see record_sent): a squad
+whose email was given up on is emailed again by the next run.
+
+File: {log_status_path}/{config.NOTIFICATION_SNAPSHOT_FILE}
+"""
+
+def take_snapshot(shifts, tangos):
+    """The shifts and tangos of one squad, in a form that can be compared and saved
+
+    ## Parameters
+    * shifts: [[date, slot, number of trucks, squad covering], ...] (as built by crew_notifier.get_upcoming_shifts)
+    * tangos: [[date, slot, tango], ...]
+
+    ## Returns
+    {'shifts': [[yyyy-mm-dd, slot, trucks, covering], ...], 'tangos': [[yyyy-mm-dd, slot], ...]} sorted
+    """
+    return {'shifts': sorted([[shift[0].strftime('%Y-%m-%d'), shift[1], shift[2], shift[3]] for shift in shifts]),
+            'tangos': sorted([[tango[0].strftime('%Y-%m-%d'), tango[1]] for tango in tangos])}
+
+
+@dataclass
+class SnapshotDiff:
+    added_shifts: list = field(default_factory=list)
+    removed_shifts: list = field(default_factory=list)
+    added_tangos: list = field(default_factory=list)
+    removed_tangos: list = field(default_factory=list)
+
+    def is_empty(self):
+        return len(self.added_shifts) + len(self.removed_shifts) + len(self.added_tangos) + len(self.removed_tangos) == 0
+
+
+    def lines(self):
+        lines = []
+        for label, entries in (('New shift', self.added_shifts), ('Removed shift', self.removed_shifts),
+                               ('New tango', self.added_tangos), ('Removed tango', self.removed_tangos)):
+            for entry in entries:
+                day = datetime.datetime.strptime(entry[0], '%Y-%m-%d').strftime('%A %B %d, %Y')
+                trucks = f' ({entry[2]} truck{"s" if entry[2] != 1 else ""})' if len(entry) > 2 else ''
+                lines.append(f'{label}: {day} {entry[1]}{trucks}')
+        return lines
+
+
+    def summary_text(self):
+        if self.is_empty():
+            return ''
+        return 'Changes since the last notification:\n' + '\n'.join(self.lines()) + '\n'
+
+
+    def summary_html(self):
+        if self.is_empty():
+            return ''
+        return '<h2>Changes since the last notification:</h2><ul>' + \
+               ''.join(f'<li>{line}</li>' for line in self.lines()) + '</ul>'
+
+
+def diff_snapshots(previous, current, from_date: datetime.datetime):
+    """
+    ## Parameters
+    * previous: snapshot of the last email (None if the squad was never emailed)
+    * current: snapshot of the window
+    * from_date: first day of the window.  Days of previous before it have passed and are not removals
+
+    ## Returns
+    SnapshotDiff
+    """
+    first_day = from_date.strftime('%Y-%m-%d')
+    previous = {'shifts': [], 'tangos': []} if previous is None else previous
+    diff = SnapshotDiff()
+    for kind, added, removed in (('shifts', diff.added_shifts, diff.removed_shifts),
+                                 ('tangos', diff.added_tangos, diff.removed_tangos)):
+        old = [entry for entry in previous[kind] if entry[0] >= first_day]
+        new = current[kind]
+        added += [entry for entry in new if entry not in old]
+        removed += [entry for entry in old if entry not in new]
+    return diff
+
+
+class NotificationSnapshots:
+
+    def __init__(self, snapshot_file):
+        self.snapshot_file = snapshot_file
+        self.snapshots = {}     # key = squad, value = take_snapshot of the last email
+        # record_sent is called from the outbox worker
+        self.lock = threading.Lock()
+        if os.path.exists(snapshot_file):
+            try:
+                with open(snapshot_file, 'r') as reader:
+                    self.snapshots = {int(squad): snapshot for squad, snapshot in json.load(reader).items()}
+            except (OSError, ValueError) as e:
+                print(f'Ignoring unreadable notification snapshot {snapshot_file}: {e}')
+
+
+    def get(self, squad):
+        return self.snapshots.get(squad)
+
+
+    def set(self, squad, snapshot):
+        with self.lock:
+            self.snapshots[squad] = snapshot
+
+
+    def record_sent(self, squad, snapshot):
+        """
+        The email of snapshot was sent to the squad (OutboxWorker.on_sent): keep it, saved right away
+        """
+        self.set(squad, snapshot)
+        self.save()
+
+
+    def save(self):
+        with self.lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.snapshot_file)), exist_ok=True)
+            temp_file = f'{self.snapshot_file}.tmp'
+            with open(temp_file, 'w') as writer:
+                json.dump(self.snapshots, writer, indent=4)
+            os.replace(temp_file, self.snapshot_file)
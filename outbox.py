@@ -0,0 +1,301 @@
+import argparse
+from datetime import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+from bcolors import bcolors
+import config
+from email_manager import Notifier, OutgoingEmail, get_checksum, print_send_report
+from notification_snapshot import NotificationSnapshots
+
+"""
+Emails waiting to be sent, kept on disk until they are.
+
+crew_notifier used to send each email as soon as it was formatted: a slow or failing SMTP server held up the run, and
+an email that failed was only tried again by the next day's run.  Now the emails are added to the Outbox (a SQLite file
+next to the send log) and an OutboxWorker sends them in the background:
+* an email that fails is tried again after config.OUTBOX_RETRY_DELAY seconds (doubled after each failure), up to
+  config.OUTBOX_MAX_ATTEMPTS times
+* the same email (same body checksum) is only queued once per day, and the Notifier skips one already sent today, so
+  running again (or after a crash) doesn't send twice.  An email that was given up on is queued again
+* an email can carry what the squad is told in it (squad, notification snapshot): the worker hands it to on_sent once
+  the email is sent, so a squad is only up to date with what it actually received
+* emails still waiting when the run ends are sent by the next run
+
+File: {log_status_path}/outbox.sqlite
+
+Usage:
+    python outbox.py --spool <sent_mail_log>            # emails waiting / failed
+    python outbox.py --spool <sent_mail_log> --drain    # send them now
+"""
+
+OUTBOX_FILE = 'outbox.sqlite'
+
+PENDING = 'pending'
+SENDING = 'sending'
+SENT = 'sent'
+FAILED = 'failed'
+
+
+class Outbox:
+
+    def __init__(self, spool_dir):
+        self.spool_dir = spool_dir if spool_dir != '' else '.'
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self.db_file = f'{self.spool_dir}/{OUTBOX_FILE}'
+        # Shared with the worker thread
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.db_file, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute('''CREATE TABLE IF NOT EXISTS outbox (
+                                           id INTEGER PRIMARY KEY,
+                                           queue_date TEXT NOT NULL,     -- yyyymmdd
+                                           checksum TEXT NOT NULL,
+                                           priority INTEGER NOT NULL,    -- Lowest first
+                                           subject TEXT,
+                                           body_text TEXT,
+                                           body_html TEXT,
+                                           to_email TEXT,
+                                           cc_email TEXT,
+                                           bcc_email TEXT,
+                                           status TEXT NOT NULL,
+                                           attempts INTEGER NOT NULL DEFAULT 0,
+                                           next_attempt REAL NOT NULL,   -- time.time()
+                                           last_error TEXT,
+                                           squad INTEGER,
+                                           snapshot TEXT,                -- JSON, see notification_snapshot.py
+                                           UNIQUE (queue_date, checksum))''')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt)')
+            # Outboxes created before the snapshot was kept with the email
+            columns = [row[1] for row in self.connection.execute('PRAGMA table_info(outbox)')]
+            if 'squad' not in columns:
+                self.connection.execute('ALTER TABLE outbox ADD COLUMN squad INTEGER')
+            if 'snapshot' not in columns:
+                self.connection.execute('ALTER TABLE outbox ADD COLUMN snapshot TEXT')
+            # Emails that were being sent when the last run stopped
+            self.connection.execute('UPDATE outbox SET status = ? WHERE status = ?', (PENDING, SENDING))
+
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+    def enqueue(self, email: OutgoingEmail, priority=0, squad=None, snapshot=None):
+        """
+        ## Parameters
+        * squad, snapshot: what the squad is told in the email (handed to OutboxWorker.on_sent once it is sent)
+
+        ## Returns
+        True if the email was queued (or queued again after it was given up on), False if the same email was already
+        queued today
+        """
+        queue_date = datetime.now().strftime('%Y%m%d')
+        checksum = get_checksum(email.body_html)
+        saved_snapshot = json.dumps(snapshot) if snapshot is not None else None
+        with self.lock, self.connection:
+            cursor = self.connection.execute('''INSERT OR IGNORE INTO outbox (queue_date, checksum, priority, subject,
+                                                    body_text, body_html, to_email, cc_email, bcc_email, status,
+                                                    next_attempt, squad, snapshot)
+                                                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                                             (queue_date, checksum, priority, email.subject, email.body_text,
+                                              email.body_html, email.to_email, email.cc_email, email.bcc_email, PENDING,
+                                              time.time(), squad, saved_snapshot))
+            if cursor.rowcount == 0:
+                cursor = self.connection.execute('''UPDATE outbox SET status = ?, attempts = 0, next_attempt = ?,
+                                                        last_error = NULL, squad = ?, snapshot = ?
+                                                    WHERE queue_date = ? AND checksum = ? AND status = ?''',
+                                                 (PENDING, time.time(), squad, saved_snapshot, queue_date, checksum,
+                                                  FAILED))
+        return cursor.rowcount == 1
+
+
+    def claim_due(self, limit=50):
+        """
+        Mark the emails due to be sent as being sent
+        ## Returns
+        [(id, OutgoingEmail), ...] highest priority first
+        """
+        with self.lock, self.connection:
+            rows = self.connection.execute('''SELECT id, subject, body_text, body_html, to_email, cc_email, bcc_email
+                                              FROM outbox WHERE status = ? AND next_attempt <= ?
+                                              ORDER BY priority, id LIMIT ?''',
+                                           (PENDING, time.time(), limit)).fetchall()
+            self.connection.executemany('UPDATE outbox SET status = ? WHERE id = ?', [(SENDING, row[0]) for row in rows])
+        return [(row[0], OutgoingEmail(*row[1:])) for row in rows]
+
+
+    def mark_sent(self, email_id):
+        with self.lock, self.connection:
+            self.connection.execute('UPDATE outbox SET status = ?, attempts = attempts + 1, last_error = NULL WHERE id = ?',
+                                    (SENT, email_id))
+
+
+    def get_snapshot(self, email_id):
+        """
+        ## Returns
+        (squad, snapshot) queued with the email, None if it has none
+        """
+        with self.lock:
+            row = self.connection.execute('SELECT squad, snapshot FROM outbox WHERE id = ?', (email_id,)).fetchone()
+        if row is None or row[1] is None:
+            return None
+        return row[0], json.loads(row[1])
+
+
+    def mark_failed(self, email_id, error, max_attempts=config.OUTBOX_MAX_ATTEMPTS, retry_delay=config.OUTBOX_RETRY_DELAY):
+        """
+        Try again later (retry_delay x 2^(attempts - 1) seconds), or give up after max_attempts
+        ## Returns
+        True if it will be tried again
+        """
+        with self.lock, self.connection:
+            attempts = self.connection.execute('SELECT attempts FROM outbox WHERE id = ?', (email_id,)).fetchone()[0] + 1
+            retry = attempts < max_attempts
+            self.connection.execute('''UPDATE outbox SET status = ?, attempts = ?, next_attempt = ?, last_error = ?
+                                       WHERE id = ?''',
+                                    (PENDING if retry else FAILED, attempts,
+                                     time.time() + retry_delay * 2 ** (attempts - 1), error, email_id))
+        return retry
+
+
+    def count(self, status=PENDING):
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM outbox WHERE status = ?', (status,)).fetchone()[0]
+
+
+    def next_due(self):
+        """
+        ## Returns
+        time.time() the next pending email is due, None if there are none
+        """
+        with self.lock:
+            return self.connection.execute('SELECT MIN(next_attempt) FROM outbox WHERE status = ?',
+                                           (PENDING,)).fetchone()[0]
+
+
+    def get_entries(self, status):
+        """
+        ## Returns
+        [(id, queue_date, to_email, subject, attempts, last_error), ...]
+        """
+        with self.lock:
+            return self.connection.execute('''SELECT id, queue_date, to_email, subject, attempts, last_error
+                                              FROM outbox WHERE status = ? ORDER BY id''', (status,)).fetchall()
+
+
+class OutboxWorker:
+    """
+    Sends the emails of an Outbox, in the calling thread (drain) or in a background thread (start / stop)
+    on_sent(squad, snapshot) is called (from the sending thread) for each email sent that was queued with a snapshot
+    """
+
+    def __init__(self, outbox: Outbox, notifier: Notifier, poll_interval=config.OUTBOX_POLL_INTERVAL, on_sent=None):
+        self.outbox = outbox
+        self.notifier = notifier
+        self.poll_interval = poll_interval
+        self.on_sent = on_sent
+        self.wake = threading.Event()
+        self.stopped = threading.Event()
+        self.idle = threading.Event()
+        self.thread = None
+
+
+    def drain(self):
+        """Send the emails that are due, until there are none
+
+        ## Returns
+        list of SendResult
+        """
+        all_results = []
+        while True:
+            claimed = self.outbox.claim_due()
+            if len(claimed) == 0:
+                return all_results
+
+            results = self.notifier.send_emails([email for _email_id, email in claimed])
+            for (email_id, email), result in zip(claimed, results):
+                if result.error is None:
+                    # Sent, or already sent today
+                    self.outbox.mark_sent(email_id)
+                    snapshot = self.outbox.get_snapshot(email_id) if self.on_sent is not None else None
+                    if snapshot is not None:
+                        self.on_sent(*snapshot)
+                elif self.outbox.mark_failed(email_id, result.error):
+                    print(f'{bcolors.WARNING}Will try again to send to: {email.to_email}{bcolors.ENDC}')
+                else:
+                    print(f'{bcolors.FAIL}Gave up sending to: {email.to_email}: {result.error}{bcolors.ENDC}')
+            print_send_report(results)
+            all_results += results
+
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.idle.clear()
+            try:
+                self.drain()
+            except Exception as e:
+                # Keep going: the emails stay in the outbox
+                print(f'{bcolors.FAIL}Outbox worker error: {e}{bcolors.ENDC}')
+            if self.outbox.count(PENDING) == 0:
+                self.idle.set()
+            next_due = self.outbox.next_due()
+            wait = self.poll_interval if next_due is None else min(self.poll_interval, max(0.0, next_due - time.time()))
+            self.wake.wait(wait)
+            self.wake.clear()
+
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, name='outbox', daemon=True)
+        self.thread.start()
+
+
+    def notify(self):
+        """
+        New emails were queued: send them now rather than at the next poll
+        """
+        self.idle.clear()
+        self.wake.set()
+
+
+    def wait_until_empty(self, timeout):
+        """
+        ## Returns
+        True if every email was sent (or given up on) before timeout seconds
+        """
+        return self.idle.wait(timeout)
+
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.stopped.set()
+        self.wake.set()
+        self.thread.join()
+        self.thread = None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Emails waiting to be sent')
+    parser.add_argument('--spool', type=str, required=True, help='Directory of the outbox (the Notifier log directory)')
+    parser.add_argument('--drain', action='store_true', default=False, help='Send the emails that are due')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    outbox = Outbox(args.spool)
+    if args.drain:
+        notification_snapshots = NotificationSnapshots(f'{args.spool}/{config.NOTIFICATION_SNAPSHOT_FILE}')
+        OutboxWorker(outbox, Notifier(args.spool, None), on_sent=notification_snapshots.record_sent).drain()
+
+    for status in (PENDING, FAILED):
+        entries = outbox.get_entries(status)
+        print(f'{status}: {len(entries)}')
+        for email_id, queue_date, to_email, subject, attempts, last_error in entries:
+            print(f'  {email_id:5} {queue_date} {to_email:50} {subject}  (attempts: {attempts}, {last_error})')
@@ -0,0 +1,124 @@
+import random
+import threading
+import time
+from googleapiclient.errors import HttpError
+import config
+
+"""
+Rate limiting and retries for the Sheets API.
+
+Every GCal request goes through RateLimiter.execute:
+* A token bucket, refilled at the Sheets per-minute quota, decides when a request may go.  Up to burst requests can go
+  back to back, so short operations are not slowed down at all.
+* A 429 (quota) or 5xx answer is retried with exponential backoff and jitter (honouring Retry-After when Google sends it)
+
+The quota belongs to the user (not to a spreadsheet or a GCal), so there is one limiter per process (get_rate_limiter).
+"""
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class RateLimiter:
+
+    def __init__(self, requests_per_minute=config.SHEETS_REQUESTS_PER_MINUTE, burst=config.SHEETS_REQUEST_BURST,
+                 max_retries=config.SHEETS_MAX_RETRIES, backoff_base=config.SHEETS_BACKOFF_BASE,
+                 backoff_max=config.SHEETS_BACKOFF_MAX):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.tokens = burst
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+        self.metrics = {'requests': 0, 'throttled': 0, 'throttled_seconds': 0.0,
+                        'retries': 0, 'rate_limited': 0, 'backoff_seconds': 0.0, 'failures': 0}
+
+
+    def acquire(self):
+        """
+        Take a token, waiting for one if the bucket is empty
+        ## Returns
+        seconds waited
+        """
+        if self.interval == 0:
+            return 0.0
+
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.last_refill) / self.interval)
+                self.last_refill = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    if waited > 0:
+                        self.metrics['throttled'] += 1
+                        self.metrics['throttled_seconds'] += waited
+                    return waited
+                wait_time = (1 - self.tokens) * self.interval
+            time.sleep(wait_time)
+            waited += wait_time
+
+
+    def execute(self, request):
+        """
+        Execute a googleapiclient request within the quota, retrying 429 / 5xx answers.
+        Raises the HttpError if the request still fails after max_retries
+        """
+        attempt = 0
+        while True:
+            self.acquire()
+            with self.lock:
+                self.metrics['requests'] += 1
+            try:
+                return request.execute()
+            except HttpError as error:
+                status = error.resp.status if error.resp is not None else None
+                if status not in RETRY_STATUSES or attempt >= self.max_retries:
+                    with self.lock:
+                        self.metrics['failures'] += 1
+                    raise
+
+                delay = self.get_backoff(attempt, error)
+                with self.lock:
+                    self.metrics['retries'] += 1
+                    self.metrics['backoff_seconds'] += delay
+                    if status == 429:
+                        self.metrics['rate_limited'] += 1
+                print(f'Sheets API returned {status}, retrying in {delay:.1f}s (attempt {attempt + 1} of {self.max_retries})')
+                time.sleep(delay)
+                attempt += 1
+
+
+    def get_backoff(self, attempt, error):
+        """
+        Full jitter: a random delay up to base * 2^attempt (capped at backoff_max).  Retry-After wins when it is longer
+        """
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        retry_after = error.resp.get('retry-after') if error.resp is not None else None
+        if retry_after is not None:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        return delay
+
+
+    def get_metrics(self):
+        with self.lock:
+            return dict(self.metrics)
+
+
+rate_limiter = None
+rate_limiter_lock = threading.Lock()
+
+def get_rate_limiter() -> RateLimiter:
+    """
+    Return the process-wide rate limiter, creating it on first use
+    """
+    global rate_limiter
+    with rate_limiter_lock:
+        if rate_limiter is None:
+            rate_limiter = RateLimiter()
+        return rate_limiter
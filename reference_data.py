@@ -0,0 +1,92 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from google_calendar_mgr import GCal, territory_map_from_rows
+
+"""
+Everything a session reads before it gets to the calendar itself: the territory map, the contacts, the tab names and
+(for building months) the shift template.
+
+load_reference_data reads the ranges with one values().batchGet, and the tab names with a spreadsheets().get masked to
+the titles.  The two requests are sent at the same time (on two threads), so loading costs about one round trip instead
+of one per read (the territory map alone used to be two).
+"""
+
+@dataclass
+class ReferenceData:
+    territory_map: dict     # See GCal.read_territory_map
+    contacts: list          # Rows of the Contacts tab (see CollabCalendarManager.to_squad_contacts)
+    tabs: list              # Tab names
+    calendar_template: list = None  # Rows of the Shift Template tab (None when not loaded)
+
+
+# Reads the tab names while the batchGet is in flight.  Kept for the process, so its thread keeps its Sheets service
+tabs_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='reference')
+
+
+def load_reference_data(gcal: GCal, include_template=True) -> ReferenceData:
+    """Read the reference data of the spreadsheet
+
+    ## Parameters
+    * gcal: the spreadsheet
+    * include_template: also read the shift template (only needed to build a month)
+
+    ## Returns
+    ReferenceData, or None if the ranges could not be read
+    """
+    values, tabs = read_reference_values(gcal, include_template)
+    if values is None:
+        return None
+    return to_reference_data(values, tabs, include_template)
+
+
+def read_reference_values(gcal: GCal, include_template=True):
+    """
+    ## Returns
+    (values of the reference ranges, tab names), as read from Google.  values is None if the ranges could not be read
+    """
+    locations = [gcal.TERRITORY_TAB_2_RANGE, gcal.TERRITORY_TAB_3_RANGE, gcal.CONTACTS_TAB]
+    if include_template:
+        locations.append(gcal.CALENDAR_TEMPLATE_LOCATION)
+
+    tabs_future = tabs_executor.submit(gcal.get_tabs)
+    values = gcal.batch_get_values(locations)
+    tabs = tabs_future.result()
+    return values, tabs
+
+
+def to_reference_data(values, tabs, include_template=True) -> ReferenceData:
+    """
+    ReferenceData from the values returned by read_reference_values
+    """
+    return ReferenceData(territory_map=territory_map_from_rows(values[0], values[1]),
+                         contacts=values[2],
+                         tabs=tabs,
+                         calendar_template=values[3] if include_template and len(values) > 3 else None)
+
+
+if __name__ == '__main__':
+    # Runs against fake_sheets_server:  python reference_data.py
+    import time
+    from google.auth.credentials import AnonymousCredentials
+    from google_calendar_mgr import set_sheets_endpoint
+    from fake_sheets_server import start_fake_sheets_server
+    from spreadsheet_info import BETA_COLLAB_CALENDAR_SPREADSHEET_ID
+
+    server = start_fake_sheets_server(latency=0.2)
+    set_sheets_endpoint(BETA_COLLAB_CALENDAR_SPREADSHEET_ID, f'http://127.0.0.1:{server.server_port}', AnonymousCredentials())
+    gcal = GCal(BETA_COLLAB_CALENDAR_SPREADSHEET_ID)
+    # Build the services first, so that only the requests are timed
+    gcal.get_tabs()
+    load_reference_data(gcal)
+
+    start = time.perf_counter()
+    gcal.read_territory_map()
+    gcal.get_contacts()
+    gcal.get_tabs()
+    gcal.get_calendar_template()
+    print(f'One read at a time: {time.perf_counter() - start:.3f}s')
+
+    start = time.perf_counter()
+    reference_data = load_reference_data(gcal)
+    print(f'load_reference_data: {time.perf_counter() - start:.3f}s  tabs: {reference_data.tabs}')
+    server.shutdown()
@@ -0,0 +1,130 @@
+from datetime import datetime, timedelta
+import csv
+import os
+import sqlite3
+import threading
+
+"""
+The emails sent by Notifier, in one SQLite file (indexed by day and checksum).
+
+The log used to be one directory per day ({log_status_path}/yyyymmdd/email_log.csv), read from start to end for every
+email sent to find out if it was already sent today.  SendLog answers that with one indexed lookup, and a day's log (for
+the digest) with one query, however many years of runs are kept.
+
+The day directories of the old log are imported into the database the first time it is opened (then removed), and
+entries older than the retention are deleted by compact().  The subject is kept so the digest (crew_notifier) can leave
+itself out of the day's log.
+
+File: {log_status_path}/send_log.sqlite
+"""
+
+SEND_LOG_FILE = 'send_log.sqlite'
+LEGACY_LOG_FILE = 'email_log.csv'
+
+
+class SendLog:
+
+    def __init__(self, log_dir):
+        self.log_dir = log_dir if log_dir != '' else '.'
+        os.makedirs(self.log_dir, exist_ok=True)
+        self.db_file = f'{self.log_dir}/{SEND_LOG_FILE}'
+        # Shared by the sending threads (Notifier.send_emails)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.db_file, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute('''CREATE TABLE IF NOT EXISTS sent_email (
+                                           send_date TEXT NOT NULL,      -- yyyymmdd
+                                           checksum TEXT NOT NULL,
+                                           to_email TEXT,
+                                           cc_email TEXT,
+                                           bcc_email TEXT,
+                                           subject TEXT,
+                                           UNIQUE (send_date, checksum))''')
+            # Logs created before the subject was kept
+            columns = [row[1] for row in self.connection.execute('PRAGMA table_info(sent_email)')]
+            if 'subject' not in columns:
+                self.connection.execute('ALTER TABLE sent_email ADD COLUMN subject TEXT')
+        self.import_legacy_logs()
+
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+    def has_sent(self, send_date: datetime, checksum):
+        with self.lock:
+            row = self.connection.execute('SELECT 1 FROM sent_email WHERE send_date = ? AND checksum = ?',
+                                          (send_date.strftime('%Y%m%d'), checksum)).fetchone()
+        return row is not None
+
+
+    def log_sent(self, send_date: datetime, checksum, to_email, cc_email, bcc_email, subject=None):
+        with self.lock, self.connection:
+            self.connection.execute('''INSERT OR IGNORE INTO sent_email (send_date, checksum, to_email, cc_email, bcc_email,
+                                                                         subject)
+                                       VALUES (?, ?, ?, ?, ?, ?)''',
+                                    (send_date.strftime('%Y%m%d'), checksum, to_email, cc_email, bcc_email, subject))
+
+
+    def get_day(self, send_date: datetime, exclude_subject=None):
+        """
+        ## Parameters
+        * send_date
+        * exclude_subject: leave out the emails with this subject (eg: the digest)
+
+        ## Returns
+        [[checksum, to_email, cc_email, bcc_email], ...] in the order they were sent (same rows as the old email_log.csv)
+        """
+        with self.lock:
+            rows = self.connection.execute('''SELECT checksum, to_email, cc_email, bcc_email FROM sent_email
+                                              WHERE send_date = ? AND (? IS NULL OR subject IS NULL OR subject != ?)
+                                              ORDER BY rowid''',
+                                           (send_date.strftime('%Y%m%d'), exclude_subject, exclude_subject)).fetchall()
+        return [list(row) for row in rows]
+
+
+    def compact(self, retention_days, today=None):
+        """
+        Delete the entries sent more than retention_days ago
+        ## Returns
+        Number of entries deleted
+        """
+        if retention_days is None:
+            return 0
+        today = datetime.now() if today is None else today
+        oldest = (today - timedelta(days=retention_days)).strftime('%Y%m%d')
+        with self.lock, self.connection:
+            deleted = self.connection.execute('DELETE FROM sent_email WHERE send_date < ?', (oldest,)).rowcount
+        if deleted > 0:
+            with self.lock:
+                self.connection.execute('VACUUM')
+        return deleted
+
+
+    def import_legacy_logs(self):
+        """
+        Move the day directories of the old CSV log (yyyymmdd/email_log.csv) into the database
+        """
+        for entry in sorted(os.listdir(self.log_dir)):
+            day_dir = f'{self.log_dir}/{entry}'
+            if len(entry) != 8 or not entry.isdigit() or not os.path.isdir(day_dir):
+                continue
+            file_name = f'{day_dir}/{LEGACY_LOG_FILE}'
+            if not os.path.exists(file_name):
+                continue
+            rows = []
+            with open(file_name, 'r') as reader:
+                for line in csv.reader(reader, delimiter='|'):
+                    if len(line) == 0:
+                        continue
+                    line = (line + ['', '', ''])[:4]
+                    rows.append((entry, line[0].strip(), line[1], line[2], line[3]))
+            with self.lock, self.connection:
+                self.connection.executemany('''INSERT OR IGNORE INTO sent_email (send_date, checksum, to_email, cc_email,
+                                                                                 bcc_email)
+                                               VALUES (?, ?, ?, ?, ?)''', rows)
+            print(f'Imported {len(rows)} sent emails of {entry} into {self.db_file}')
+            os.remove(file_name)
+            if len(os.listdir(day_dir)) == 0:
+                os.rmdir(day_dir)
@@ -0,0 +1,189 @@
+from bisect import bisect_right
+from calendar_slot_utils import NUMBER_OF_SQUADS, UNASSIGNED_SQUAD
+from day_matrix import replace_first_in_row
+from models import ModifyOptions, ModifyShiftRequest
+
+"""
+Interval version of the day (an alternative to DayMatrix, see config.SHIFT_ENGINE).
+
+DayMatrix and calendar_slot_utils work in whole hours (start // 100), so a 0630 handover or a 1930 - 2030 shift
+(the half_hour_test capture) lands on the wrong hours.  IntervalDay keeps the day as sorted, non-overlapping intervals
+in minutes.  Each interval holds the squads on duty (the same 3 squad row as a matrix row) and the tango.
+
+* Like the matrix, the day runs for 48 hours from midnight and times before 0600 belong to the next morning
+* A change splits the intervals at its start and end (found with bisect), changes the rows in between, and merges
+  neighbours that end up the same.  Nothing is stored per hour
+* The intervals are plain lists: finding a boundary is O(log n), but inserting or deleting one shifts the list (O(n)).
+  A day has a handful of intervals (a few dozen at most) and a change rewrites every interval it covers anyway, so a
+  sorted container / tree would only add overhead
+* get_slots returns the same slots as DayMatrix.get_slots for whole hours, and keeps the minutes otherwise
+"""
+
+MINUTES_PER_DAY = 24 * 60
+DAY_END = 2 * MINUTES_PER_DAY
+MORNING = 6 * 60
+
+
+def to_minutes(hhmm):
+    return (hhmm // 100) * 60 + hhmm % 100
+
+
+def to_hhmm(minutes):
+    minutes = minutes % MINUTES_PER_DAY
+    return f'{minutes // 60:02d}{minutes % 60:02d}'
+
+
+def span_from_start_end(start, end):
+    """
+    Minute version of calendar_slot_utils.range_from_start_end
+    ## Returns
+    (first minute, minute after the last)
+    """
+    start_minute = to_minutes(start)
+    end_minute = to_minutes(end)
+
+    if start_minute < MORNING:
+        start_minute += MINUTES_PER_DAY
+
+    if end_minute <= start_minute:
+        end_minute += MINUTES_PER_DAY
+
+    return start_minute, min(end_minute, DAY_END)
+
+
+class IntervalDay:
+
+    def __init__(self):
+        # Interval i runs from starts[i] to starts[i+1] (the last one to DAY_END)
+        self.starts = [0]
+        self.rows = [(UNASSIGNED_SQUAD,) * NUMBER_OF_SQUADS]
+        self.tangos = [UNASSIGNED_SQUAD]
+
+
+    @classmethod
+    def from_shifts(cls, shifts: list):
+        """
+        Same as calendar_slot_utils.day_from_shifts, to the minute
+        """
+        day = cls()
+        for shift in shifts:
+            if shift.slot is None or shift.slot == '':
+                continue
+            hrs = shift.slot.replace(' ', '').split('-')
+            start = int(hrs[0])
+            end = int(hrs[1])
+            if len(shift.squads) > 0:
+                day.set_tango(start, end, shift.tango)
+            for col in shift.squads:
+                if col.number_of_trucks == 0:
+                    day.add(start, end, -1*col.squad)
+                else:
+                    for _truck in range(col.number_of_trucks):
+                        day.add(start, end, col.squad)
+        return day
+
+
+    def split(self, minute):
+        """
+        Make sure an interval starts at minute
+        ## Returns
+        index of that interval
+        """
+        idx = bisect_right(self.starts, minute) - 1
+        if self.starts[idx] == minute:
+            return idx
+        self.starts.insert(idx + 1, minute)
+        self.rows.insert(idx + 1, self.rows[idx])
+        self.tangos.insert(idx + 1, self.tangos[idx])
+        return idx + 1
+
+
+    def merge(self, first, last):
+        """
+        Merge the intervals between first and last (inclusive) that are the same as the interval before them
+        """
+        for idx in range(min(last, len(self.starts) - 1), max(first, 1) - 1, -1):
+            if self.rows[idx] == self.rows[idx - 1] and self.tangos[idx] == self.tangos[idx - 1]:
+                del self.starts[idx]
+                del self.rows[idx]
+                del self.tangos[idx]
+
+
+    def update(self, start, end, row_change=None, tango=None, set_tango=False):
+        start_minute, end_minute = span_from_start_end(start, end)
+        if start_minute >= end_minute:
+            return
+
+        first = self.split(start_minute)
+        last = self.split(end_minute) if end_minute < DAY_END else len(self.starts)
+        for idx in range(first, last):
+            if row_change is not None:
+                self.rows[idx] = replace_first_in_row(self.rows[idx], *row_change)
+            if set_tango:
+                self.tangos[idx] = tango
+        self.merge(first, last)
+
+
+    def add(self, start, end, squad):
+        # If there is a -squad (meaning "no crew"), replace it with the squad.  Otherwise take an unassigned slot
+        self.update(start, end, row_change=(-1*squad, UNASSIGNED_SQUAD, squad))
+
+
+    def remove(self, start, end, squad, modify_options: ModifyOptions):
+        # Obliterate means remove the squad from the row.  Otherwise the squad is marked as "no crew" (-squad)
+        if modify_options.obliterate:
+            modify_to_value = UNASSIGNED_SQUAD
+        else:
+            modify_to_value = -1*squad
+        self.update(start, end, row_change=(squad, -1*squad, modify_to_value))
+
+
+    def set_tango(self, start, end, squad):
+        self.update(start, end, tango=squad, set_tango=True)
+
+
+    def apply_changes(self, changes: list):
+        """
+        Apply a list of ModifyShiftRequest, in order
+        """
+        for _change in changes:
+            change: ModifyShiftRequest = _change
+            if change.modify_options.is_add:
+                self.add(change.start_time, change.end_time, change.squad)
+            else:
+                self.remove(change.start_time, change.end_time, change.squad, change.modify_options)
+
+
+    def get_slots(self, start, end):
+        """
+        Same as calendar_slot_utils.get_slots, at minute resolution.
+        ## Returns
+        slots (list): [[tango, 'HHMM - HHMM', squad1, squad2, squad3], ...]
+        """
+        start_minute, end_minute = span_from_start_end(start, end)
+        slots = []
+        idx = bisect_right(self.starts, start_minute) - 1
+        while idx < len(self.starts) and self.starts[idx] < end_minute:
+            slot_start = max(self.starts[idx], start_minute)
+            slot_end = self.starts[idx + 1] if idx + 1 < len(self.starts) else DAY_END
+            slot_end = min(slot_end, end_minute)
+            row = [self.tangos[idx], f'{to_hhmm(slot_start)} - {to_hhmm(slot_end)}']
+            row.extend(self.rows[idx])
+            slots.append(row)
+            idx += 1
+        return slots
+
+
+if __name__ == '__main__':
+    # The half_hour_test capture: squad 35 added from 1930 to 2030 on a 34 / 43 night
+    from models import SchedDate, SquadShift
+    from day_matrix import DayMatrix
+
+    shifts = [SchedDate(None, '1800 - 0600', 34, [SquadShift(34, 1, []), SquadShift(43, 1, [])])]
+    changes = [ModifyShiftRequest(1930, 2030, 35, None)]
+    for engine in [DayMatrix, IntervalDay]:
+        day = engine.from_shifts(shifts)
+        day.apply_changes(changes)
+        print(engine.__name__)
+        for slot in day.get_slots(1800, 600):
+            print(f'    {slot}')
@@ -0,0 +1,103 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import config
+from bcolors import bcolors
+
+"""
+Startup (import) time of the CLI entry points, measured with python -X importtime.
+
+The Google client libraries, gspread, rich, simple_term_menu, dill and numpy are imported on first use (see
+SheetsSession).  This script catches them creeping back into startup:
+* an entry point that imports one of LAZY_MODULES at startup fails
+* an entry point whose import time is more than TOLERANCE x the saved baseline fails
+
+Usage:
+    python startup_benchmark.py           # compare with the baseline
+    python startup_benchmark.py --save    # save the current timings as the baseline
+"""
+
+ENTRY_POINTS = ['collab_i', 'crew_notifier', 'new_calendar_builder']
+LAZY_MODULES = ['googleapiclient.discovery', 'google_auth_oauthlib', 'google.oauth2.credentials', 'gspread',
+                'gspread_formatting', 'rich', 'simple_term_menu', 'dill', 'numpy']
+BASELINE_FILE = f'{config.TEST_PATH}/expected_results/startup_importtime.json'
+TOLERANCE = 1.5
+RUNS = 5
+
+
+def import_times(module):
+    """
+    Import module in a fresh interpreter with -X importtime
+    ## Returns
+    dict: key = module imported, value = cumulative import time (microseconds)
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode != 0:
+        raise RuntimeError(f'Unable to import {module}: {result.stderr.strip().splitlines()[-1]}')
+
+    times = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _self_time, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def measure(module, runs=RUNS):
+    """
+    ## Returns
+    (best startup time in ms, modules imported, heaviest modules [(name, ms), ...])
+    """
+    interpreter_modules = set(import_times('sys').keys())   # site, encodings... imported before any entry point
+    best = None
+    for _ in range(runs):
+        times = import_times(module)
+        if best is None or times[module] < best[module]:
+            best = times
+    heaviest = sorted([(name, cumulative / 1000) for name, cumulative in best.items()
+                       if name != module and name not in interpreter_modules],
+                      key=lambda entry: entry[1], reverse=True)[:5]
+    return best[module] / 1000, set(best.keys()), heaviest
+
+
+def run_benchmark(save=False):
+    baseline = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE, 'r') as reader:
+            baseline = json.load(reader)
+
+    results = {}
+    failures = []
+    for module in ENTRY_POINTS:
+        startup_ms, imported, heaviest = measure(module)
+        results[module] = round(startup_ms, 1)
+        print(f'{module:22} {startup_ms:8.1f} ms   (baseline: {baseline.get(module, "-")})')
+        for name, cumulative_ms in heaviest:
+            print(f'    {name:40} {cumulative_ms:8.1f} ms')
+
+        eager = [name for name in LAZY_MODULES if name in imported]
+        if len(eager) > 0:
+            failures.append(f'{module} imports {", ".join(eager)} at startup')
+        if not save and module in baseline and startup_ms > baseline[module] * TOLERANCE:
+            failures.append(f'{module} starts in {startup_ms:.1f} ms, more than {TOLERANCE}x the baseline ({baseline[module]} ms)')
+
+    if save:
+        with open(BASELINE_FILE, 'w') as writer:
+            json.dump(results, writer, indent=4)
+        print(f'Saved baseline to {BASELINE_FILE}')
+
+    for failure in failures:
+        print(f'{bcolors.FAIL}{failure}{bcolors.ENDC}')
+    return len(failures) == 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Startup time of the CLI entry points')
+    parser.add_argument('--save', action='store_true', default=False, help='Save the timings as the new baseline')
+    args = parser.parse_args()
+    sys.exit(0 if run_benchmark(args.save) else 1)
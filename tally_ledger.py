@@ -0,0 +1,166 @@
+from collections import defaultdict
+import json
+import os
+import threading
+import config
+from models import SchedDate, SquadShift, squads
+
+"""
+Running hour and tango tallies of each month, kept on disk between runs.
+
+tally_shifts reads and parses the whole month to count the hours.  The ledger keeps the totals instead, and each edit
+(add_remove_shifts, assign_tango, apply_changes...) applies the difference between the day before and after the edit.
+The summary cells (HOURS_COMMITTED, TANGO_HOURS) are then written in the same batchUpdate as the day, so keeping them
+current costs the slots that changed, not a month.
+
+A month is seeded from the cached month the first time it is edited and every time the whole month is tallied.  The
+totals are saved with the key of the month block they were tallied from (see CachedGCal.get_month_key): each time the
+month is read from the sheet, in this run or a later one, the saved totals are kept if the key still matches and the
+month is seeded again if it doesn't (it was edited by hand or from another machine).  The changes of an edit are only
+saved once its batchUpdate went through: if it failed, the months it touched are dropped and seeded again from the sheet.
+
+Files: {config_dir}/{config.TALLY_LEDGER_DIR}/{spreadsheet id}.json
+"""
+
+def tally_day(shifts, slot_hours):
+    """Count the hours of a day (same rules as CollabCalendarManager.tally_shifts)
+
+    ## Parameters
+    * shifts: list of SchedDate
+    * slot_hours: method returning the hours of a slot ('1800 - 0600' -> 12)
+
+    ## Returns
+    (hours_by_squad, tango_hours): dicts, key = squad
+    """
+    hours_by_squad = defaultdict(int)
+    tango_hours = defaultdict(int)
+    for _shift in shifts:
+        shift: SchedDate = _shift
+        shift_hours = slot_hours(shift.slot)
+        if shift.tango is not None and shift.tango != 100:
+            tango_hours[shift.tango] += shift_hours
+        for _squad in shift.squads:
+            squad: SquadShift = _squad
+            hours_by_squad[squad.squad] += squad.number_of_trucks * shift_hours
+    return hours_by_squad, tango_hours
+
+
+class TallyLedger:
+
+    def __init__(self, ledger_file):
+        self.ledger_file = ledger_file
+        self.lock = threading.RLock()
+        self.months = {}    # key = tab name, value = {'hours': {squad: hours}, 'tango': {squad: hours}, 'month_key': str}
+        self.load()
+
+
+    def load(self):
+        """
+        Read the ledger from disk (changes that were not saved are dropped)
+        """
+        with self.lock:
+            self.months = {}
+            if not os.path.exists(self.ledger_file):
+                return
+            try:
+                with open(self.ledger_file, 'r') as reader:
+                    saved = json.load(reader)
+            except (OSError, ValueError) as e:
+                print(f'Ignoring unreadable tally ledger {self.ledger_file}: {e}')
+                return
+            # JSON keys are strings
+            for tab, month in saved.items():
+                self.months[tab] = {kind: {int(squad): hours for squad, hours in month[kind].items()}
+                                    for kind in ('hours', 'tango')}
+                self.months[tab]['month_key'] = month.get('month_key')
+
+
+    def save(self):
+        with self.lock:
+            if not os.path.exists(os.path.dirname(self.ledger_file)):
+                os.makedirs(os.path.dirname(self.ledger_file))
+            temp_file = f'{self.ledger_file}.tmp'
+            with open(temp_file, 'w') as writer:
+                json.dump(self.months, writer, indent=4)
+            os.replace(temp_file, self.ledger_file)
+
+
+    def has_month(self, tab):
+        return tab in self.months
+
+
+    def drop_month(self, tab):
+        """
+        Forget the totals of a month (it is seeded again from the sheet when it is next edited)
+        """
+        with self.lock:
+            self.months.pop(tab, None)
+
+
+    def reset_month(self, tab, hours_by_squad, tango_hours, month_key=None):
+        """
+        Set the totals of a month (from a tally of the whole month)
+        """
+        with self.lock:
+            self.months[tab] = {'hours': {squad: hours for squad, hours in hours_by_squad.items()},
+                                'tango': {squad: hours for squad, hours in tango_hours.items()},
+                                'month_key': month_key}
+
+
+    def get_month_key(self, tab):
+        """
+        The key of the month block the totals were tallied from (None if not known)
+        """
+        with self.lock:
+            month = self.months.get(tab)
+            return month.get('month_key') if month is not None else None
+
+
+    def set_month_key(self, tab, month_key):
+        with self.lock:
+            if tab in self.months:
+                self.months[tab]['month_key'] = month_key
+
+
+    def apply_day(self, tab, old_tally, new_tally):
+        """Apply the change of one day to the totals of its month
+
+        ## Parameters
+        * old_tally, new_tally: tally_day of the day before and after the change
+        """
+        with self.lock:
+            month = self.months[tab]
+            for kind, old, new in (('hours', old_tally[0], new_tally[0]), ('tango', old_tally[1], new_tally[1])):
+                totals = month[kind]
+                for squad in set(old.keys()) | set(new.keys()):
+                    delta = new.get(squad, 0) - old.get(squad, 0)
+                    if delta != 0:
+                        totals[squad] = totals.get(squad, 0) + delta
+
+
+    def get_rows(self, tab):
+        """
+        ## Returns
+        (hours row, tango row) of the month, one column per squad (34, 35, 42, 43, 54)
+        """
+        with self.lock:
+            month = self.months[tab]
+            return ([month['hours'].get(squad, 0) for squad in squads],
+                    [month['tango'].get(squad, 0) for squad in squads])
+
+
+tally_ledgers = {}
+tally_ledgers_lock = threading.Lock()
+
+def get_tally_ledger(config_dir, spreadsheet_id) -> TallyLedger:
+    """
+    The process-wide ledger of the spreadsheet.  None if there is no config_dir or config.TALLY_LEDGER_DIR is None
+    """
+    if config_dir is None or config.TALLY_LEDGER_DIR is None:
+        return None
+
+    ledger_file = f'{config_dir}/{config.TALLY_LEDGER_DIR}/{spreadsheet_id}.json'
+    with tally_ledgers_lock:
+        if ledger_file not in tally_ledgers:
+            tally_ledgers[ledger_file] = TallyLedger(ledger_file)
+        return tally_ledgers[ledger_file]
@@ -3,7 +3,6 @@ from bcolors import bcolors
 import time
 import sys
 import os
-import dill
 
 from global_testing_state import GlobalTestState
 
@@ -24,6 +23,7 @@ def shift_testing_capture(func=None, logger=None):
         return capture_path
 
     def find_captured_calendar_day(*args, **kwargs):
+        import dill
         test_id = GlobalTestState.getInstance().get_test_id()
 
         test_input_file = f'get_day_from_calendar'
@@ -41,6 +41,9 @@ def shift_testing_capture(func=None, logger=None):
         """
         if GlobalTestState.getInstance().get_test_capture_mode() == False:
             return func(*args, **kwargs)
+
+        # dill is only needed when capturing (it is slow to import)
+        import dill
                 
         # ---------------------------------------------------
         # Invoke the method and capture the return value
@@ -66,6 +69,7 @@ def shift_testing_capture(func=None, logger=None):
         """
         Handler for the write_day_to_calendar method.  Capture the parameters that are passed into the method
         """
+        import dill
         with open(f'{get_test_folder()}/write_day_to_calendar_response_args.dill', 'wb') as file:
             file.write(dill.dumps(args[1:]))
 
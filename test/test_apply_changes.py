@@ -0,0 +1,59 @@
+import contextlib
+import datetime
+import io
+from ast import literal_eval
+import pytest
+from models import ModifyOptions, ModifyShiftRequest
+
+"""
+CollabCalendarManager.apply_changes against the local fake of the Sheets API (fake_sheets_server.py).
+
+Needs spreadsheet_info (not in the repo) and the Google client libraries: skipped without them.
+"""
+
+TERRITORY_MAP_FILE = 'test/test_cases/config_data/territory_map.json'
+MONTH_FILE = 'test/test_cases/expected_results/May_2024.txt'
+
+
+@pytest.fixture
+def manager(tmp_path):
+    spreadsheet_info = pytest.importorskip('spreadsheet_info')
+    pytest.importorskip('googleapiclient')
+    from google.auth.credentials import AnonymousCredentials
+    from collab_cal_mgr import CollabCalendarManager
+    from fake_sheets_server import start_fake_sheets_server
+    from google_calendar_mgr import set_sheets_endpoint
+
+    server = start_fake_sheets_server()
+    with open(MONTH_FILE, 'r') as reader:
+        server.write_range('May 2024!B6:AC65', literal_eval(reader.read()))
+    set_sheets_endpoint(spreadsheet_info.BETA_COLLAB_CALENDAR_SPREADSHEET_ID, f'http://127.0.0.1:{server.server_port}',
+                        AnonymousCredentials())
+    with contextlib.redirect_stdout(io.StringIO()):
+        collab_cal_manager = CollabCalendarManager('devo', str(tmp_path), interactive_mode=False)
+        collab_cal_manager.set_calendar_tab('May 2024')
+    collab_cal_manager.server = server
+    yield collab_cal_manager
+    server.shutdown()
+
+
+def apply_changes(collab_cal_manager, days):
+    with open(TERRITORY_MAP_FILE, 'r') as reader:
+        territory_map = literal_eval(reader.read())
+    changes_by_date = {datetime.datetime(2024, 5, day): [ModifyShiftRequest(1800, 2100, 43, None, ModifyOptions(is_add=True))]
+                       for day in days}
+    with contextlib.redirect_stdout(io.StringIO()):
+        return collab_cal_manager.apply_changes(changes_by_date, territory_map)
+
+
+def test_changes_applied_and_audited(manager):
+    assert apply_changes(manager, [8, 9]) == 2
+    assert manager.audit_log.rows_sent == 2
+
+
+def test_failed_write_not_reported_or_audited(manager, monkeypatch):
+    # GCal returns the HttpError of a batchUpdate that failed
+    monkeypatch.setattr(manager.gcal, 'batch_update_values', lambda data, value_input_option: Exception('HttpError 400'))
+    assert apply_changes(manager, [8, 9]) == 0
+    assert manager.audit_log.rows_sent == 0
+    assert not manager.tally_ledger.has_month('May 2024')
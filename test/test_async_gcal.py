@@ -0,0 +1,85 @@
+import asyncio
+import threading
+from datetime import datetime
+import pytest
+
+"""
+AsyncGCal (async_google_calendar_mgr.py) against the local fake of the Sheets API (fake_sheets_server.py).
+
+Needs spreadsheet_info (not in the repo) and the Google client libraries: skipped without them.
+"""
+
+DATES = [datetime(2024, 5, day) for day in range(1, 7)]
+
+
+@pytest.fixture
+def gcal(monkeypatch):
+    spreadsheet_info = pytest.importorskip('spreadsheet_info')
+    pytest.importorskip('googleapiclient')
+    from google.auth.credentials import AnonymousCredentials
+    import rate_limiter
+    from fake_sheets_server import start_fake_sheets_server
+    from google_calendar_mgr import GCal, set_sheets_endpoint
+
+    # The fake server has no quota
+    monkeypatch.setattr(rate_limiter, 'rate_limiter', rate_limiter.RateLimiter(requests_per_minute=6000, burst=100))
+
+    server = start_fake_sheets_server(latency=0.05)
+    set_sheets_endpoint(spreadsheet_info.BETA_COLLAB_CALENDAR_SPREADSHEET_ID, f'http://127.0.0.1:{server.server_port}',
+                        AnonymousCredentials())
+    gcal = GCal(spreadsheet_info.BETA_COLLAB_CALENDAR_SPREADSHEET_ID)
+    gcal.set_calendar_tab('May 2024')
+    yield gcal
+    server.shutdown()
+
+
+class InFlight:
+    """
+    Wraps a GCal method to count the calls running at the same time
+    """
+
+    def __init__(self, method):
+        self.method = method
+        self.lock = threading.Lock()
+        self.running = 0
+        self.most = 0
+
+    def __call__(self, *args):
+        with self.lock:
+            self.running += 1
+            self.most = max(self.most, self.running)
+        try:
+            return self.method(*args)
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+def test_days_read_concurrently(gcal):
+    from async_google_calendar_mgr import AsyncGCal
+    serial = [gcal.get_day_from_calendar(target_date) for target_date in DATES]
+    in_flight = InFlight(gcal.get_day_from_calendar)
+    gcal.get_day_from_calendar = in_flight
+
+    async def read_days():
+        async with AsyncGCal(gcal, max_concurrency=2) as async_gcal:
+            return await async_gcal.get_days_from_calendar(DATES)
+
+    assert asyncio.run(read_days()) == serial
+    assert in_flight.most == 2
+
+
+def test_used_from_two_event_loops(gcal):
+    from async_google_calendar_mgr import AsyncGCal
+    async_gcal = AsyncGCal(gcal, max_concurrency=2)
+    first = asyncio.run(async_gcal.get_days_from_calendar(DATES))
+    # A second asyncio.run is another event loop
+    second = asyncio.run(async_gcal.get_days_from_calendar(DATES))
+    assert first == second
+    assert async_gcal.requests_sent == 2 * len(DATES)
+
+    async_gcal.close()
+    assert async_gcal.executor is None
+    # Still usable: the worker threads are started again
+    assert asyncio.run(async_gcal.get_day_from_calendar(DATES[0])) == first[0]
+    async_gcal.close()
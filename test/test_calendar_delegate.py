@@ -0,0 +1,73 @@
+import datetime
+from ast import literal_eval
+from models import CalendarTab
+from transactioned_calendar_delegate import CalendarDelegate
+
+"""
+CalendarDelegate transactions (transactioned_calendar_delegate.py), with a calendar standing in for Google.
+"""
+
+MONTH_FILE = 'test/test_cases/expected_results/May_2024.txt'
+MAY_7 = datetime.date(2024, 5, 7)
+
+
+class FakeGCal:
+
+    def __init__(self, failures=0):
+        with open(MONTH_FILE, 'r') as reader:
+            self.month = literal_eval(reader.read())
+        self.failures = failures    # batchUpdates that fail before they start to work
+        self.batches = []
+
+    def get_data_from_calendar(self, location):
+        return self.month
+
+    def batch_update_values(self, data, value_input_option):
+        if self.failures > 0:
+            self.failures -= 1
+            # GCal returns the HttpError
+            return Exception('HttpError 500')
+        self.batches.append([location for location, _rows in data])
+        return {'totalUpdatedCells': 1}
+
+
+def edit_day(delegate):
+    rows = [list(row) for row in delegate.get_day_from_calendar(MAY_7)]
+    rows[1][0] = '0600 - 1200' if rows[1][0] != '0600 - 1200' else '0600 - 1300'
+    delegate.write_day_to_calendar(MAY_7, rows)
+
+
+def test_dirty_ranges_written():
+    gcal = FakeGCal()
+    delegate = CalendarDelegate(gcal, CalendarTab.from_date(MAY_7))
+    delegate.begin_transaction()
+    edit_day(delegate)
+    assert delegate.end_transaction() == {'totalUpdatedCells': 1}
+    assert len(gcal.batches) == 1
+    assert not delegate.in_transaction
+
+
+def test_failed_write_can_be_retried():
+    gcal = FakeGCal(failures=1)
+    delegate = CalendarDelegate(gcal, CalendarTab.from_date(MAY_7))
+    delegate.begin_transaction()
+    edit_day(delegate)
+    assert isinstance(delegate.end_transaction(), Exception)
+    # Still open, with the same changes
+    assert delegate.in_transaction
+
+    assert delegate.end_transaction() == {'totalUpdatedCells': 1}
+    assert len(gcal.batches) == 1 and len(gcal.batches[0]) > 0
+
+
+def test_failed_write_rolled_back():
+    gcal = FakeGCal(failures=1)
+    delegate = CalendarDelegate(gcal, CalendarTab.from_date(MAY_7))
+    delegate.begin_transaction()
+    edit_day(delegate)
+    delegate.end_transaction()
+    delegate.rollback()
+    # A new transaction starts from the sheet
+    delegate.begin_transaction()
+    assert delegate.end_transaction() is None
+    assert gcal.batches == []
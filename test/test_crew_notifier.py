@@ -0,0 +1,147 @@
+import contextlib
+import datetime
+import io
+import smtplib
+import threading
+from types import SimpleNamespace
+import pytest
+from models import CalendarDay, SchedDate, SquadShift
+
+"""
+crew_notifier passes, with a calendar and an SMTP server standing in for Google and Yahoo.
+
+crew_notifier imports the calendar manager, which needs spreadsheet_info (not in the repo): skipped without it.
+"""
+
+crew_notifier = pytest.importorskip('crew_notifier', exc_type=ImportError)
+
+
+class FakeCalendar:
+
+    def __init__(self):
+        self.days = {}      # key = date, value = [SchedDate, ...]
+
+    def get_range(self, start_date, end_date, existing_tabs_only=False):
+        calendar_days = []
+        day = start_date
+        while day <= end_date:
+            calendar_days.append(CalendarDay(day, self.days.get(day.date(), [])))
+            day += datetime.timedelta(days=1)
+        return calendar_days
+
+
+class FakeSmtpServer:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.messages = []      # [(recipients, message), ...]
+        self.refuse = False     # Every email is rejected (not retried by the SmtpPool)
+
+    def sendmail(self, from_email, recipients, message):
+        if self.refuse:
+            raise smtplib.SMTPDataError(550, b'Mailbox unavailable')
+        with self.lock:
+            self.messages.append((recipients, message))
+
+    def quit(self):
+        pass
+
+
+@pytest.fixture
+def notifier(tmp_path, monkeypatch):
+    from email_manager import Notifier, SmtpPool
+    from notification_snapshot import NotificationSnapshots
+    from outbox import Outbox, OutboxWorker
+
+    monkeypatch.setenv('YAHOO_EMAIL', 'sender@localhost')
+    monkeypatch.setenv('YAHOO_PASSWORD', '')
+    smtp_server = FakeSmtpServer()
+    monkeypatch.setattr(SmtpPool, 'connect', lambda self: smtp_server)
+
+    calendar = FakeCalendar()
+    for day in range(5, 12):
+        target_date = datetime.datetime(2024, 5, day)
+        calendar.days[target_date.date()] = [
+            SchedDate(target_date, '0600 - 1800', 35, [SquadShift(35, 1, [35]), SquadShift(42, 1, [42])]),
+            SchedDate(target_date, '1800 - 0600', 43, [SquadShift(43, 2, [43, 34])])]
+
+    email_manager = Notifier(str(tmp_path), None)
+    outbox = Outbox(str(tmp_path))
+    notification_snapshots = NotificationSnapshots(f'{tmp_path}/snapshots.json')
+    monkeypatch.setattr(crew_notifier, 'collab_cal_manager', calendar)
+    monkeypatch.setattr(crew_notifier, 'target_date', datetime.datetime(2024, 5, 7))
+    monkeypatch.setattr(crew_notifier, 'args', SimpleNamespace(daemon=False, enqueue_only=False, to_test_email=False,
+                                                                force_notification=False))
+    monkeypatch.setattr(crew_notifier, 'email_manager', email_manager)
+    monkeypatch.setattr(crew_notifier, 'outbox', outbox)
+    monkeypatch.setattr(crew_notifier, 'outbox_worker', OutboxWorker(outbox, email_manager, poll_interval=0.1,
+                                                                     on_sent=notification_snapshots.record_sent))
+    monkeypatch.setattr(crew_notifier, 'notification_snapshots', notification_snapshots)
+    monkeypatch.setattr(crew_notifier, 'contacts', {str(squad): SimpleNamespace(to_list=f'squad{squad}@localhost', cc_list=None)
+                                                    for squad in crew_notifier.squads})
+    yield SimpleNamespace(calendar=calendar, smtp_server=smtp_server, outbox=outbox)
+    outbox.close()
+    email_manager.send_log.close()
+
+
+def run_pass():
+    with contextlib.redirect_stdout(io.StringIO()):
+        crew_notifier.notify_crews()
+
+
+def digests(smtp_server):
+    return [message for _recipients, message in smtp_server.messages if crew_notifier.digest_subject in message]
+
+
+def digest_rows(digest):
+    """
+    The emails listed in a digest (rows of its html table)
+    """
+    return digest.count('<tr style="border: 1px solid blue')
+
+
+def test_second_pass_sends_nothing(notifier):
+    run_pass()
+    # Squads 35, 42 and 43 have shifts or tangos, then the digest
+    assert len(notifier.smtp_server.messages) == 4
+    assert digest_rows(digests(notifier.smtp_server)[0]) == 3
+
+    run_pass()
+    assert len(notifier.smtp_server.messages) == 4
+
+
+def test_digest_leaves_out_earlier_digests(notifier):
+    run_pass()
+    # Every squad's shifts change on the 8th
+    target_date = datetime.datetime(2024, 5, 8)
+    notifier.calendar.days[target_date.date()] = [SchedDate(target_date, '0600 - 1800', 35, [SquadShift(54, 1, [54])])]
+    run_pass()
+
+    assert len(notifier.smtp_server.messages) == 4 + 5
+    # The crew emails of both passes, not the first digest
+    assert digest_rows(digests(notifier.smtp_server)[-1]) == 3 + 4
+
+
+
+def test_squad_given_up_on_is_emailed_again(notifier, monkeypatch):
+    import config
+    from outbox import FAILED
+    # The pass doesn't wait for the retries
+    monkeypatch.setattr(config, 'OUTBOX_DRAIN_TIMEOUT', 0.5)
+    notifier.smtp_server.refuse = True
+    run_pass()
+    # Tried until the outbox gives up
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _attempt in range(config.OUTBOX_MAX_ATTEMPTS):
+            with notifier.outbox.connection:
+                notifier.outbox.connection.execute('UPDATE outbox SET next_attempt = 0')
+            crew_notifier.outbox_worker.drain()
+    assert notifier.outbox.count(FAILED) == 3
+    assert crew_notifier.notification_snapshots.get(35) is None
+
+    notifier.smtp_server.refuse = False
+    run_pass()
+    assert len(notifier.smtp_server.messages) == 4
+    assert crew_notifier.notification_snapshots.get(35) is not None
+    run_pass()
+    assert len(notifier.smtp_server.messages) == 4
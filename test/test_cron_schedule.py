@@ -0,0 +1,71 @@
+from datetime import datetime
+import pytest
+from cron_schedule import CronSchedule, parse_field
+
+"""
+Cron schedules of crew_notifier --daemon (cron_schedule.py).
+"""
+
+
+def test_parse_field_steps():
+    assert parse_field('*/15', 0, 59) == {0, 15, 30, 45}
+    assert parse_field('6-21/5', 0, 23) == {6, 11, 16, 21}
+    assert parse_field('50/5', 0, 59) == {50, 55}
+    assert parse_field('0,30', 0, 59) == {0, 30}
+
+
+@pytest.mark.parametrize('field', ['60', '5-2', '*/0', 'x'])
+def test_parse_field_invalid(field):
+    with pytest.raises(ValueError):
+        parse_field(field, 0, 59)
+
+
+def test_every_15_minutes():
+    schedule = CronSchedule('*/15 6-21 * * *')
+    assert schedule.next_run(datetime(2024, 5, 7, 10, 1)) == datetime(2024, 5, 7, 10, 15)
+    assert schedule.next_run(datetime(2024, 5, 7, 10, 15, 30)) == datetime(2024, 5, 7, 10, 30)
+    # After the last run of the day: the first one of the next day
+    assert schedule.next_run(datetime(2024, 5, 7, 21, 45)) == datetime(2024, 5, 8, 6, 0)
+    assert schedule.next_run(datetime(2024, 12, 31, 23, 59)) == datetime(2025, 1, 1, 6, 0)
+
+
+def test_day_of_month_or_weekday():
+    # The 1st of the month or a Monday
+    schedule = CronSchedule('0 8 1 * 1')
+    # Tue 7 May 2024 -> Mon 13 May
+    assert schedule.next_run(datetime(2024, 5, 7)) == datetime(2024, 5, 13, 8, 0)
+    # Tue 28 May 2024 -> Sat 1 June (before Mon 3 June)
+    assert schedule.next_run(datetime(2024, 5, 28)) == datetime(2024, 6, 1, 8, 0)
+
+
+def test_day_of_month_and_any_weekday():
+    # Only one of the two is given: both have to match
+    assert CronSchedule('0 8 1 * *').next_run(datetime(2024, 5, 7)) == datetime(2024, 6, 1, 8, 0)
+    assert CronSchedule('0 8 * * 1').next_run(datetime(2024, 5, 7)) == datetime(2024, 5, 13, 8, 0)
+
+
+def test_stepped_star_does_not_restrict():
+    # Odd days that are Mondays, not odd days or Mondays: Tue 7 May 2024 -> Mon 13 May
+    assert CronSchedule('0 8 */2 * 1').next_run(datetime(2024, 5, 7)) == datetime(2024, 5, 13, 8, 0)
+    # Sun, Tue, Thu or Sat that are the 1st: Tue 7 May 2024 -> Sat 1 June
+    assert CronSchedule('0 8 1 * */2').next_run(datetime(2024, 5, 7)) == datetime(2024, 6, 1, 8, 0)
+
+
+def test_sunday_is_0_and_7():
+    # Sun 12 May 2024
+    assert CronSchedule('0 8 * * 0').next_run(datetime(2024, 5, 7)) == datetime(2024, 5, 12, 8, 0)
+    assert CronSchedule('0 8 * * 7').next_run(datetime(2024, 5, 7)) == datetime(2024, 5, 12, 8, 0)
+
+
+def test_leap_day():
+    assert CronSchedule('0 0 29 2 *').next_run(datetime(2024, 3, 1)) == datetime(2028, 2, 29, 0, 0)
+
+
+def test_never_runs():
+    with pytest.raises(ValueError):
+        CronSchedule('0 0 31 2 *').next_run(datetime(2024, 5, 7))
+
+
+def test_five_fields():
+    with pytest.raises(ValueError):
+        CronSchedule('*/15 6-21 * *')
@@ -0,0 +1,76 @@
+import random
+import pytest
+from calendar_slot_utils import add_to_calendar, build_day, build_tango_slots, day_from_shifts, get_slots, \
+    remove_from_calendar
+from day_matrix import DayMatrix
+from models import ModifyOptions, ModifyShiftRequest, SchedDate, SquadShift
+
+"""
+DayMatrix (day_matrix.py) against the list functions of calendar_slot_utils it replaced in add_remove_shifts.
+"""
+
+SQUADS = [34, 35, 42, 43, 54]
+SLOTS = ['0600 - 1800', '1800 - 0600', '0600 - 1200', '1200 - 1800', '1800 - 2300', '2300 - 0600', '0000 - 0600']
+
+
+def apply_lists(shifts, changes, start, end):
+    if shifts is None:
+        tango_array, matrix = build_tango_slots(), build_day()
+    else:
+        tango_array, matrix = day_from_shifts(shifts)
+    for change in changes:
+        if change.modify_options.is_add:
+            add_to_calendar(matrix, change.start_time, change.end_time, change.squad)
+        else:
+            remove_from_calendar(matrix, change.start_time, change.end_time, change.squad, change.modify_options)
+    return get_slots(tango_array, matrix, start, end), matrix
+
+
+def apply_day_matrix(shifts, changes, start, end):
+    day = DayMatrix() if shifts is None else DayMatrix.from_shifts(shifts)
+    day.apply_changes(changes)
+    return day.get_slots(start, end), day.matrix.tolist()
+
+
+def random_shifts(rand):
+    shifts = []
+    for slot in rand.sample(SLOTS, rand.randint(0, 3)):
+        on_duty = rand.sample(SQUADS, rand.randint(0, 3))
+        shifts.append(SchedDate(None, slot, rand.choice(on_duty) if on_duty else None,
+                                [SquadShift(squad, rand.randint(0, 2), []) for squad in on_duty]))
+    return shifts
+
+
+def random_changes(rand):
+    changes = []
+    for _change in range(rand.randint(1, 8)):
+        start = rand.choice(range(0, 2400, 100))
+        end = rand.choice(range(0, 2400, 100))
+        changes.append(ModifyShiftRequest(start, end, rand.choice(SQUADS), None,
+                                          ModifyOptions(is_add=rand.random() < 0.6, obliterate=rand.random() < 0.5)))
+    return changes
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_same_as_lists(seed):
+    rand = random.Random(seed)
+    for _case in range(100):
+        shifts = None if rand.random() < 0.1 else random_shifts(rand)
+        changes = random_changes(rand)
+        start, end = rand.choice([(600, 600), (0, 2400), (1800, 600)])
+        assert apply_day_matrix(shifts, changes, start, end) == apply_lists(shifts, changes, start, end), \
+            (shifts, changes, start, end)
+
+
+def test_add_remove_day():
+    shifts = [SchedDate(None, '0600 - 1800', 35, [SquadShift(35, 1, []), SquadShift(42, 1, [])]),
+              SchedDate(None, '1800 - 0600', 43, [SquadShift(43, 2, [])])]
+    changes = [ModifyShiftRequest(1200, 1800, 54, None, ModifyOptions(is_add=True)),
+               ModifyShiftRequest(1800, 2100, 43, None, ModifyOptions(is_add=False, obliterate=False)),
+               ModifyShiftRequest(600, 1200, 42, None, ModifyOptions(is_add=False, obliterate=True))]
+    slots, _matrix = apply_day_matrix(shifts, changes, 600, 600)
+    # 100 = unassigned
+    assert slots == [[35, '0600 - 1200', 35, 100, 100],
+                     [35, '1200 - 1800', 35, 42, 54],
+                     [43, '1800 - 2100', -43, 43, 100],
+                     [43, '2100 - 0600', 43, 43, 100]]
@@ -0,0 +1,147 @@
+import asyncio
+import contextlib
+import io
+import smtplib
+import socket
+import time
+import pytest
+from email_manager import Notifier, OutgoingEmail, SmtpPool
+
+"""
+SMTP sessions of email_manager (SmtpPool, Notifier.send_emails) against a local aiosmtpd server.
+
+Needs aiosmtpd (requirements-dev.txt): skipped without it.
+"""
+
+controller_module = pytest.importorskip('aiosmtpd.controller')
+
+MESSAGE = 'Subject: Test\n\nBody\n'
+
+
+class Handler:
+    """
+    Counts the sessions (EHLO) and the messages received.  replies: answers to give to the next messages instead of
+    '250 OK'.  drop_after_reply: close the session just after the next message is accepted
+    """
+
+    def __init__(self):
+        self.sessions = 0
+        self.received = []
+        self.replies = []
+        self.drop_after_reply = False
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.sessions += 1
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        if len(self.replies) > 0:
+            return self.replies.pop(0)
+        self.received.append(envelope.rcpt_tos)
+        if self.drop_after_reply:
+            self.drop_after_reply = False
+            asyncio.get_running_loop().call_later(0.05, server.transport.close)
+        return '250 OK'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_server():
+    handler = Handler()
+    controller = controller_module.Controller(handler, hostname='127.0.0.1', port=free_port())
+    controller.start()
+    handler.port = controller.port
+    yield handler
+    controller.stop()
+
+
+def make_pool(smtp_server, max_sessions=1, max_retries=2):
+    return SmtpPool('127.0.0.1', smtp_server.port, None, None, use_ssl=False, max_sessions=max_sessions, timeout=5,
+                    max_retries=max_retries)
+
+
+def send(pool, to_email='crew@localhost'):
+    with contextlib.redirect_stdout(io.StringIO()):
+        pool.sendmail('sender@localhost', [to_email], MESSAGE)
+
+
+def test_session_reused(smtp_server):
+    pool = make_pool(smtp_server)
+    for _message in range(3):
+        send(pool)
+    pool.close()
+    assert len(smtp_server.received) == 3
+    assert smtp_server.sessions == 1
+    assert pool.connects == 1 and pool.reconnects == 0
+
+
+def test_reconnect_after_session_dropped(smtp_server):
+    pool = make_pool(smtp_server)
+    smtp_server.drop_after_reply = True
+    send(pool)
+    # The server closed the idle session
+    time.sleep(0.2)
+    send(pool)
+    pool.close()
+    assert len(smtp_server.received) == 2
+    assert pool.connects == 2 and pool.reconnects == 1
+
+
+def test_reconnect_after_421(smtp_server):
+    pool = make_pool(smtp_server)
+    smtp_server.replies = ['421 Service not available, closing transmission channel']
+    send(pool)
+    pool.close()
+    assert len(smtp_server.received) == 1
+    assert pool.connects == 2 and pool.reconnects == 1
+
+
+def test_gives_up_after_max_retries(smtp_server):
+    pool = make_pool(smtp_server, max_retries=2)
+    smtp_server.replies = ['421 Service not available'] * 3
+    with pytest.raises(smtplib.SMTPResponseException):
+        send(pool)
+    pool.close()
+    assert smtp_server.received == []
+    assert pool.connects == 3
+
+
+def test_refused_is_not_retried(smtp_server):
+    pool = make_pool(smtp_server)
+    smtp_server.replies = ['550 Mailbox unavailable']
+    with pytest.raises(smtplib.SMTPDataError):
+        send(pool)
+    # The session is still good
+    send(pool)
+    pool.close()
+    assert len(smtp_server.received) == 1
+    assert pool.connects == 1 and pool.reconnects == 0
+
+
+def test_send_emails_with_workers(smtp_server, tmp_path, monkeypatch):
+    monkeypatch.setenv('YAHOO_EMAIL', 'sender@localhost')
+    monkeypatch.setenv('YAHOO_PASSWORD', '')
+    notifier = Notifier(str(tmp_path), None, smtp_host='127.0.0.1', smtp_port=smtp_server.port, use_ssl=False,
+                        login=False)
+    emails = [OutgoingEmail(f'Test {i}', f'Text {i}', f'<p>Body {i}</p>', f'crew{i}@localhost') for i in range(9)]
+    # One of them is refused: the others are still sent
+    smtp_server.replies = ['550 Mailbox unavailable']
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = notifier.send_emails(emails, workers=3)
+    assert [result.to_email for result in results] == [email.to_email for email in emails]
+    assert sum(1 for result in results if result.sent) == 8
+    assert sum(1 for result in results if result.error is not None) == 1
+    assert len(smtp_server.received) == 8
+    # One session per worker at most
+    assert smtp_server.sessions <= 3
+
+    # Sent today: not sent again
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = notifier.send_emails(emails, workers=3)
+    assert sum(1 for result in results if result.sent) == 1
@@ -0,0 +1,81 @@
+import contextlib
+import io
+from calendar import monthrange
+from datetime import datetime
+import pytest
+from month_layout import get_layout, get_month_layout, location_to_offsets
+
+"""
+Where each day sits on the month grid (month_layout.py).
+"""
+
+
+def grid_cell_range(target_date):
+    """
+    The rows below the header of a day, worked out the way GCal.get_cell_range did before MonthLayout
+    """
+    days_offsets = [('F', 'I'), ('J', 'M'), ('N', 'Q'), ('R', 'U'), ('V', 'Y'), ('Z', 'AC'), ('B', 'E')]
+    first_day = target_date.replace(day=1)
+    days_on_first_row = 7 - (0 if first_day.weekday() == 6 else first_day.weekday() + 1)
+    if target_date.day <= days_on_first_row:
+        month_row = 0
+    else:
+        month_row = int(((target_date.day - days_on_first_row) + 6) / 7)
+    first_column, last_column = days_offsets[target_date.weekday()]
+    start_row = 5 + 2 + month_row * 10
+    return f'{first_column}{start_row}:{last_column}{start_row + 5}'
+
+
+def test_same_cells_as_the_grid():
+    for year in range(2020, 2031):
+        for month in range(1, 13):
+            layout = get_month_layout(year, month)
+            for day in range(1, monthrange(year, month)[1] + 1):
+                assert layout.get_body_range(day, 6) == grid_cell_range(datetime(year, month, day)), (year, month, day)
+
+
+@pytest.mark.parametrize('target_date, cell_range, offsets', [
+    # Starts on a Wednesday
+    (datetime(2024, 5, 1), 'N6:Q15', (1, 12)),
+    (datetime(2024, 5, 4), 'Z6:AC15', (1, 24)),
+    (datetime(2024, 5, 5), 'B16:E25', (11, 0)),
+    (datetime(2024, 5, 31), 'V46:Y55', (41, 20)),
+    # Starts on a Sunday
+    (datetime(2024, 9, 1), 'B6:E15', (1, 0)),
+    (datetime(2024, 9, 2), 'F6:I15', (1, 4)),
+    (datetime(2024, 9, 8), 'B16:E25', (11, 0)),
+    (datetime(2024, 9, 30), 'F46:I55', (41, 4)),
+    # Starts on a Saturday: six week rows
+    (datetime(2025, 3, 1), 'Z6:AC15', (1, 24)),
+    (datetime(2025, 3, 31), 'F56:I65', (51, 4)),
+    # February starting on a Sunday: four week rows
+    (datetime(2026, 2, 28), 'Z36:AC45', (31, 24)),
+])
+def test_known_cells(target_date, cell_range, offsets):
+    layout = get_layout(target_date)
+    assert layout.get_cell_range(target_date.day) == cell_range
+    assert layout.get_offsets(target_date.day) == offsets
+    assert layout.get_coordinates(target_date.day) == f'{target_date.strftime("%B %Y")}!{cell_range}'
+    assert location_to_offsets(layout.get_coordinates(target_date.day)) == offsets
+
+
+def test_weeks():
+    assert get_month_layout(2024, 9).weeks[0] == [1, 2, 3, 4, 5, 6, 7]
+    assert get_month_layout(2024, 5).weeks[0] == [1, 2, 3, 4]
+    assert len(get_month_layout(2025, 3).weeks) == 6
+    assert len(get_month_layout(2026, 2).weeks) == 4
+
+
+@pytest.mark.parametrize('target_date, coordinates', [
+    (datetime(2024, 5, 7), (11, 8)),
+    (datetime(2024, 9, 2), (1, 4)),
+    (datetime(2024, 9, 8), (11, 0)),
+    (datetime(2025, 3, 31), (51, 4)),
+])
+def test_test_calendar_coordinates(target_date, coordinates):
+    # ErsatsGCal used to count Monday based weeks: in a month starting on a Sunday, 2-7 were put a row too low
+    pytest.importorskip('spreadsheet_info')
+    from ersats_google_calendar_mgr import ErsatsGCal
+    with contextlib.redirect_stdout(io.StringIO()):
+        gcal = ErsatsGCal('TEST')
+    assert gcal.get_day_coordinates(target_date) == coordinates
@@ -0,0 +1,55 @@
+import datetime
+from notification_snapshot import NotificationSnapshots, diff_snapshots, take_snapshot
+
+"""
+Comparing a squad's upcoming shifts with its last email (notification_snapshot.py).
+"""
+
+MAY_7 = datetime.datetime(2024, 5, 7)
+MAY_8 = datetime.datetime(2024, 5, 8)
+MAY_9 = datetime.datetime(2024, 5, 9)
+
+
+def test_first_email_adds_everything():
+    current = take_snapshot([[MAY_7, '0600 - 1800', 1, [35]]], [[MAY_7, '0600 - 1800', 35]])
+    diff = diff_snapshots(None, current, MAY_7)
+    assert diff.added_shifts == [['2024-05-07', '0600 - 1800', 1, [35]]]
+    assert diff.added_tangos == [['2024-05-07', '0600 - 1800']]
+    assert diff.removed_shifts == [] and diff.removed_tangos == []
+
+
+def test_same_shifts_no_changes():
+    shifts = [[MAY_8, '1800 - 0600', 2, [43, 34]], [MAY_7, '0600 - 1800', 1, [35]]]
+    previous = take_snapshot(shifts, [])
+    # In another order
+    assert diff_snapshots(previous, take_snapshot(list(reversed(shifts)), []), MAY_7).is_empty()
+
+
+def test_passed_days_are_not_removals():
+    previous = take_snapshot([[MAY_7, '0600 - 1800', 1, [35]], [MAY_8, '0600 - 1800', 1, [35]]], [])
+    current = take_snapshot([[MAY_8, '0600 - 1800', 1, [35]], [MAY_9, '0600 - 1800', 1, [35]]], [])
+    diff = diff_snapshots(previous, current, MAY_8)
+    # The day that came into the window is new, the 7th has passed
+    assert diff.added_shifts == [['2024-05-09', '0600 - 1800', 1, [35]]]
+    assert diff.removed_shifts == []
+
+
+def test_changed_shift_and_removed_tango():
+    previous = take_snapshot([[MAY_7, '0600 - 1800', 1, [35]]], [[MAY_7, '0600 - 1800', 35]])
+    current = take_snapshot([[MAY_7, '0600 - 1800', 2, [35]]], [])
+    diff = diff_snapshots(previous, current, MAY_7)
+    assert diff.added_shifts == [['2024-05-07', '0600 - 1800', 2, [35]]]
+    assert diff.removed_shifts == [['2024-05-07', '0600 - 1800', 1, [35]]]
+    assert diff.removed_tangos == [['2024-05-07', '0600 - 1800']]
+    assert diff.lines() == ['New shift: Tuesday May 07, 2024 0600 - 1800 (2 trucks)',
+                            'Removed shift: Tuesday May 07, 2024 0600 - 1800 (1 truck)',
+                            'Removed tango: Tuesday May 07, 2024 0600 - 1800']
+
+
+def test_snapshots_saved(tmp_path):
+    snapshots = NotificationSnapshots(f'{tmp_path}/snapshots.json')
+    snapshot = take_snapshot([[MAY_7, '0600 - 1800', 1, [35]]], [])
+    snapshots.set(35, snapshot)
+    snapshots.save()
+    assert NotificationSnapshots(f'{tmp_path}/snapshots.json').get(35) == snapshot
+    assert NotificationSnapshots(f'{tmp_path}/snapshots.json').get(42) is None
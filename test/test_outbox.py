@@ -0,0 +1,157 @@
+import contextlib
+import io
+import time
+from email_manager import OutgoingEmail, SendResult
+from outbox import FAILED, PENDING, SENT, Outbox, OutboxWorker
+
+"""
+The outbox of crew_notifier (outbox.py), with a notifier standing in for the SMTP server.
+"""
+
+
+class FakeNotifier:
+
+    def __init__(self, failures=0):
+        self.failures = failures    # Sends that fail before they start to work
+        self.sent = []
+
+    def send_emails(self, emails):
+        results = []
+        for email in emails:
+            if self.failures > 0:
+                self.failures -= 1
+                results.append(SendResult(email.to_email, sent=False, error='421 Service not available'))
+            else:
+                self.sent.append(email)
+                results.append(SendResult(email.to_email, sent=True))
+        return results
+
+
+def crew_email(squad, body=None):
+    return OutgoingEmail('Shifts', 'text', body or f'<p>Squad {squad}</p>', f'squad{squad}@localhost')
+
+
+def drain(worker):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return worker.drain()
+
+
+def make_due(outbox):
+    with outbox.connection:
+        outbox.connection.execute('UPDATE outbox SET next_attempt = 0')
+
+
+def test_queued_once_a_day(tmp_path):
+    outbox = Outbox(str(tmp_path))
+    assert outbox.enqueue(crew_email(35))
+    assert not outbox.enqueue(crew_email(35))
+    assert outbox.enqueue(crew_email(42))
+    assert outbox.count(PENDING) == 2
+
+
+def test_priority_order(tmp_path):
+    outbox = Outbox(str(tmp_path))
+    outbox.enqueue(crew_email(99), priority=1)
+    outbox.enqueue(crew_email(35))
+    assert [email.to_email for _email_id, email in outbox.claim_due()] == ['squad35@localhost', 'squad99@localhost']
+
+
+def test_retry_then_sent(tmp_path):
+    outbox = Outbox(str(tmp_path))
+    notifier = FakeNotifier(failures=1)
+    worker = OutboxWorker(outbox, notifier)
+    outbox.enqueue(crew_email(35))
+
+    drain(worker)
+    # Waiting for the retry delay
+    assert notifier.sent == []
+    assert outbox.count(PENDING) == 1
+    assert outbox.next_due() > time.time()
+    assert outbox.get_entries(PENDING)[0][4:] == (1, '421 Service not available')
+
+    make_due(outbox)
+    drain(worker)
+    assert [email.to_email for email in notifier.sent] == ['squad35@localhost']
+    assert outbox.count(SENT) == 1 and outbox.count(PENDING) == 0
+
+
+def test_retry_delay_doubles(tmp_path):
+    outbox = Outbox(str(tmp_path))
+    outbox.enqueue(crew_email(35))
+    email_id = outbox.claim_due()[0][0]
+    start = time.time()
+    assert outbox.mark_failed(email_id, 'error', max_attempts=5, retry_delay=100)
+    assert 100 <= outbox.next_due() - start < 110
+    assert outbox.mark_failed(email_id, 'error', max_attempts=5, retry_delay=100)
+    assert 200 <= outbox.next_due() - start < 210
+
+
+def test_give_up(tmp_path):
+    outbox = Outbox(str(tmp_path))
+    notifier = FakeNotifier(failures=100)
+    worker = OutboxWorker(outbox, notifier)
+    outbox.enqueue(crew_email(35))
+    email_id = outbox.claim_due()[0][0]
+    for _attempt in range(4):
+        assert outbox.mark_failed(email_id, 'error', max_attempts=5)
+    assert not outbox.mark_failed(email_id, 'error', max_attempts=5)
+    assert outbox.count(FAILED) == 1
+
+    # Not tried again
+    make_due(outbox)
+    drain(worker)
+    assert notifier.failures == 100
+
+
+def test_sending_when_stopped_is_sent_again(tmp_path):
+    outbox = Outbox(str(tmp_path))
+    outbox.enqueue(crew_email(35))
+    outbox.claim_due()
+    outbox.close()
+
+    # The run stopped while sending it
+    outbox = Outbox(str(tmp_path))
+    notifier = FakeNotifier()
+    drain(OutboxWorker(outbox, notifier))
+    assert [email.to_email for email in notifier.sent] == ['squad35@localhost']
+
+
+def test_worker_thread(tmp_path):
+    outbox = Outbox(str(tmp_path))
+    notifier = FakeNotifier()
+    worker = OutboxWorker(outbox, notifier, poll_interval=0.1)
+    with contextlib.redirect_stdout(io.StringIO()):
+        worker.start()
+        outbox.enqueue(crew_email(35))
+        worker.notify()
+        assert worker.wait_until_empty(5)
+        worker.stop()
+    assert len(notifier.sent) == 1
+
+
+def test_on_sent_after_delivery(tmp_path):
+    outbox = Outbox(str(tmp_path))
+    notifier = FakeNotifier(failures=1)
+    delivered = []
+    worker = OutboxWorker(outbox, notifier, on_sent=lambda squad, snapshot: delivered.append((squad, snapshot)))
+    outbox.enqueue(crew_email(35), squad=35, snapshot={'shifts': [['2024-05-07', '0600 - 1800', 1, 35]], 'tangos': []})
+    outbox.enqueue(crew_email(99), priority=1)
+
+    drain(worker)
+    assert delivered == []
+
+    make_due(outbox)
+    drain(worker)
+    assert delivered == [(35, {'shifts': [['2024-05-07', '0600 - 1800', 1, 35]], 'tangos': []})]
+
+
+def test_given_up_email_queued_again(tmp_path):
+    outbox = Outbox(str(tmp_path))
+    outbox.enqueue(crew_email(35))
+    email_id = outbox.claim_due()[0][0]
+    assert not outbox.mark_failed(email_id, 'error', max_attempts=1)
+
+    assert outbox.enqueue(crew_email(35))
+    assert outbox.count(FAILED) == 0
+    assert outbox.get_entries(PENDING)[0][4:] == (0, None)
+    assert not outbox.enqueue(crew_email(35))
@@ -0,0 +1,63 @@
+from datetime import datetime
+import os
+import sqlite3
+from send_log import SendLog
+
+"""
+The log of the emails sent (send_log.py).
+"""
+
+MAY_7 = datetime(2024, 5, 7)
+MAY_8 = datetime(2024, 5, 8)
+
+
+def test_sent_once_a_day(tmp_path):
+    send_log = SendLog(str(tmp_path))
+    send_log.log_sent(MAY_7, 'abc', 'squad35@localhost', '', '')
+    send_log.log_sent(MAY_7, 'abc', 'squad35@localhost', '', '')
+    assert send_log.has_sent(MAY_7, 'abc')
+    assert not send_log.has_sent(MAY_8, 'abc')
+    assert not send_log.has_sent(MAY_7, 'def')
+    assert send_log.get_day(MAY_7) == [['abc', 'squad35@localhost', '', '']]
+
+
+def test_get_day_leaves_out_subject(tmp_path):
+    send_log = SendLog(str(tmp_path))
+    send_log.log_sent(MAY_7, 'abc', 'squad35@localhost', '', '', 'Shifts')
+    send_log.log_sent(MAY_7, 'def', 'digest@localhost', '', '', 'Digest')
+    send_log.log_sent(MAY_7, 'ghi', 'squad42@localhost', '', '')
+    assert [row[0] for row in send_log.get_day(MAY_7)] == ['abc', 'def', 'ghi']
+    assert [row[0] for row in send_log.get_day(MAY_7, exclude_subject='Digest')] == ['abc', 'ghi']
+
+
+def test_compact(tmp_path):
+    send_log = SendLog(str(tmp_path))
+    send_log.log_sent(datetime(2024, 1, 1), 'old', 'squad35@localhost', '', '')
+    send_log.log_sent(MAY_7, 'new', 'squad35@localhost', '', '')
+    assert send_log.compact(None, today=MAY_8) == 0
+    assert send_log.compact(30, today=MAY_8) == 1
+    assert not send_log.has_sent(datetime(2024, 1, 1), 'old')
+    assert send_log.has_sent(MAY_7, 'new')
+
+
+def test_import_legacy_logs(tmp_path):
+    os.makedirs(f'{tmp_path}/20240507')
+    with open(f'{tmp_path}/20240507/email_log.csv', 'w') as writer:
+        writer.write('abc |squad35@localhost|cc@localhost|\n\ndef|squad42@localhost\n')
+    send_log = SendLog(str(tmp_path))
+    assert send_log.get_day(MAY_7) == [['abc', 'squad35@localhost', 'cc@localhost', ''], ['def', 'squad42@localhost', '', '']]
+    assert not os.path.exists(f'{tmp_path}/20240507')
+
+
+def test_log_without_subject_column(tmp_path):
+    # A log created before the subject was kept
+    connection = sqlite3.connect(f'{tmp_path}/send_log.sqlite')
+    connection.execute('''CREATE TABLE sent_email (send_date TEXT NOT NULL, checksum TEXT NOT NULL, to_email TEXT,
+                                                   cc_email TEXT, bcc_email TEXT, UNIQUE (send_date, checksum))''')
+    connection.execute("INSERT INTO sent_email VALUES ('20240507', 'abc', 'squad35@localhost', '', '')")
+    connection.commit()
+    connection.close()
+
+    send_log = SendLog(str(tmp_path))
+    send_log.log_sent(MAY_7, 'def', 'digest@localhost', '', '', 'Digest')
+    assert [row[0] for row in send_log.get_day(MAY_7, exclude_subject='Digest')] == ['abc']
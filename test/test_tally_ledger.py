@@ -0,0 +1,146 @@
+import contextlib
+import datetime
+import io
+from ast import literal_eval
+import pytest
+from models import ModifyShiftRequest, squads
+from tally_ledger import TallyLedger
+
+"""
+The tally ledger (tally_ledger.py) against a full tally of the month.
+
+The manager tests run against the local fake of the Sheets API (fake_sheets_server.py).  They need spreadsheet_info
+(not in the repo) and the Google client libraries, and are skipped without them.
+"""
+
+MAY_2024 = datetime.datetime(2024, 5, 1)
+TERRITORY_MAP_FILE = 'test/test_cases/config_data/territory_map.json'
+MONTH_FILE = 'test/test_cases/expected_results/May_2024.txt'
+
+
+def test_apply_day_adds_the_difference(tmp_path):
+    ledger = TallyLedger(f'{tmp_path}/ledger.json')
+    ledger.reset_month('May 2024', {34: 100, 35: 50}, {34: 12})
+    ledger.apply_day('May 2024', ({34: 12}, {34: 12}), ({34: 6, 43: 12}, {43: 12}))
+    assert ledger.get_rows('May 2024') == ([94, 50, 0, 12, 0], [0, 0, 0, 12, 0])
+
+
+def test_load_drops_what_was_not_saved(tmp_path):
+    ledger = TallyLedger(f'{tmp_path}/ledger.json')
+    ledger.reset_month('May 2024', {34: 100}, {})
+    ledger.save()
+    ledger.apply_day('May 2024', ({}, {}), ({34: 12}, {}))
+    ledger.load()
+    assert ledger.get_rows('May 2024')[0][0] == 100
+
+
+def start_manager(config_dir):
+    from collab_cal_mgr import CollabCalendarManager
+    with contextlib.redirect_stdout(io.StringIO()):
+        collab_cal_manager = CollabCalendarManager('devo', config_dir, interactive_mode=False)
+        collab_cal_manager.set_calendar_tab('May 2024')
+    return collab_cal_manager
+
+
+@pytest.fixture
+def manager(tmp_path):
+    spreadsheet_info = pytest.importorskip('spreadsheet_info')
+    pytest.importorskip('googleapiclient')
+    from google.auth.credentials import AnonymousCredentials
+    from fake_sheets_server import start_fake_sheets_server
+    from google_calendar_mgr import set_sheets_endpoint
+
+    server = start_fake_sheets_server()
+    with open(MONTH_FILE, 'r') as reader:
+        server.write_range('May 2024!B6:AC65', literal_eval(reader.read()))
+    set_sheets_endpoint(spreadsheet_info.BETA_COLLAB_CALENDAR_SPREADSHEET_ID, f'http://127.0.0.1:{server.server_port}',
+                        AnonymousCredentials())
+    collab_cal_manager = start_manager(f'{tmp_path}/first')
+    collab_cal_manager.server = server
+    yield collab_cal_manager
+    server.shutdown()
+
+
+def full_tally(collab_cal_manager):
+    """
+    Tally the month as it is in the sheet (read again), in ledger rows
+    """
+    collab_cal_manager.gcal.invalidate()
+    with contextlib.redirect_stdout(io.StringIO()):
+        hours_by_squad, tango_hours, _warnings = collab_cal_manager.tally_shifts(MAY_2024, 32)
+    return [hours_by_squad.get(squad, 0) for squad in squads], [tango_hours.get(squad, 0) for squad in squads]
+
+
+def add_shift(collab_cal_manager, day, start, end, squad):
+    with open(TERRITORY_MAP_FILE, 'r') as reader:
+        territory_map = literal_eval(reader.read())
+    with contextlib.redirect_stdout(io.StringIO()):
+        collab_cal_manager.add_remove_shifts(datetime.datetime(2024, 5, day), [ModifyShiftRequest(start, end, squad, None)],
+                                             territory_map)
+
+
+def test_edit_keeps_ledger_with_sheet(manager):
+    add_shift(manager, 7, 600, 1200, 54)
+    assert manager.tally_ledger.get_rows('May 2024') == full_tally(manager)
+
+
+def test_failed_edit_is_not_kept(manager):
+    add_shift(manager, 7, 600, 1200, 54)
+    # The batchUpdate of the next edit comes back with an error (400s are not retried)
+    manager.server.fail_next(1, 400)
+    add_shift(manager, 8, 1800, 2100, 43)
+    assert not manager.tally_ledger.has_month('May 2024')
+
+    # Seeded again from the sheet by the next edit
+    add_shift(manager, 9, 1800, 2100, 43)
+    assert manager.tally_ledger.get_rows('May 2024') == full_tally(manager)
+    saved = TallyLedger(manager.tally_ledger.ledger_file)
+    assert saved.get_rows('May 2024') == full_tally(manager)
+
+
+def test_edit_made_by_someone_else_is_picked_up(manager, tmp_path):
+    add_shift(manager, 7, 600, 1200, 54)
+    # Another run (own cache and ledger) edits the sheet, then this run reads the month again (eg: its TTL expired)
+    add_shift(start_manager(f'{tmp_path}/second'), 10, 600, 1800, 35)
+    manager.gcal.invalidate()
+
+    add_shift(manager, 11, 1800, 2100, 43)
+    assert manager.tally_ledger.get_rows('May 2024') == full_tally(manager)
+
+
+def start_new_run(config_dir, monkeypatch):
+    """
+    A manager with nothing in memory (as in a new process): it only has what the earlier run saved under config_dir
+    """
+    import tally_ledger
+    import warm_cache
+    monkeypatch.setattr(tally_ledger, 'tally_ledgers', {})
+    monkeypatch.setattr(warm_cache, 'warm_caches', {})
+    collab_cal_manager = start_manager(config_dir)
+    reset_month = collab_cal_manager.tally_ledger.reset_month
+    collab_cal_manager.seeded = []
+    def count_seeds(tab, *args):
+        collab_cal_manager.seeded.append(tab)
+        reset_month(tab, *args)
+    monkeypatch.setattr(collab_cal_manager.tally_ledger, 'reset_month', count_seeds)
+    return collab_cal_manager
+
+
+def test_next_run_keeps_saved_ledger(manager, tmp_path, monkeypatch):
+    add_shift(manager, 12, 0, 600, 34)
+
+    next_run = start_new_run(f'{tmp_path}/first', monkeypatch)
+    add_shift(next_run, 8, 1800, 2100, 43)
+    assert next_run.seeded == []
+    assert next_run.tally_ledger.get_rows('May 2024') == full_tally(manager)
+
+
+def test_next_run_seeds_month_changed_since(manager, tmp_path, monkeypatch):
+    add_shift(manager, 12, 0, 600, 34)
+    # Another run (own cache and ledger) edits the sheet
+    add_shift(start_manager(f'{tmp_path}/second'), 8, 1800, 2100, 43)
+
+    next_run = start_new_run(f'{tmp_path}/first', monkeypatch)
+    add_shift(next_run, 11, 1800, 2100, 43)
+    assert next_run.seeded == ['May 2024']
+    assert next_run.tally_ledger.get_rows('May 2024') == full_tally(manager)
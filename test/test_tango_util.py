@@ -0,0 +1,77 @@
+from datetime import datetime
+from models import CalendarDay, SchedDate, SquadShift
+from utils.tango_util import TangoAllocator, calculate_slot_hours, commitment_weights
+
+"""
+Tango assignment (utils/tango_util.py).
+"""
+
+MAY_7 = datetime(2024, 5, 7)
+
+
+def slot(on_duty, slot_time='0600 - 1800', tango=None):
+    return SchedDate(MAY_7, slot_time, tango, [SquadShift(squad, 1, []) for squad in on_duty])
+
+
+def test_slot_hours():
+    assert calculate_slot_hours('0600 - 1800') == 12
+    assert calculate_slot_hours('1800 - 0600') == 12
+    assert calculate_slot_hours('0630 - 1800') == 11.5
+    assert calculate_slot_hours('0600 - 0600') == 24
+
+
+def test_least_tango_hours():
+    allocator = TangoAllocator(tango_hours={35: 24, 42: 12})
+    assert allocator.assign(slot([35, 42])) == 42
+    # 42 now has 24 as well: tie
+    assert allocator.assign(slot([35, 42])) == 35
+
+
+def test_tie_fewer_slots_then_lowest_squad():
+    # Same hours, 43 with one (24 hour) slot and 42 with two
+    allocator = TangoAllocator(slot_hours=lambda slot_time: 24 if slot_time == '0600 - 0600' else 12)
+    allocator.assign(slot([42]))
+    allocator.assign(slot([42]))
+    allocator.assign(slot([43], '0600 - 0600'))
+    assert allocator.tango_hours[42] == allocator.tango_hours[43] == 24
+    assert allocator.assign(slot([42, 43])) == 43
+    # Nobody has a tango yet: lowest squad number
+    assert TangoAllocator().assign(slot([54, 35, 43])) == 35
+
+
+def test_only_squads_on_duty():
+    allocator = TangoAllocator(tango_hours={35: 100})
+    assert allocator.assign(slot([35])) == 35
+    # The squads passed over are still picked later
+    assert allocator.assign(slot([34, 35])) == 34
+    assert allocator.assign(slot([35, 42])) == 42
+
+
+def test_weights():
+    # 35 committed twice the hours of 42: it takes two tangos for each one of 42's
+    allocator = TangoAllocator(weights=commitment_weights({35: 200, 42: 100}))
+    picked = [allocator.assign(slot([35, 42])) for _slot in range(6)]
+    assert picked.count(35) == 4 and picked.count(42) == 2
+    # No weight: only when nobody else is on duty
+    assert allocator.assign(slot([34, 35])) == 35
+    assert allocator.assign(slot([34])) == 34
+
+
+def test_empty_slots():
+    empty = slot([])
+    allocator = TangoAllocator(tango_hours={35: 12})
+    assert allocator.assign(empty) is None
+    assert empty.tango is None
+    assert allocator.fairness_report().empty_slots == [empty]
+
+    allocator = TangoAllocator(tango_hours={35: 12}, fill_empty=True)
+    assert allocator.assign(slot([])) == 34
+
+
+def test_allocate_keeps_tangos():
+    days = [CalendarDay(MAY_7, [slot([35, 42], tango=42), slot([35, 42], '1800 - 0600')])]
+    allocator = TangoAllocator()
+    assigned = allocator.allocate(days)
+    assert [sched.slot for sched in assigned] == ['1800 - 0600']
+    assert days[0].slots[0].tango == 42 and days[0].slots[1].tango == 35
+    assert len(allocator.allocate(days, re_tango=True)) == 2
@@ -0,0 +1,36 @@
+import copy
+from ast import literal_eval
+from utils.territory_utils import get_territory_manager
+
+"""
+The compiled territory map (utils/territory_utils.py).
+"""
+
+TERRITORY_MAP_FILE = 'test/test_cases/config_data/territory_map.json'
+
+
+def read_territory_map():
+    with open(TERRITORY_MAP_FILE, 'r') as reader:
+        return literal_eval(reader.read())
+
+
+def test_coverage():
+    territory_manager = get_territory_manager(read_territory_map())
+    assert territory_manager.get_coverage([42, 34]) == {34: [34, 43], 42: [35, 42, 54]}
+    assert territory_manager.get_coverage([42, 34, 42]) == {34: [34, 43], 42: [35, 42, 54]}
+
+
+def test_compiled_once_per_contents():
+    territory_map = read_territory_map()
+    territory_manager = get_territory_manager(territory_map)
+    assert get_territory_manager(territory_map) is territory_manager
+    # Read again: same contents
+    assert get_territory_manager(copy.deepcopy(territory_map)) is territory_manager
+
+
+def test_edited_map_compiled_again():
+    territory_map = read_territory_map()
+    territory_manager = get_territory_manager(territory_map)
+    territory_map['34,42'] = {34: [34, 43, 54], 42: [35, 42]}
+    assert get_territory_manager(territory_map) is not territory_manager
+    assert get_territory_manager(territory_map).get_coverage([34, 42]) == {34: [34, 43, 54], 42: [35, 42]}
@@ -1,20 +1,23 @@
 
 from calendar import monthrange
-from datetime import date, timedelta
+from datetime import date
 from calendar_cache import CalendarCache
-from calendar_utils import get_calendar_coordinates, pad_month
+from calendar_utils import pad_month
 import config
 from models import CalendarTab
+from write_behind_buffer import WriteBehindBuffer
 
 
 class CalendarDelegate(object):
 
-    def __init__(self, gcal, calendar_tab: CalendarTab):
+    def __init__(self, gcal, calendar_tab: CalendarTab, write_buffer: WriteBehindBuffer=None):
         self.in_transaction = False
         self.calendar_tab = calendar_tab
         self.gcal = gcal
         self.calendar_cache = None
         self.day_outstanding = None
+        # If a write buffer is given, writes made outside of a transaction are held until flush() is called
+        self.write_buffer = write_buffer
 
     def __enter__(self):
         self.begin_transaction()
@@ -34,37 +37,43 @@ class CalendarDelegate(object):
 
     def get_day_from_calendar(self, target_date):
         if self.in_transaction:
-            return self.calendar_cache.get_day(target_date)
+            return self.calendar_cache.get_date(target_date)
         else:
             self.day_outstanding = target_date
             return self.gcal.get_day_from_calendar(target_date)
 
     def get_days_from_calendar(self, from_date: date, to_date: date=None):
-        days = []
+        """
+        The rows of the days from from_date to to_date (both included, in the month of the transaction).
+        Without to_date: to the end of the month
+        """
         if not self.in_transaction:
             raise Exception('Transaction not started!')
         
         days_in_month = monthrange(from_date.year, from_date.month)[1]
-        num_days = (to_date - from_date).days if to_date else days_in_month
-
-        # Start from the first day
-        current_day = from_date
+        # The transaction holds one month: a to_date in a later month stops at the end of this one
+        in_month = to_date is not None and (to_date.year, to_date.month) == (from_date.year, from_date.month)
+        last_day = to_date.day if in_month else days_in_month
 
-        # Loop over all days of the month
-        for _ in range(days_in_month - from_date.day + 1):
-            # print(f'----------------- Processing day: {current_day} Coordinates: {get_calendar_coordinates(current_day)}')
-            days.append(self.calendar_cache.get_day(get_calendar_coordinates(current_day)))
-            current_day += timedelta(days=1)
-
-        return days
+        return [self.calendar_cache.get_date(from_date.replace(day=day)) for day in range(from_date.day, last_day + 1)]
 
     def write_day_to_calendar(self, target_date, formatted_rows):       
         if self.in_transaction:
             self.calendar_cache.replace_day(target_date, formatted_rows)
+        elif self.write_buffer is not None:
+            self.write_buffer.write_day_to_calendar(target_date, formatted_rows)
+            self.day_outstanding = None
         else:
             self.gcal.write_day_to_calendar(target_date, formatted_rows)
             self.day_outstanding = None
 
+    def flush(self):
+        """
+        Send the writes held by the write buffer (if there is one)
+        """
+        if self.write_buffer is not None:
+            return self.write_buffer.flush()
+
     def populate_day_headers_from_tab(self, tab: CalendarTab):
         if not self.in_transaction:
             raise Exception('Transaction not started!')
@@ -107,17 +116,35 @@ class CalendarDelegate(object):
         self.calendar_cache = CalendarCache(self.calendar_tab, month_rows)
 
 
-    def end_transaction(self):
+    def end_transaction(self, diff_only=config.TRANSACTION_DIFF_ONLY, extra_ranges=None):
         """
         If this method is called, the transaction will be ended.
         All calls made to write_day_to_calendar will be written to the calendar
+
+        Only the days (and day headers) that were touched in the transaction are written, all in one batchUpdate.
+        With diff_only, cells whose value did not change are not written either, so edits made to the sheet by
+        someone else while the transaction was open are not clobbered.
+
+        extra_ranges (list of (location, rows), eg: the tally rows) are sent in the same batchUpdate
+
+        Returns the batchUpdate response (or the HttpError), None if there was nothing to write.  If the write failed,
+        the transaction stays open with its changes: call end_transaction again to retry, or rollback to give up
         """
 
         if not self.in_transaction:
             raise Exception('Transaction not started!')
         
-        self.gcal.update_values(self.location, "USER_ENTERED", self.calendar_cache.get_month())
+        result = None
+        dirty_ranges = self.calendar_cache.get_dirty_ranges(diff_only) + (extra_ranges or [])
+        if len(dirty_ranges) > 0:
+            result = self.gcal.batch_update_values(dirty_ranges, "USER_ENTERED")
+        else:
+            print('Nothing changed in the transaction.  Nothing to write')
+        if isinstance(result, Exception):
+            return result
+        self.calendar_cache.mark_clean()
         self.in_transaction = False
+        return result
 
     # ====================================================================================================
     # passthrough methods
@@ -132,6 +159,8 @@ class CalendarDelegate(object):
         return self.gcal.get_data_from_calendar(location)
     
     def update_values(self, location, value_input_option, values):
+        if self.write_buffer is not None:
+            return self.write_buffer.update_values(location, value_input_option, values)
         return self.gcal.update_values(location, value_input_option, values)
     
     def get_contacts(self):
@@ -46,7 +46,7 @@ Row 16 ['5', '', '', '', '6', '', '', '', '7', '', '', '', '8', '', '', '', '9',
     """
     col_start -= 1  # Adjust for the first column which is the day header
     # print(f'Getting matrix from calendar at row: {row_start}, col: {col_start}')
-    print_matrix(calendar_matrx)
+    # print_matrix(calendar_matrx)
 
     return_matrix = []
     for row in range(row_start, (row_start + CALENDAR_ROWS)-1):
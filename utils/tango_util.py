@@ -1,9 +1,21 @@
 
 
+from dataclasses import dataclass, field
 from datetime import datetime
+from functools import lru_cache
+import heapq
 from typing import List
 
-from models import SquadShift
+from models import SchedDate, SquadShift, squads as all_squads
+
+"""
+Tango assignment.
+
+TangoAllocator assigns the tangos of all the slots it is given (a month, or several months in a row) in one pass.  The
+squads are kept in a priority queue keyed on their (weighted) tango hours, so each slot takes the squad on duty that has
+done the least so far without comparing every squad on duty by hand.  An allocator that is used month after month (or
+given the days of several months) keeps balancing across them.
+"""
 
 
 class TangoUtil:
@@ -67,15 +79,13 @@ class TangoUtil:
         """
         Assign tango numbers to the slots in calendar_days.  if re_tango, then disregard the previous.
         """
-        shift_tally, tango_tally = self.tally_shifts(calendar_days)
-        for day in calendar_days:
-            for sched in day.slots:
-                slot_hours: int = self.calculate_hours(sched.slot)
-                if sched.tango is None or re_tango:
-                    squads_on_duty = self.get_squads_on_duty(sched.squads)
-                    if squads_on_duty:
-                        sched.tango = self.pick_tango(squads_on_duty, tango_tally)
-                        tango_tally[sched.tango] = tango_tally.get(sched.tango, 0) + slot_hours
+        tango_tally = {}
+        if not re_tango:
+            # The tangos that are kept count towards the balance
+            tango_tally = {squad: hours for squad, hours in self.tally_shifts(calendar_days)[1].items() if squad is not None}
+        allocator = TangoAllocator(tango_tally, slot_hours=self.calculate_hours)
+        allocator.allocate(calendar_days, re_tango=re_tango)
+        return allocator.fairness_report()
 
     def tally_shifts(self, calendar_days):
         shift_tally = {}
@@ -91,3 +101,199 @@ class TangoUtil:
                     shift_tally[squad] = shift_tally.get(squad, 0) + slot_hours
                 tango_tally[sched.tango] = tango_tally.get(sched.tango, 0) + slot_hours
         return shift_tally, tango_tally
+
+
+@lru_cache(maxsize=256)
+def calculate_slot_hours(slot):
+    """
+    '1800 - 0600' -> 12.0, '0630 - 1800' -> 11.5.  A slot that ends when it starts ('0600 - 0600') is 24 hours
+    """
+    start, end = [int(time.strip()) for time in slot.split('-')]
+    minutes = (end // 100 * 60 + end % 100) - (start // 100 * 60 + start % 100)
+    if minutes <= 0:
+        minutes += 24 * 60
+    return minutes / 60
+
+
+@dataclass
+class FairnessReport:
+    tango_hours: dict           # key = squad, value = tango hours
+    loads: dict                 # key = squad, value = tango hours / weight (= tango_hours without weights)
+    spread: float               # max - min of tango_hours
+    load_spread: float          # max - min of loads
+    slots_assigned: int
+    empty_slots: list = field(default_factory=list)    # SchedDate with no squad on duty (see fill_empty)
+
+    def __str__(self):
+        hours = ', '.join(f'{squad}: {hours:g}' for squad, hours in sorted(self.tango_hours.items()))
+        return f'Tango hours: {hours}  spread: {self.spread:g}  load spread: {self.load_spread:g}  ' \
+               f'assigned: {self.slots_assigned}  empty: {len(self.empty_slots)}'
+
+
+class TangoAllocator:
+    """
+    Assigns the tango of each slot to the squad on duty with the least (weighted) tango hours.
+    Ties go to the squad with fewer tango slots, then to the lowest squad number.
+    """
+
+    def __init__(self, tango_hours=None, weights=None, slot_hours=calculate_slot_hours, fill_empty=False):
+        """
+        ## Parameters
+        * tango_hours (dict): tango hours the squads start with (eg: the months before, or the tangos that are kept)
+        * weights (dict): key = squad, value = share of the tangos the squad should take (eg: the hours it committed,
+          see commitment_weights).  A squad's load is tango hours / weight.  None = every squad counts the same
+        * slot_hours: method returning the hours of a slot
+        * fill_empty: give slots with no squad on duty to the squad with the lowest load (otherwise they are left alone)
+        """
+        self.weights = weights or {}
+        self.slot_hours = slot_hours
+        self.fill_empty = fill_empty
+        self.tango_hours = {}
+        self.tango_slots = {}
+        self.heap = []      # (load, tango slots, squad).  Entries that no longer match the squad are skipped
+        self.slots_assigned = 0
+        self.empty_slots = []
+        for squad in all_squads:
+            self.add_squad(squad)
+        for squad, hours in (tango_hours or {}).items():
+            self.add_squad(squad, hours)
+
+
+    def add_squad(self, squad, hours=0):
+        self.tango_hours[squad] = hours
+        self.tango_slots.setdefault(squad, 0)
+        heapq.heappush(self.heap, self.heap_entry(squad))
+
+
+    def weight(self, squad):
+        if len(self.weights) == 0:
+            return 1
+        return self.weights.get(squad, 0)
+
+
+    def load(self, squad):
+        # A squad with no weight (eg: it committed no hours) only gets a tango when nobody else is on duty
+        weight = self.weight(squad)
+        return self.tango_hours[squad] / weight if weight > 0 else float('inf')
+
+
+    def heap_entry(self, squad):
+        return (self.load(squad), self.tango_slots[squad], squad)
+
+
+    def pick(self, on_duty):
+        """
+        The squad of on_duty (set of squads, empty = any squad) with the lowest load
+        """
+        for squad in on_duty:
+            if squad not in self.tango_hours:
+                self.add_squad(squad)
+
+        passed_over = []
+        picked = None
+        while len(self.heap) > 0:
+            entry = heapq.heappop(self.heap)
+            if entry != self.heap_entry(entry[2]):
+                continue    # Stale: the squad was picked since
+            if len(on_duty) == 0 or entry[2] in on_duty:
+                picked = entry[2]
+                break
+            passed_over.append(entry)
+
+        for entry in passed_over:
+            heapq.heappush(self.heap, entry)
+        return picked
+
+
+    def assign(self, sched: SchedDate):
+        """
+        Give the tango of the slot to the squad on duty with the lowest load
+        ## Returns
+        The squad, or None if nobody is on duty (and fill_empty is not set)
+        """
+        on_duty = {squad.squad for squad in sched.squads or []}
+        if len(on_duty) == 0:
+            self.empty_slots.append(sched)
+            if not self.fill_empty:
+                return None
+
+        squad = self.pick(on_duty)
+        sched.tango = squad
+        self.tango_hours[squad] += self.slot_hours(sched.slot)
+        self.tango_slots[squad] += 1
+        self.slots_assigned += 1
+        heapq.heappush(self.heap, self.heap_entry(squad))
+        return squad
+
+
+    def allocate(self, calendar_days, re_tango=False):
+        """Assign the tangos of the slots of calendar_days (in order)
+
+        ## Parameters
+        * calendar_days: list of CalendarDay (one month, or several in a row)
+        * re_tango: assign every slot again.  Otherwise only slots without a tango are assigned
+
+        ## Returns
+        list of the SchedDate that were assigned
+        """
+        assigned = []
+        for day in calendar_days:
+            for sched in day.slots:
+                if (sched.tango is None or re_tango) and self.assign(sched) is not None:
+                    assigned.append(sched)
+        return assigned
+
+
+    def fairness_report(self) -> FairnessReport:
+        squads = [squad for squad in self.tango_hours if self.weight(squad) > 0]
+        loads = {squad: self.load(squad) for squad in squads}
+        hours = [self.tango_hours[squad] for squad in squads]
+        return FairnessReport(tango_hours=dict(self.tango_hours), loads=loads,
+                              spread=max(hours) - min(hours) if hours else 0,
+                              load_spread=max(loads.values()) - min(loads.values()) if loads else 0,
+                              slots_assigned=self.slots_assigned, empty_slots=list(self.empty_slots))
+
+
+def commitment_weights(hours_by_squad):
+    """
+    Weights for TangoAllocator from the hours each squad committed: a squad that does twice the hours takes twice the
+    tango hours
+    """
+    total = sum(hours_by_squad.values())
+    if total == 0:
+        return {}
+    return {squad: hours / total for squad, hours in hours_by_squad.items()}
+
+
+if __name__ == '__main__':
+    # Benchmark: a year of slots
+    import random
+    import time
+    from models import CalendarDay
+
+    random.seed(1)
+    year_days = []
+    for day_num in range(365):
+        target_date = datetime.fromordinal(datetime(2024, 1, 1).toordinal() + day_num)
+        slots = []
+        for slot in ['0600 - 1800', '1800 - 0600']:
+            on_duty = random.sample(all_squads, random.randint(1, 3))
+            slots.append(SchedDate(target_date, slot, None, [SquadShift(squad, 1, []) for squad in on_duty]))
+        year_days.append(CalendarDay(target_date, slots))
+
+    start = time.perf_counter()
+    allocator = TangoAllocator()
+    allocator.allocate(year_days)
+    print(f'TangoAllocator: {allocator.slots_assigned} slots in {(time.perf_counter() - start) * 1000:.2f} ms')
+    print(allocator.fairness_report())
+
+    # Same year, the way the month loop used to do it (scan of the squads on duty)
+    tango_util = TangoUtil()
+    tango_tally = {}
+    start = time.perf_counter()
+    for day in year_days:
+        for sched in day.slots:
+            sched.tango = tango_util.pick_tango(tango_util.get_squads_on_duty(sched.squads), tango_tally)
+            tango_tally[sched.tango] = tango_tally.get(sched.tango, 0) + calculate_slot_hours(sched.slot)
+    hours = [tango_tally.get(squad, 0) for squad in all_squads]
+    print(f'Scan: {(time.perf_counter() - start) * 1000:.2f} ms  spread: {max(hours) - min(hours):g}')
@@ -1,6 +1,19 @@
+import copy
 import re
 from bcolors import bcolors
-from models import SchedDate, SquadShift
+from models import SchedDate, SquadShift, squads as all_squads
+
+"""
+Territory map, compiled to a bitmask index.
+
+Each squad gets a bit (34 = 1, 35 = 2, 42 = 4, 43 = 8, 54 = 16, then any other squad found in the map), so a set of
+squads on duty is a small int and its coverage is a plain list lookup: coverage[mask].  The map is validated once,
+when it is compiled, and the lookup never builds a key string.
+
+get_territory_manager(territory_map) gives the compiled map for a raw map (as returned by GCal.read_territory_map).  The
+last map compiled is kept (with a copy of its contents): it is compiled again only when the map's contents change, eg:
+the reference data was read again, or the map was edited in place.
+"""
 
 class TerritoryManager:
     """
@@ -16,38 +29,87 @@ class TerritoryManager:
     """
 
     def __init__(self, raw_territory_map: dict):
-        self.territory_map = self.validate_territory_map(raw_territory_map)
+        self.territory_map = raw_territory_map
+        self.warnings = []
+        self.squad_bits = {}
+        self.coverage = []  # index = squad mask, value = {squad: covering} (None if the map has no such key)
+        self.keys = []      # index = squad mask, value = territory key (eg: '34,43')
+        self.compile(raw_territory_map)
+
+
+    def compile(self, territory_map: dict):
+        """
+        Validate the map and build the bitmask index.  Raises ValueError if the map is not valid
+        """
+        self.validate_territory_map(territory_map)
+
+        for squad in all_squads:
+            self.squad_bits.setdefault(squad, 1 << len(self.squad_bits))
+        for key in territory_map.keys():
+            for squad in self.key_to_squads(key):
+                self.squad_bits.setdefault(squad, 1 << len(self.squad_bits))
+
+        self.coverage = [None] * (1 << len(self.squad_bits))
+        self.keys = [None] * (1 << len(self.squad_bits))
+        for key, value in territory_map.items():
+            mask = self.get_mask(self.key_to_squads(key))
+            self.coverage[mask] = value
+            self.keys[mask] = key
+
+
+    def key_to_squads(self, key: str) -> list:
+        return [int(squad) for squad in key.split(',')]
+
 
     def validate_territory_map(self, territory_map: dict):
         """
-        Performs validations, if all good, returns map
+        Performs validations, if all good, returns map.  Doubtful (but allowed) entries are kept in self.warnings
         """
         for key, value in territory_map.items():
             num_in_key = len(key.split(','))
             all_terr = []
             for terr in value.values():
                 all_terr.extend(terr)
-            if len(set(all_terr)) != 5:
-                bcolors.print_fail(f'Total territories do not sum to 5! {key}')
-                raise ValueError('read_territory_map: Total territories do not sum to 5')
-                sys.exit()
+            if len(set(all_terr)) != len(all_squads):
+                print(f'{bcolors.FAIL}Total territories do not sum to {len(all_squads)}! {key}{bcolors.ENDC}')
+                raise ValueError(f'read_territory_map: Total territories do not sum to {len(all_squads)}')
 
             for squad, covering in value.items():
                 # Squad should always cover themselves
                 if squad not in covering:
-                    bcolors.print_failprint(f'For key: {key}, squad: {squad} not covering themselves')
+                    print(f'{bcolors.FAIL}For key: {key}, squad: {squad} not covering themselves{bcolors.ENDC}')
                     raise ValueError('read_territory_map: Squad not covering themselves')
                 # If key is only 2 squads, the one with 2 cannot be 42 (unless they are 42)
                 if num_in_key == 2 and '42' not in key and len(covering) == 2 and 42 in covering:
+                    self.warnings.append(f'Squad {squad} only covering itself and 42 (key: {key})')
+
+        return territory_map
+
 
-                    bcolors.print_warning(f'Squad {squad} only covering itself and 42') 
-                    r = input('Do you want to fix this? [y/n] ')
-                    if r.lower() == 'y':
-                        raise ValueError('read_territory_map: Squad 42 covering itself and another squad')
+    def get_mask(self, squads) -> int:
+        """
+        ## Returns
+        The bitmask of the squads, or None if one of them is not in the map
+        """
+        mask = 0
+        for squad in squads:
+            bit = self.squad_bits.get(squad)
+            if bit is None:
+                return None
+            mask |= bit
+        return mask
 
-            return territory_map
 
-    def make_territory_key(self, squads: list) -> str:    
+    def get_coverage(self, squads):
+        """
+        ## Returns
+        {squad: covering} for the squads on duty (any order, repeats are fine), or None if the map has no entry
+        """
+        mask = self.get_mask(squads)
+        return None if mask is None else self.coverage[mask]
+
+
+    def make_territory_key(self, squads: list) -> str:
         squads = sorted(squads)
         return re.sub(r'\[|\]|\s', '', str(squads))
 
@@ -55,41 +117,38 @@ class TerritoryManager:
         """
         Assign territories to the squads in the days
         """
-        def squad_list_from_squads(squads):
-            """
-            Return a list of squads from the list of SquadShift objects
-            """
-            squad_list = set()
-            for squad in squads:
-                squad_list.add(squad.squad)
-            
-            # Take the set and return it as a list
-
-            return list(squad_list)
-        
         for day in days:
             for _slot in day.slots:
                 slot:SchedDate = _slot
-                if len(squad_list_from_squads(slot.squads)) == 0:
+                squad_list = {squad.squad for squad in slot.squads}
+                if len(squad_list) == 0:
                     continue
-                if len(squad_list_from_squads(slot.squads)) == 1:
+                if len(squad_list) == 1:
                     # Note: There might be one squad - but they might have multiple trucks!
                     for squad in slot.squads:
                         squad:SquadShift = squad
                         squad.squad_covering = ['All']
-                    # slot.squads[0].squad_covering = ['All']
                 else:
-                    key = self.make_territory_key(squad_list_from_squads(slot.squads))
-                    # print(f'key: {key} day: {day} from slot: {slot.slot} squads: {slot.squads}')
                     """
-                    if, for example, you the list of squads in this SchedDate is: 
+                    if, for example, you the list of squads in this SchedDate is:
                     [42,54]
                     then territories_by_squad will be: {42: [35, 42], 54: [34, 43, 54]}
                     """
-                    territories_by_squad = self.territory_map[key]
+                    territories_by_squad = self.get_coverage(squad_list)
+                    if territories_by_squad is None:
+                        raise KeyError(self.make_territory_key(list(squad_list)))
                     for _squad in slot.squads:
                         squad:SquadShift = _squad
-                        squad.squad_covering = territories_by_squad[squad.squad]          
+                        squad.squad_covering = territories_by_squad[squad.squad]
 
 
+last_compiled = None   # (copy of the raw map, TerritoryManager) of the last map compiled
 
+def get_territory_manager(territory_map: dict) -> TerritoryManager:
+    """
+    The compiled version of territory_map (compiled and validated again only if its contents changed)
+    """
+    global last_compiled
+    if last_compiled is None or last_compiled[0] != territory_map:
+        last_compiled = (copy.deepcopy(territory_map), TerritoryManager(territory_map))
+    return last_compiled[1]
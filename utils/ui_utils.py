@@ -1,5 +1,4 @@
 from datetime import datetime
-from simple_term_menu import TerminalMenu
 from bcolors import bcolors
 import calendar
 import re
@@ -53,6 +52,7 @@ class CP:
 
 class TerminalUI:
     def prompt_menu(self, title, options):
+        from simple_term_menu import TerminalMenu
         terminal_menu = TerminalMenu(title=title, menu_entries= options)
         menu_entry_index = terminal_menu.show()
         selection = options[menu_entry_index]
@@ -73,6 +73,7 @@ class TerminalUI:
         return selected_tabs
 
     def prompt_menu_multiselect(self, title, options, show_multi_select_hint=False, preselected_entries=[]):
+        from simple_term_menu import TerminalMenu
         terminal_menu = TerminalMenu(title=title, menu_entries= options, 
                                     multi_select=True,
                                     multi_select_empty_ok=True,
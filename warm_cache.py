@@ -0,0 +1,165 @@
+import json
+import os
+import threading
+import config
+
+"""
+Copy of what a run reads from the spreadsheet (month blocks and reference ranges), kept on disk between runs.
+
+The cache is stamped with the revision of the spreadsheet (Drive modifiedTime, see GCal.get_revision) it was read at.
+At the start of a run the revision is read once (one small metadata request): if the spreadsheet has not changed since,
+the months and reference ranges are served from disk; if it has (whoever changed it, including this program), the cache
+is emptied and filled again as things are read.  If the revision can't be read, the cache is not used (cold start).
+
+Files: {config_dir}/{config.WARM_CACHE_DIR}/{spreadsheet id}.json
+"""
+
+class WarmCache:
+
+    def __init__(self, cache_file):
+        self.cache_file = cache_file
+        self.lock = threading.RLock()
+        self.revision = None
+        self.months = {}        # key = tab name, value = month block rows as read from Google
+        self.reference = None   # See CachedGCal.get_reference_data
+        self.validated = False
+        self.enabled = False
+        self.hits = 0
+        self.misses = 0
+
+
+    def validate(self, get_revision):
+        """
+        Check the cache against the current revision of the spreadsheet (only the first call of the process does it)
+
+        ## Parameters
+        * get_revision: method returning the current revision (or None if it can't be read)
+
+        ## Returns
+        True if the cache can be used
+        """
+        with self.lock:
+            if self.validated:
+                return self.enabled
+
+            self.validated = True
+            revision = get_revision()
+            if revision is None:
+                return False
+
+            self.enabled = True
+            saved = self.load()
+            if saved is not None and saved.get('revision') == revision:
+                self.months = saved.get('months', {})
+                self.reference = saved.get('reference')
+            else:
+                self.months = {}
+                self.reference = None
+            self.revision = revision
+            return True
+
+
+    def revalidate(self, revision):
+        """
+        Check the cache again (for a long running process): if the spreadsheet changed since it was checked, empty it
+        ## Parameters
+        * revision: the current revision (None if it can't be read: the cache is not used)
+        """
+        with self.lock:
+            if not self.validated:
+                self.validate(lambda: revision)
+                return
+            if revision is None:
+                self.enabled = False
+                return
+            self.enabled = True
+            if revision != self.revision:
+                self.months = {}
+                self.reference = None
+                self.revision = revision
+                self.save()
+
+
+    def load(self):
+        if not os.path.exists(self.cache_file):
+            return None
+        try:
+            with open(self.cache_file, 'r') as reader:
+                return json.load(reader)
+        except (OSError, ValueError) as e:
+            print(f'Ignoring unreadable warm cache {self.cache_file}: {e}')
+            return None
+
+
+    def save(self):
+        with self.lock:
+            if not os.path.exists(os.path.dirname(self.cache_file)):
+                os.makedirs(os.path.dirname(self.cache_file))
+            # Written to the side and renamed, so a run that is killed half way doesn't leave half a file
+            temp_file = f'{self.cache_file}.tmp'
+            with open(temp_file, 'w') as writer:
+                json.dump({'revision': self.revision, 'months': self.months, 'reference': self.reference}, writer)
+            os.replace(temp_file, self.cache_file)
+
+
+    def get_month(self, tab):
+        with self.lock:
+            month_rows = self.months.get(tab) if self.enabled else None
+            if month_rows is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return month_rows
+
+
+    def put_month(self, tab, month_rows):
+        with self.lock:
+            if self.enabled:
+                self.months[tab] = month_rows
+                self.save()
+
+
+    def drop_month(self, tab=None):
+        """
+        Forget the month of tab (all months if tab is None), eg: because it was written since it was saved
+        """
+        with self.lock:
+            if not self.enabled:
+                return
+            if tab is None:
+                dropped = len(self.months) > 0
+                self.months = {}
+            else:
+                dropped = self.months.pop(tab, None) is not None
+            if dropped:
+                self.save()
+
+
+    def get_reference(self):
+        with self.lock:
+            return self.reference if self.enabled else None
+
+
+    def put_reference(self, reference):
+        with self.lock:
+            if self.enabled:
+                self.reference = reference
+                self.save()
+
+
+warm_caches = {}
+warm_caches_lock = threading.Lock()
+
+def get_warm_cache(config_dir, spreadsheet_id) -> WarmCache:
+    """
+    The process-wide warm cache of the spreadsheet (GCal and the master GCal share it).
+    None if there is no config_dir or config.WARM_CACHE_DIR is None
+    """
+    if config_dir is None or config.WARM_CACHE_DIR is None:
+        return None
+
+    cache_file = f'{config_dir}/{config.WARM_CACHE_DIR}/{spreadsheet_id}.json'
+    with warm_caches_lock:
+        if cache_file not in warm_caches:
+            warm_caches[cache_file] = WarmCache(cache_file)
+        return warm_caches[cache_file]
@@ -0,0 +1,165 @@
+from calendar_utils import index_to_column, parse_location
+import config
+
+"""
+Write-behind buffer for GCal.
+
+Instead of sending a values().update for every day that is written, the buffer remembers the dirty rectangles and sends
+them all with one values().batchUpdate when flush() is called (or when max_batch_size rectangles are waiting).
+
+Before sending, rectangles that sit next to each other on the same rows (eg: the days of a week) are merged into one range.
+Writing the same rectangle twice keeps only the last values.  A write that overlaps a different pending rectangle flushes
+what is pending first, so the order of the writes is kept.
+
+Usage:
+    with WriteBehindBuffer(gcal) as buffer:
+        buffer.write_day_to_calendar(target_date, formatted_rows)
+        ...
+    # Flushed here
+"""
+class WriteBehindBuffer:
+
+    def __init__(self, gcal, max_batch_size=config.WRITE_BATCH_SIZE, value_input_option="USER_ENTERED"):
+        self.gcal = gcal
+        self.max_batch_size = max_batch_size
+        self.value_input_option = value_input_option
+        self.pending = {}   # key = location, value = rows.  Insertion order is the write order
+        self.requests_sent = 0
+        self.ranges_written = 0
+        self.failed_requests = 0    # batchUpdates that came back with an error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, exception_traceback):
+        if exception_type is None:
+            self.flush()
+        else:
+            self.discard()
+        return False
+
+
+    def write_day_to_calendar(self, target_date, rows):
+        """Buffer a whole day for the calendar
+        ## Parameters
+        * target_date
+        * rows (list): formatted rows for calendar (padded to the matrix size)
+        """
+        _tab, start_row, start_col, _end_row, end_col = parse_location(self.gcal.get_location(self.gcal.calendar_tab, target_date))
+        location = self.to_location(self.gcal.calendar_tab, start_row, start_col, start_row + len(rows) - 1, end_col)
+        self.update_values(location, self.value_input_option, rows)
+
+
+    def update_values(self, range_name, value_input_option, _values):
+        """
+        Same signature as GCal.update_values, but the values are only sent on flush()
+        """
+        if value_input_option != self.value_input_option:
+            raise Exception(f'Buffer was created for: {self.value_input_option}, cannot buffer: {value_input_option}')
+
+        if range_name not in self.pending and self.overlaps_pending(range_name):
+            self.flush()
+
+        self.pending.pop(range_name, None)
+        self.pending[range_name] = _values
+
+        # Reads that come after this write should see it (the cache is written again when the batch is sent)
+        if hasattr(self.gcal, 'write_through'):
+            self.gcal.write_through(range_name, _values)
+
+        if len(self.pending) >= self.max_batch_size:
+            self.flush()
+
+
+    def flush(self):
+        """
+        Send everything that is pending with a single batchUpdate
+        """
+        if len(self.pending) == 0:
+            return None
+
+        data = self.merge_ranges(list(self.pending.items()))
+        self.pending = {}
+        self.requests_sent += 1
+        self.ranges_written += len(data)
+        result = self.gcal.batch_update_values(data, self.value_input_option)
+        if isinstance(result, Exception):
+            # GCal returns the HttpError
+            self.failed_requests += 1
+        return result
+
+
+    def discard(self):
+        """
+        Drop everything that is pending without sending it
+        """
+        if hasattr(self.gcal, 'invalidate'):
+            for location in self.pending.keys():
+                parsed = parse_location(location)
+                self.gcal.invalidate(parsed[0] if parsed is not None else None)
+        self.pending = {}
+
+
+    def overlaps_pending(self, range_name):
+        new_rect = parse_location(range_name)
+        if new_rect is None:
+            return True
+
+        for location in self.pending.keys():
+            rect = parse_location(location)
+            if rect is None or rect[0] != new_rect[0]:
+                continue
+            if rect[1] <= new_rect[3] and new_rect[1] <= rect[3] and rect[2] <= new_rect[4] and new_rect[2] <= rect[4]:
+                return True
+
+        return False
+
+
+    def merge_ranges(self, data):
+        """
+        Merge rectangles that are side by side on the same rows into a single range.
+        Only rectangles whose values fill the whole rectangle are merged (otherwise the merged values would not line up)
+
+        ## Parameters
+        * data: list of (location, rows)
+
+        ## Returns
+        list of (location, rows)
+        """
+        merged = []
+        groups = {}     # key = (tab, start_row, end_row), value = list of [start_col, end_col, rows]
+        for location, rows in data:
+            rect = parse_location(location)
+            if rect is None or rect[0] is None or not self.fills_rectangle(rect, rows):
+                merged.append((location, rows))
+                continue
+
+            tab, start_row, start_col, end_row, end_col = rect
+            groups.setdefault((tab, start_row, end_row), []).append([start_col, end_col, rows])
+
+        for (tab, start_row, end_row), rects in groups.items():
+            rects.sort(key=lambda rect: rect[0])
+            current = rects[0]
+            for rect in rects[1:]:
+                if rect[0] == current[1] + 1:
+                    current = [current[0], rect[1], [left + right for left, right in zip(current[2], rect[2])]]
+                else:
+                    merged.append((self.to_location(tab, start_row, current[0], end_row, current[1]), current[2]))
+                    current = rect
+            merged.append((self.to_location(tab, start_row, current[0], end_row, current[1]), current[2]))
+
+        return merged
+
+
+    def fills_rectangle(self, rect, rows):
+        _tab, start_row, start_col, end_row, end_col = rect
+        if len(rows) != end_row - start_row + 1:
+            return False
+        for row in rows:
+            if len(row) != end_col - start_col + 1:
+                return False
+        return True
+
+
+    def to_location(self, tab, start_row, start_col, end_row, end_col):
+        return f'{tab}!{index_to_column(start_col)}{start_row}:{index_to_column(end_col)}{end_row}'